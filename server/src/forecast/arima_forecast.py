@@ -1,28 +1,27 @@
 import numpy as np
 import pandas as pd
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from statsmodels.tsa.stattools import adfuller, acf, pacf
-from statsmodels.tsa.seasonal import seasonal_decompose
-from sklearn.metrics import mean_absolute_error, mean_squared_error
+from model_cache import get_model_cache, fitted_record
+from order_selection import difference_series, select_order
+from inventory_policy import policy_levels
+from calendar_series import as_calendar
 import warnings
 warnings.filterwarnings('ignore')
 
 def check_stationarity(data):
     """Check if the time series is stationary using Augmented Dickey-Fuller test"""
+    # statsmodels takes over a second to import; load it only when a model is needed
+    from statsmodels.tsa.stattools import adfuller
     result = adfuller(data)
     return result[1] < 0.05  # p-value < 0.05 indicates stationarity
 
 def make_stationary(data):
     """Transform non-stationary data to stationary using differencing"""
-    diff_data = data
-    d = 0
-    while not check_stationarity(diff_data) and d < 2:
-        diff_data = np.diff(diff_data)
-        d += 1
-    return diff_data, d
+    # Shared with the order search so the ADF tests run once per series
+    return difference_series(data, max_d=2)
 
 def determine_acf_pacf_order(data, max_lag=20):
     """Determine p and q orders using ACF and PACF"""
+    from statsmodels.tsa.stattools import acf, pacf
     acf_vals = acf(data, nlags=max_lag)
     pacf_vals = pacf(data, nlags=max_lag)
     
@@ -32,74 +31,74 @@ def determine_acf_pacf_order(data, max_lag=20):
     
     return min(p, 5), min(q, 5)  # Cap at 5 to avoid overfitting
 
-def find_optimal_order(data, max_p=5, max_d=2, max_q=5):
+def find_optimal_order(data, max_p=5, max_d=2, max_q=5, product_id=None):
     """Find optimal ARIMA order using AIC"""
-    best_aic = float('inf')
-    best_order = None
-    
+    # Unchanged series for this product reuse the previously selected order
+    cache = get_model_cache()
+    cache_key = cache.key('arima-order', product_id, data, max_p=max_p, max_d=max_d, max_q=max_q)
+    cached = cache.get(cache_key)
+    if cached:
+        return tuple(cached['order'])
+
     # Make data stationary
     stationary_data, d = make_stationary(data)
     
     # Get initial p, q estimates from ACF/PACF
     p, q = determine_acf_pacf_order(stationary_data)
     
-    # Search around the initial estimates
-    for p_val in range(max(0, p-1), min(p+2, max_p + 1)):
-        for q_val in range(max(0, q-1), min(q+2, max_q + 1)):
-            try:
-                model = SARIMAX(data, order=(p_val, d, q_val),
-                              enforce_stationarity=True,
-                              enforce_invertibility=True)
-                results = model.fit(disp=False, maxiter=50)
-                if results.aic < best_aic:
-                    best_aic = results.aic
-                    best_order = (p_val, d, q_val)
-            except:
-                continue
-    
-    return best_order or (1, d, 1)  # Fallback to simple model if optimization fails
+    # Search around the initial estimates, fitting candidates in parallel
+    candidates = [(p_val, d, q_val)
+                  for p_val in range(max(0, p-1), min(p+2, max_p + 1))
+                  for q_val in range(max(0, q-1), min(q+2, max_q + 1))]
+    search = select_order(data, candidates,
+                          model_kwargs={'enforce_stationarity': True, 'enforce_invertibility': True},
+                          fit_kwargs={'maxiter': 50})
+    best = search['best']
+    
+    if best and not search['timed_out']:
+        cache.put(cache_key, best)
+    return tuple(best['order']) if best else (1, d, 1)  # Fallback to simple model if optimization fails
 
 def calculate_inventory_metrics(forecast, historical_data):
     """Calculate inventory optimization metrics"""
-    mean_demand = np.mean(historical_data)
-    std_demand = np.std(historical_data)
-    
-    # Safety stock calculation (95% service level)
-    safety_stock = 1.645 * std_demand
-    
-    # Reorder point calculation (7 days lead time)
-    lead_time = 7
-    reorder_point = (mean_demand * lead_time) + safety_stock
-    
-    # Economic Order Quantity calculation
-    annual_demand = mean_demand * 365
-    ordering_cost = 50  # Example fixed cost per order
-    holding_cost = 0.2  # 20% of item cost per year
-    eoq = np.sqrt((2 * annual_demand * ordering_cost) / holding_cost)
-    
-    return {
-        'mean_demand': mean_demand,
-        'std_demand': std_demand,
-        'safety_stock': safety_stock,
-        'reorder_point': reorder_point,
-        'economic_order_quantity': eoq
-    }
+    # Same policy as stock optimization: 95% service level over a 7-day lead time
+    return policy_levels(historical_data)
 
-def forecast_demand(historical_data, forecast_period=30):
-    """Generate demand forecast using ARIMA"""
+def forecast_demand(historical_data, forecast_period=30, product_id=None, timezone=None):
+    """Generate demand forecast using ARIMA
+
+    historical_data is either one value per day or dated sales, which are put
+    on the daily calendar first (days without sales count as 0).
+    """
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    calendar = as_calendar(historical_data, timezone)
     # Convert to numpy array and ensure positive values
-    data = np.array(historical_data)
+    data = calendar.values if calendar is not None else np.array(historical_data)
     data = np.maximum(data, 0)
     
-    # Find optimal order
-    order = find_optimal_order(data)
-    print(f"Best ARIMA order: {order}")
-    
-    # Fit ARIMA model with constraints
-    model = SARIMAX(data, order=order,
-                   enforce_stationarity=True,
-                   enforce_invertibility=True)
-    results = model.fit(disp=False, maxiter=50)
+    cache = get_model_cache()
+    cache_key = cache.key('arima-forecast', product_id, data)
+    cached = cache.get(cache_key)
+    
+    if cached:
+        # Same series as a previous call: run the filter with the stored parameters, no fit
+        order = tuple(cached['order'])
+        print(f"Cached ARIMA order: {order}")
+        model = SARIMAX(data, order=order,
+                       enforce_stationarity=True,
+                       enforce_invertibility=True)
+        results = model.filter(np.asarray(cached['params']))
+    else:
+        # Find optimal order
+        order = find_optimal_order(data, product_id=product_id)
+        print(f"Best ARIMA order: {order}")
+        
+        # Fit ARIMA model with constraints
+        model = SARIMAX(data, order=order,
+                       enforce_stationarity=True,
+                       enforce_invertibility=True)
+        results = model.fit(disp=False, maxiter=50)
+        cache.put(cache_key, fitted_record(results, order))
     
     # Generate forecast
     forecast = results.forecast(steps=forecast_period)
@@ -110,15 +109,19 @@ def forecast_demand(historical_data, forecast_period=30):
     # Calculate model diagnostics
     predictions = results.predict(start=0, end=len(data)-1)
     predictions = np.maximum(predictions, 0)
-    mae = mean_absolute_error(data, predictions)
-    rmse = np.sqrt(mean_squared_error(data, predictions))
+    errors = data - predictions
+    mae = np.mean(np.abs(errors))
+    rmse = np.sqrt(np.mean(errors ** 2))
     
     # Calculate inventory metrics
     metrics = calculate_inventory_metrics(forecast, data)
     
     # Prepare forecast dates
-    last_date = pd.Timestamp.now()
-    forecast_dates = pd.date_range(start=last_date, periods=forecast_period, freq='D')
+    if calendar is not None:
+        forecast_dates = pd.DatetimeIndex(calendar.future_dates(forecast_period))
+    else:
+        # Plain values carry no dates; the forecast starts today
+        forecast_dates = pd.date_range(start=pd.Timestamp.now(), periods=forecast_period, freq='D')
     
     # Print forecast results
     print("\nForecast for next 30 days:")
@@ -0,0 +1,298 @@
+"""Rolling-origin backtests of the forecasting paths.
+
+Each series is cut at several forecast origins, step days apart, with the
+last one horizon days before the end. At every origin a model sees only the
+history before it (expanding window, or the last window_size days with
+window='rolling') and forecasts the next horizon days, which are then scored
+against the actual sales:
+
+    arima           SARIMAX; the order is searched and the parameters fitted
+                    once, at the first origin. Later folds extend the fitted
+                    filter with the new days (results.extend), or with
+                    window='rolling' rerun it over their own window
+                    (results.apply), so no fold refits, and no fold sees
+                    parameters estimated on its own test days
+    moving_average  last 7-day mean, for every origin at once from a cumsum
+    croston         Croston/SBA rate for intermittent demand
+    prophet         refitted per fold, warm-started from the previous fold
+
+Out-of-sample accuracy per model:
+
+    mape  mean absolute percentage error over days with nonzero sales
+    mase  MAE over the in-sample MAE of the seasonal naive forecast
+          (same weekday last week), averaged over the folds
+    mae, rmse
+
+backtest_catalogue() runs every (SKU, model) pair as its own task in a
+process pool after a single sales aggregation; stream_backtest() writes each
+SKU's scores as soon as all of its models have finished.
+"""
+import os
+import sys
+from diagnostics import profile_imports_if_requested
+# Before the other imports, so --import-profile covers them
+profile_imports_if_requested(sys.argv)
+
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from croston import croston_forecast
+from diagnostics import get_logger, stage
+from mongo_connection import get_database
+from sales_series import DailySales, daily_matrix, fetch_daily_sales_by_product, parse_product_ids
+
+log = get_logger('backtest')
+
+MODELS = ('arima', 'moving_average', 'croston', 'prophet')
+DEFAULT_MODELS = ('arima', 'moving_average')
+DEFAULT_HORIZON = 14
+DEFAULT_FOLDS = 5
+WINDOWS = ('expanding', 'rolling')
+MOVING_AVERAGE_DAYS = 7
+SEASON_DAYS = 7
+MIN_TRAIN_DAYS = 30
+ARIMA_MAXITER = 50
+
+
+def fold_origins(n_days: int, horizon: int, folds: int, step: Optional[int] = None,
+                 min_train: int = MIN_TRAIN_DAYS) -> np.ndarray:
+    """Forecast origins (indices of the first test day), oldest first; origins without min_train days are dropped."""
+    step = step or horizon
+    origins = n_days - horizon - step * np.arange(folds - 1, -1, -1)
+    return origins[origins >= min_train]
+
+
+def _train_start(origin: int, window: str, window_size: Optional[int]) -> int:
+    return max(origin - window_size, 0) if window == 'rolling' and window_size else 0
+
+
+def arima_folds(values: np.ndarray, origins: np.ndarray, horizon: int, window: str = 'expanding',
+                window_size: Optional[int] = None, product_id: Optional[str] = None, **_: Any) -> np.ndarray:
+    """folds x horizon forecasts, fitting once and filtering each later fold with the same parameters.
+
+    Expanding windows extend the filter state across folds; rolling windows
+    rerun the filter over each fold's own last window_size days.
+    """
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    from stock_optimization import find_best_arima_order
+
+    first = int(origins[0])
+    train = values[_train_start(first, window, window_size):first]
+    order = find_best_arima_order(train, product_id=product_id)
+    results = SARIMAX(train, order=order).fit(disp=False, maxiter=ARIMA_MAXITER)
+
+    forecasts = np.empty((len(origins), horizon))
+    previous = first
+    for fold, origin in enumerate(origins):
+        if origin > previous:
+            if window == 'rolling':
+                # Same parameters, filter state from this fold's window only
+                results = results.apply(values[_train_start(int(origin), window, window_size):origin])
+            else:
+                # Same parameters, state carried over from the previous origin
+                results = results.extend(values[previous:origin])
+            previous = int(origin)
+        forecasts[fold] = results.forecast(horizon)
+    return forecasts
+
+
+def moving_average_folds(values: np.ndarray, origins: np.ndarray, horizon: int, **_: Any) -> np.ndarray:
+    """Flat forecast at the mean of the MOVING_AVERAGE_DAYS days before each origin."""
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    days = np.minimum(origins, MOVING_AVERAGE_DAYS)
+    means = (cumulative[origins] - cumulative[origins - days]) / days
+    return np.repeat(means[:, None], horizon, axis=1)
+
+
+def croston_folds(values: np.ndarray, origins: np.ndarray, horizon: int, window: str = 'expanding',
+                  window_size: Optional[int] = None, **_: Any) -> np.ndarray:
+    """Croston/SBA rate of the history before each origin."""
+    return np.vstack([croston_forecast(values[_train_start(int(origin), window, window_size):origin], horizon)
+                      for origin in origins])
+
+
+def prophet_folds(values: np.ndarray, origins: np.ndarray, horizon: int, window: str = 'expanding',
+                  window_size: Optional[int] = None, dates: Optional[np.ndarray] = None, **_: Any) -> np.ndarray:
+    """Prophet refitted at each origin, warm-started from the previous fold's model."""
+    import pandas as pd
+    from prophet_models import fit_from
+
+    index = pd.DatetimeIndex(dates)
+    forecasts = np.empty((len(origins), horizon))
+    model = None
+    for fold, origin in enumerate(origins):
+        start = _train_start(int(origin), window, window_size)
+        frame = pd.DataFrame({'ds': index[start:origin], 'y': values[start:origin]})
+        model, _ = fit_from(frame, model)
+        future = pd.DataFrame({'ds': index[origin:origin + horizon]})
+        forecasts[fold] = model.predict(future)['yhat'].to_numpy()
+    return forecasts
+
+
+FOLD_FORECASTERS = {
+    'arima': arima_folds,
+    'moving_average': moving_average_folds,
+    'croston': croston_folds,
+    'prophet': prophet_folds,
+}
+
+
+def naive_scale(values: np.ndarray, season: int = SEASON_DAYS) -> float:
+    """In-sample MAE of the seasonal naive forecast, the MASE denominator."""
+    if len(values) <= season:
+        season = 1
+    errors = np.abs(values[season:] - values[:-season])
+    return float(errors.mean()) if len(errors) else 0.0
+
+
+def accuracy(values: np.ndarray, origins: np.ndarray, forecasts: np.ndarray, window: str = 'expanding',
+             window_size: Optional[int] = None) -> Dict[str, Optional[float]]:
+    """MAPE, MASE, MAE and RMSE of folds x horizon forecasts against the actual values."""
+    horizon = forecasts.shape[1]
+    actual = values[origins[:, None] + np.arange(horizon)]
+    errors = np.maximum(forecasts, 0) - actual
+
+    nonzero = actual != 0
+    mape = float(np.mean(np.abs(errors[nonzero] / actual[nonzero])) * 100) if nonzero.any() else None
+    scales = np.array([naive_scale(values[_train_start(int(origin), window, window_size):origin]) for origin in origins])
+    fold_mae = np.abs(errors).mean(axis=1)
+    scored = scales > 0
+    mase = float(np.mean(fold_mae[scored] / scales[scored])) if scored.any() else None
+    return {
+        'mape': mape,
+        'mase': mase,
+        'mae': float(np.abs(errors).mean()),
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+    }
+
+
+def backtest_model(product_id: Optional[str], model: str, dates: np.ndarray, values: np.ndarray,
+                   horizon: int = DEFAULT_HORIZON, folds: int = DEFAULT_FOLDS, step: Optional[int] = None,
+                   window: str = 'expanding', window_size: Optional[int] = None) -> Dict[str, Any]:
+    """Score one model on one series; runs inside the process pool."""
+    started = time.monotonic()
+    try:
+        if model not in FOLD_FORECASTERS:
+            raise ValueError(f"Unknown model '{model}', expected one of {', '.join(MODELS)}")
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown window '{window}', expected one of {', '.join(WINDOWS)}")
+        origins = fold_origins(len(values), horizon, folds, step)
+        if not len(origins):
+            raise ValueError(f"Not enough history to backtest. At least {MIN_TRAIN_DAYS + horizon} days required.")
+
+        forecasts = FOLD_FORECASTERS[model](values, origins, horizon, window=window, window_size=window_size,
+                                            product_id=product_id, dates=dates)
+        scores = accuracy(values, origins, forecasts, window, window_size)
+        scores['folds'] = len(origins)
+    except Exception as e:
+        log.warning("Backtest of %s for %s failed: %s", model, product_id, e)
+        scores = {'error': str(e)}
+    scores['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+    return {'product_id': product_id, 'model': model, **scores}
+
+
+def best_model(scores: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    """Model with the lowest MASE (MAE when no MASE could be computed)."""
+    ranked = [(score.get('mase') if score.get('mase') is not None else float('inf'), score['mae'], model)
+              for model, score in scores.items() if 'error' not in score]
+    return min(ranked)[2] if ranked else None
+
+
+def _series(sales: DailySales, history_days: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    dates, matrix = daily_matrix({'sku': sales}, ['sku'], history_days)
+    return dates, matrix[0]
+
+
+def backtest_products(product_ids: Union[str, Sequence[str]] = 'all', models: Sequence[str] = DEFAULT_MODELS,
+                      max_workers: Optional[int] = None, history_days: Optional[int] = None,
+                      **options: Any) -> Iterator[Dict[str, Any]]:
+    """Out-of-sample accuracy per model and best model of each product, yielded as soon as all its models finish.
+
+    options (horizon, folds, step, window, window_size) go to backtest_model.
+    Days without sales count as zero demand. Requested IDs that are not
+    valid ObjectIds are yielded first, with an error.
+    """
+    unknown = [model for model in models if model not in FOLD_FORECASTERS]
+    if unknown:
+        raise ValueError(f"Unknown models {unknown}, expected {', '.join(MODELS)}")
+    object_ids, invalid = parse_product_ids(product_ids)
+    for product_id in invalid:
+        yield {'product_id': product_id, 'error': f"Invalid product ID format: {product_id}"}
+    with stage('fetch'):
+        sales_by_product = fetch_daily_sales_by_product(get_database()['sales'], object_ids)
+    if object_ids is not None:
+        for product_id in object_ids:
+            sales_by_product.setdefault(str(product_id), DailySales.empty())
+
+    series = {product_id: _series(sales, history_days) for product_id, sales in sales_by_product.items()}
+    tasks = [(product_id, model, *series[product_id]) for product_id in sorted(series) for model in models]
+    remaining = {product_id: len(models) for product_id in series}
+    by_product: Dict[str, Dict[str, Any]] = {}
+
+    def collect(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        product_id = result.pop('product_id')
+        by_product.setdefault(product_id, {})[result.pop('model')] = result
+        remaining[product_id] -= 1
+        if remaining[product_id]:
+            return None
+        scores = by_product.pop(product_id)
+        return {'product_id': product_id, 'days': len(series[product_id][1]), 'models': scores,
+                'best': best_model(scores)}
+
+    workers = max_workers or os.cpu_count() or 1
+    with stage('backtest'):
+        if workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                product = collect(backtest_model(*task, **options))
+                if product is not None:
+                    yield product
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(backtest_model, *task, **options) for task in tasks]
+            for future in as_completed(futures):
+                product = collect(future.result())
+                if product is not None:
+                    yield product
+
+
+def backtest_catalogue(product_ids: Union[str, Sequence[str]] = 'all', models: Sequence[str] = DEFAULT_MODELS,
+                       max_workers: Optional[int] = None, history_days: Optional[int] = None,
+                       **options: Any) -> List[Dict[str, Any]]:
+    """Out-of-sample accuracy per product and model, plus each product's best model."""
+    return list(backtest_products(product_ids, models, max_workers, history_days, **options))
+
+
+def stream_backtest(writer: Any, product_ids: Union[str, Sequence[str]] = 'all',
+                    models: Sequence[str] = DEFAULT_MODELS, max_workers: Optional[int] = None,
+                    history_days: Optional[int] = None, **options: Any) -> None:
+    """A 'product' section per product as soon as all its models finish, or an error record."""
+    counts = {'products': 0, 'failed': 0}
+    for product in backtest_products(product_ids, models, max_workers, history_days, **options):
+        if 'error' in product:
+            counts['failed'] += 1
+            writer.error(product['error'], product_id=product['product_id'])
+            continue
+        counts['products'] += 1
+        writer.section('product', product)
+    writer.end(**counts)
+
+
+if __name__ == "__main__":
+    import json
+    from ndjson import dumps, strip_flags
+
+    # backtest [all | id1,id2,...] [model,model,...]
+    args = strip_flags(sys.argv[1:])
+    try:
+        target = args[0] if args else 'all'
+        models = args[1].split(',') if len(args) > 1 else DEFAULT_MODELS
+        product_ids = 'all' if target == 'all' else [p for p in target.split(',') if p]
+        for product_result in backtest_catalogue(product_ids, models):
+            print(dumps(product_result), flush=True)
+    except Exception as e:
+        print(json.dumps({"error": f"Error in backtest: {str(e)}\n{traceback.format_exc()}"}))
+        sys.exit(1)
@@ -0,0 +1,276 @@
+"""Benchmarks for the forecasting and anomaly pipelines.
+
+Builds synthetic series with test_arima.generate_test_data and times each
+pipeline over a grid of series lengths, SKU counts and noise levels:
+
+    forecast_demand    arima_forecast.forecast_demand
+    run_arima_forecast stock_optimization.run_arima_forecast
+    analyze_patterns   stock_optimization.analyze_sales_patterns
+    anomaly            ARIMAAnomalyDetector.detect_anomalies
+    prophet            forecast.fit_prophet_forecast
+
+Each case runs in a fresh interpreter, so its peak RSS is not inflated by
+earlier cases. Model caches are disabled unless --with-cache is given.
+Results hold wall time, per-fit median, fits per second and peak RSS. They
+are written as JSON and can be compared against a stored baseline:
+
+    python benchmark.py --quick --save benchmarks/baseline.json
+    python benchmark.py --quick --compare benchmarks/baseline.json
+
+--compare exits with status 1 when a case is slower (or uses more memory)
+than the baseline by more than --threshold (default 20%).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import itertools
+import subprocess
+import contextlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+FORECAST_DIR = os.path.dirname(os.path.abspath(__file__))
+ANOMALY_DIR = os.path.join(FORECAST_DIR, '..', 'modules', 'anomaly')
+
+TARGETS = ('forecast_demand', 'run_arima_forecast', 'analyze_patterns', 'anomaly', 'prophet')
+DEFAULT_LENGTHS = (90, 365, 1095, 3650)
+DEFAULT_SKUS = (1, 10)
+DEFAULT_NOISE = (0.05, 0.2)
+QUICK_GRID = {'lengths': (90, 365), 'skus': (1,), 'noise': (0.1,)}
+END_DATE = np.datetime64('2024-12-31')
+
+
+def synthetic_series(n_days: int, skus: int, noise_level: float, seed: int) -> List[np.ndarray]:
+    """One reproducible demand series per SKU, cycling through the test_arima trends."""
+    from test_arima import generate_test_data
+
+    trends = ('increasing', 'decreasing', 'stable')
+    series = []
+    for sku in range(skus):
+        # generate_test_data draws from the global NumPy generator
+        np.random.seed(seed + sku)
+        series.append(generate_test_data(n_days, trend=trends[sku % len(trends)], noise_level=noise_level))
+    return series
+
+
+def _daily_sales(values: np.ndarray):
+    from sales_series import DailySales
+    dates = np.arange(END_DATE - len(values) + 1, END_DATE + 1)
+    return DailySales(dates, np.asarray(values, dtype=np.float64), len(values))
+
+
+def _build_target(name: str) -> Callable[[np.ndarray], Any]:
+    """Import the pipeline up front so import time stays out of the measurements."""
+    # The pipelines load statsmodels and prophet lazily; load them here instead of in the first fit
+    import statsmodels.tsa.statespace.sarimax  # noqa: F401
+    import statsmodels.tsa.arima.model  # noqa: F401
+    if name == 'prophet':
+        import prophet  # noqa: F401
+    if name == 'forecast_demand':
+        from arima_forecast import forecast_demand
+        return lambda values: forecast_demand(values)
+    if name == 'run_arima_forecast':
+        from stock_optimization import run_arima_forecast
+        return lambda values: run_arima_forecast(_daily_sales(values))
+    if name == 'analyze_patterns':
+        from stock_optimization import analyze_sales_patterns
+        return lambda values: analyze_sales_patterns(_daily_sales(values))
+    if name == 'anomaly':
+        sys.path.insert(0, ANOMALY_DIR)
+        from arima_anomaly_detector import ARIMAAnomalyDetector
+
+        def detect(values):
+            records = _daily_sales(values).to_frame()
+            records['date'] = records['date'].dt.strftime('%Y-%m-%d')
+            return ARIMAAnomalyDetector().detect_anomalies(records.to_dict(orient='records'))
+        return detect
+    if name == 'prophet':
+        from forecast import fit_prophet_forecast, sales_to_frame
+        return lambda values: fit_prophet_forecast(sales_to_frame(_daily_sales(values)))
+    raise ValueError(f"Unknown benchmark target: {name}")
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / scale, 1)
+
+
+def run_case(target: str, n_days: int, skus: int, noise_level: float, repeats: int, seed: int) -> Dict[str, Any]:
+    """Time one grid cell in this process."""
+    run = _build_target(target)
+    series = synthetic_series(n_days, skus, noise_level, seed)
+
+    durations = []
+    errors = 0
+    started = time.perf_counter()
+    # The pipelines print progress; keep it out of the JSON written to stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        for _ in range(repeats):
+            for values in series:
+                fit_started = time.perf_counter()
+                result = run(values)
+                durations.append(time.perf_counter() - fit_started)
+                if isinstance(result, dict) and 'error' in result:
+                    errors += 1
+    wall = time.perf_counter() - started
+
+    return {
+        'target': target,
+        'n_days': n_days,
+        'skus': skus,
+        'noise_level': noise_level,
+        'repeats': repeats,
+        'wall_s': round(wall, 4),
+        'median_fit_s': round(float(np.median(durations)), 4),
+        'fits_per_s': round(len(durations) / wall, 3) if wall > 0 else None,
+        'peak_rss_mb': _peak_rss_mb(),
+        'errors': errors,
+    }
+
+
+def case_id(case: Dict[str, Any]) -> str:
+    return f"{case['target']}|days={case['n_days']}|skus={case['skus']}|noise={case['noise_level']}"
+
+
+def _run_isolated(target: str, n_days: int, skus: int, noise_level: float, repeats: int, seed: int,
+                  with_cache: bool, timeout: float) -> Dict[str, Any]:
+    env = dict(os.environ)
+    if not with_cache:
+        env['MODEL_CACHE_DISABLED'] = '1'
+    command = [sys.executable, os.path.abspath(__file__), '--run-case',
+               json.dumps([target, n_days, skus, noise_level, repeats, seed])]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, env=env, timeout=timeout, cwd=FORECAST_DIR)
+    except subprocess.TimeoutExpired:
+        return {'target': target, 'n_days': n_days, 'skus': skus, 'noise_level': noise_level,
+                'error': f"timed out after {timeout}s"}
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        tail = completed.stderr.strip().splitlines()[-1:] or ['no output']
+        return {'target': target, 'n_days': n_days, 'skus': skus, 'noise_level': noise_level,
+                'error': f"exit {completed.returncode}: {tail[0]}"}
+    return json.loads(lines[-1])
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=FORECAST_DIR, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    import pandas
+    import statsmodels
+    return {
+        'commit': _git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pandas.__version__,
+        'statsmodels': statsmodels.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_suite(targets, lengths, skus, noise, repeats: int = 1, seed: int = 42, with_cache: bool = False,
+              timeout: float = 1800) -> Dict[str, Any]:
+    cases = []
+    for target, n_days, sku_count, noise_level in itertools.product(targets, lengths, skus, noise):
+        case = _run_isolated(target, n_days, sku_count, noise_level, repeats, seed, with_cache, timeout)
+        cases.append(case)
+        print(format_case(case), file=sys.stderr, flush=True)
+    return {'environment': environment(), 'settings': {'repeats': repeats, 'seed': seed, 'with_cache': with_cache},
+            'cases': {case_id(case): case for case in cases}}
+
+
+def format_case(case: Dict[str, Any]) -> str:
+    label = case_id(case)
+    if 'error' in case:
+        return f"{label:<55} ERROR {case['error']}"
+    return (f"{label:<55} wall {case['wall_s']:>9.3f}s  median {case['median_fit_s']:>8.3f}s  "
+            f"{case['fits_per_s']:>8.2f} fits/s  rss {case['peak_rss_mb']:>7.1f} MB")
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Human-readable regressions of current against baseline (wall time and peak RSS)."""
+    regressions = []
+    for key, case in current['cases'].items():
+        previous = baseline.get('cases', {}).get(key)
+        if previous is None or 'error' in case or 'error' in previous:
+            continue
+        for metric in ('wall_s', 'peak_rss_mb'):
+            before, after = previous[metric], case[metric]
+            if before and after > before * (1 + threshold):
+                regressions.append(f"{key}: {metric} {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def _csv(value: str, cast: Callable[[str], Any]) -> List[Any]:
+    return [cast(part) for part in value.split(',') if part]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--targets', type=lambda v: _csv(v, str), default=list(TARGETS))
+    parser.add_argument('--lengths', type=lambda v: _csv(v, int), default=None, help='series lengths in days')
+    parser.add_argument('--skus', type=lambda v: _csv(v, int), default=None, help='series per case')
+    parser.add_argument('--noise', type=lambda v: _csv(v, float), default=None, help='noise levels')
+    parser.add_argument('--quick', action='store_true', help='small grid for a fast check')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--with-cache', action='store_true', help='leave the model caches enabled')
+    parser.add_argument('--timeout', type=float, default=1800, help='seconds allowed per case')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown before a case regresses')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case(*json.loads(args.run_case))))
+        return 0
+
+    unknown = [target for target in args.targets if target not in TARGETS]
+    if unknown:
+        parser.error(f"unknown targets {unknown}; choose from {', '.join(TARGETS)}")
+
+    grid = QUICK_GRID if args.quick else {'lengths': DEFAULT_LENGTHS, 'skus': DEFAULT_SKUS, 'noise': DEFAULT_NOISE}
+    results = run_suite(args.targets, args.lengths or grid['lengths'], args.skus or grid['skus'],
+                        args.noise or grid['noise'], args.repeats, args.seed, args.with_cache, args.timeout)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print(f"Compared with {args.compare} (commit {baseline.get('environment', {}).get('commit')})", file=sys.stderr)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions", file=sys.stderr)
+
+    if not args.save:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""Gap-aware calendar series shared by the models.
+
+Raw sales (timestamps or day strings with quantities), daily totals from the
+sales aggregation (DailySales) and packed sales columns are all summed into
+one contiguous float64 array. The array has a bucket for every day, or every
+Monday-based week, from the first sale to the last. Days without sales are 0
+instead of missing, so ARIMA, Prophet and the anomaly detector see the real
+spacing of the data.
+
+Timestamps with a UTC offset are assigned to calendar days in the given
+timezone (SALES_TIMEZONE, UTC unless set, by default); naive dates are taken as calendar days already.
+Both conversions are vectorized through pandas. DailySales and packed
+columns arrive already bucketed into SALES_TIMEZONE days, so asking for a
+different timezone for them is an error rather than silently ignored.
+
+A CalendarSeries grows in place. append() writes new days into spare
+capacity and re-totals the last bucket, which may still be collecting
+sales. The long-lived worker keeps one per product in the calendar cache:
+a request whose days up to the cached series' end still match it exactly
+only appends the days after it; any revision rebuilds the series.
+"""
+import os
+import warnings
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+from sales_columns import SalesColumns
+from sales_series import SALES_TIMEZONE, DailySales
+
+# Days per bucket
+FREQUENCIES = {'D': 1, 'W': 7}
+PANDAS_FREQUENCIES = {'D': 'D', 'W': 'W-MON'}
+# 1970-01-01 was a Thursday; shifting by 3 days makes week buckets start on Monday
+WEEK_OFFSET = 3
+CACHE_SIZE = int(os.getenv('CALENDAR_CACHE_SIZE', 1000))
+
+
+def to_epoch_days(dates: Any, timezone: Optional[str] = None) -> np.ndarray:
+    """Calendar day numbers (days since 1970-01-01) for datetime-like values."""
+    array = np.asarray(dates)
+    if array.dtype.kind == 'M':
+        return array.astype('datetime64[D]').astype(np.int64)
+    try:
+        with warnings.catch_warnings():
+            # pandas only warns about mixed UTC offsets (and returns objects); treat it like a parse failure
+            warnings.simplefilter('error', FutureWarning)
+            parsed = pd.DatetimeIndex(pd.to_datetime(array))
+    except (ValueError, FutureWarning):
+        # Mixed formats or UTC offsets only parse element by element, as UTC
+        parsed = pd.DatetimeIndex(pd.to_datetime(array, utc=True, format='mixed'))
+    if parsed.tz is not None:
+        parsed = parsed.tz_convert(timezone or SALES_TIMEZONE).tz_localize(None)
+    return parsed.values.astype('datetime64[D]').astype(np.int64)
+
+
+def check_bucketed(timezone: Optional[str]) -> None:
+    """Daily totals and packed columns cannot be moved to another timezone's days."""
+    if timezone is not None and timezone != SALES_TIMEZONE:
+        raise ValueError(f"Sales are already bucketed into {SALES_TIMEZONE} days; timezone '{timezone}' "
+                         f"only applies to dated sale records (set SALES_TIMEZONE to change the buckets)")
+
+
+def bucket_start(days: np.ndarray, freq: str = 'D') -> np.ndarray:
+    """First day of the bucket each day falls in."""
+    if freq == 'W':
+        return (days + WEEK_OFFSET) // 7 * 7 - WEEK_OFFSET
+    return days
+
+
+class CalendarSeries:
+    """Contiguous demand per day (or week) from start, with zeros for buckets without sales."""
+
+    __slots__ = ('start', 'freq', 'records', '_buffer', '_length')
+
+    def __init__(self, start: int, values: np.ndarray, freq: str = 'D', records: Optional[int] = None):
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency '{freq}', expected one of {', '.join(FREQUENCIES)}")
+        # Epoch day of the first bucket (a Monday for weekly series)
+        self.start = int(start)
+        self.freq = freq
+        self._buffer = np.ascontiguousarray(values, dtype=np.float64)
+        self._length = len(self._buffer)
+        # Number of raw sales behind the totals
+        self.records = self._length if records is None else records
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def step(self) -> int:
+        return FREQUENCIES[self.freq]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._buffer[:self._length]
+
+    @property
+    def end(self) -> int:
+        """Epoch day of the last bucket."""
+        return self.start + (self._length - 1) * self.step
+
+    @property
+    def dates(self) -> np.ndarray:
+        return (self.start + np.arange(self._length) * self.step).astype('datetime64[D]')
+
+    def future_dates(self, periods: int) -> np.ndarray:
+        """Bucket dates for the periods after the last one."""
+        return (self.end + np.arange(1, periods + 1) * self.step).astype('datetime64[D]')
+
+    def index(self) -> pd.DatetimeIndex:
+        return pd.date_range(pd.Timestamp(self.start, unit='D'), periods=self._length,
+                             freq=PANDAS_FREQUENCIES[self.freq], name='date')
+
+    def to_series(self) -> pd.Series:
+        return pd.Series(self.values, index=self.index(), name='quantity', copy=False)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({'date': self.index(), 'quantity': self.values})
+
+    @classmethod
+    def from_days(cls, days: np.ndarray, quantities: Any, freq: str = 'D',
+                  records: Optional[int] = None) -> 'CalendarSeries':
+        """Sum quantities per bucket from epoch days in any order; repeated days add up."""
+        days = bucket_start(np.asarray(days, dtype=np.int64), freq)
+        quantities = np.asarray(quantities, dtype=np.float64)
+        records = len(days) if records is None else records
+        if not len(days):
+            return cls(0, np.zeros(0), freq, records)
+        step = FREQUENCIES[freq]
+        # Sorted, one row per bucket and no gaps (e.g. the demo CSV): the quantities already are the calendar
+        if len(days) == 1 or np.all(np.diff(days) == step):
+            return cls(days[0], quantities, freq, records)
+        start = int(days.min())
+        values = np.bincount((days - start) // step, weights=quantities)
+        return cls(start, values, freq, records)
+
+    @classmethod
+    def from_sales(cls, data: Any, freq: str = 'D', timezone: Optional[str] = None) -> 'CalendarSeries':
+        """Calendar from DailySales, SalesColumns, a date/quantity frame or a list of sale dicts."""
+        if isinstance(data, CalendarSeries):
+            return data if data.freq == freq else data.resample(freq)
+        if isinstance(data, DailySales):
+            check_bucketed(timezone)
+            return cls.from_days(data.dates.astype(np.int64), data.quantities, freq, data.records)
+        if isinstance(data, SalesColumns):
+            check_bucketed(timezone)
+            return cls.from_days(data.days, data.quantity, freq)
+        frame = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data, columns=['date', 'quantity'])
+        return cls.from_days(to_epoch_days(frame['date'].to_numpy(), timezone),
+                             frame['quantity'].to_numpy(dtype=np.float64), freq)
+
+    def resample(self, freq: str) -> 'CalendarSeries':
+        """Daily series summed into weeks (or returned as is)."""
+        if freq == self.freq:
+            return self
+        if self.freq != 'D':
+            raise ValueError("Only daily series can be resampled")
+        return CalendarSeries.from_days(self.start + np.arange(self._length), self.values, freq, self.records)
+
+    def append(self, days: np.ndarray, quantities: Any, records: int = 0) -> None:
+        """Extend the series in place with sales from the last bucket on.
+
+        The input holds complete totals for the buckets it covers: the last
+        bucket is replaced (it may have been incomplete) and later buckets
+        are added, with zeros for any gap. Days before the last bucket raise
+        ValueError; revised history needs a new series.
+        """
+        days = bucket_start(np.asarray(days, dtype=np.int64), self.freq)
+        if not len(days):
+            return
+        if not self._length:
+            fresh = CalendarSeries.from_days(days, quantities, self.freq, records)
+            self.start, self._buffer, self._length = fresh.start, fresh._buffer, fresh._length
+            self.records = records
+            return
+        last = self.end
+        if days.min() < last:
+            raise ValueError("Cannot append sales before the last bucket of the series")
+        offsets = (days - last) // self.step
+        totals = np.bincount(offsets, weights=np.asarray(quantities, dtype=np.float64))
+        first = self._length - 1
+        if offsets.min() > 0:
+            # The input does not cover the last bucket, so it keeps its total
+            totals, first = totals[1:], self._length
+        length = first + len(totals)
+        if length > len(self._buffer):
+            # Amortized growth: earlier values are copied once per doubling, not once per append
+            buffer = np.zeros(max(length, 2 * len(self._buffer)))
+            buffer[:self._length] = self.values
+            self._buffer = buffer
+        self._buffer[first:length] = totals
+        self._length = length
+        self.records += records
+
+
+class CalendarCache:
+    """Per-key calendar series reused across requests in the long-lived worker, least recently used evicted."""
+
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[Hashable, CalendarSeries]' = OrderedDict()
+
+    def calendar(self, key: Hashable, sales: DailySales, freq: str = 'D') -> CalendarSeries:
+        """Calendar for the full daily totals of a product, appending to the cached one when possible.
+
+        The cached series is reused when the input reaches at least its last
+        bucket and every cached bucket, the last one included, holds exactly
+        the cached total; only the buckets after it are appended. Any other
+        difference (a deleted, added or moved sale, sales on the last bucket
+        revised since it was cached, or input that now ends earlier) means
+        history was revised, and the series is rebuilt.
+        """
+        days = sales.dates.astype(np.int64)
+        series = self.entries.get(key)
+        if series is not None and series.freq == freq and len(days) and len(series):
+            buckets = bucket_start(days, freq)
+            cached = buckets <= series.end
+            if buckets[0] == series.start and buckets[-1] >= series.end:
+                history = np.bincount((buckets[cached] - series.start) // series.step,
+                                      weights=sales.quantities[cached], minlength=len(series))
+                if np.array_equal(history, series.values):
+                    series.append(days[~cached], sales.quantities[~cached], sales.records - series.records)
+                    self._store(key, series)
+                    return series
+
+        series = CalendarSeries.from_sales(sales, freq)
+        if np.shares_memory(series.values, sales.quantities):
+            # Appends write into the series' buffer, which must not be the caller's array
+            series = CalendarSeries(series.start, series.values.copy(), freq, series.records)
+        self._store(key, series)
+        return series
+
+    def _store(self, key: Hashable, series: CalendarSeries) -> None:
+        self.entries[key] = series
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+_calendar_cache: Optional[CalendarCache] = None
+
+
+def get_calendar_cache() -> CalendarCache:
+    """Process-wide calendar cache; entries live as long as the worker process."""
+    global _calendar_cache
+    if _calendar_cache is None:
+        _calendar_cache = CalendarCache()
+    return _calendar_cache
+
+
+def calendar_for(data: Any, key: Optional[Hashable] = None, freq: str = 'D',
+                 timezone: Optional[str] = None) -> CalendarSeries:
+    """The calendar every model consumes; daily totals with a key go through the calendar cache."""
+    if key is not None and isinstance(data, DailySales):
+        check_bucketed(timezone)
+        return get_calendar_cache().calendar((key, freq), data, freq)
+    return CalendarSeries.from_sales(data, freq, timezone)
+
+
+def as_calendar(data: Any, timezone: Optional[str] = None) -> Optional[CalendarSeries]:
+    """Calendar for sales data with dates; None for a plain array of values, which has no calendar."""
+    if isinstance(data, (CalendarSeries, DailySales, SalesColumns, pd.DataFrame)):
+        return CalendarSeries.from_sales(data, timezone=timezone)
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        return CalendarSeries.from_sales(data, timezone=timezone)
+    return None
+
@@ -0,0 +1,17 @@
+"""Shared pytest fixtures for the forecasting modules."""
+import os
+import sys
+
+import pytest
+
+# The anomaly detectors live with the Node anomaly module; worker.py puts them on the path the same way
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modules', 'anomaly'))
+
+import model_cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_model_cache(tmp_path, monkeypatch):
+    """Every test gets an empty model cache of its own instead of the shared one next to the scripts."""
+    monkeypatch.setenv('MODEL_CACHE_DIR', str(tmp_path / 'models'))
+    monkeypatch.setattr(model_cache, '_default_cache', None)
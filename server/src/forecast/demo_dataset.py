@@ -0,0 +1,178 @@
+"""Columnar cache of the demo retail dataset (csv/retail_store_inventory.csv).
+
+The CSV is parsed once, reading only Date, Store ID, Product ID and Units
+Sold, and summed per (day, store, product). The result is written as .npy
+columns and memory-mapped on later loads, so a demo or load-test request no
+longer parses the whole file. Totals, per-store and per-product series are all
+built from the same columns.
+
+Cached columns are kept in a directory named after the CSV's size and mtime.
+If the CSV changes, the next load builds a new directory and removes the old
+ones. Set DEMO_CACHE_DIR to move the cache (default .cache/demo next to this
+file).
+"""
+import os
+import json
+import shutil
+import tempfile
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from model_cache import DEFAULT_CACHE_DIR
+from sales_series import DailySales
+
+COLUMNS = {'Date': 'category', 'Store ID': 'category', 'Product ID': 'category', 'Units Sold': 'float64'}
+REQUIRED_COLUMNS = ('Date', 'Units Sold')
+ARRAYS = ('days', 'day_index', 'store_codes', 'product_codes', 'units', 'records')
+
+
+class MissingColumnsError(ValueError):
+    pass
+
+
+class DemoTable:
+    """Units sold per (day, store, product) as parallel NumPy columns."""
+
+    def __init__(self, days: np.ndarray, day_index: np.ndarray, store_codes: np.ndarray,
+                 product_codes: np.ndarray, units: np.ndarray, records: np.ndarray,
+                 stores: List[str], products: List[str]):
+        # Sorted unique datetime64[D] days; day_index maps each row to one of them
+        self.days = days
+        self.day_index = day_index
+        self.store_codes = store_codes
+        self.product_codes = product_codes
+        self.units = units
+        # CSV rows behind each aggregated row
+        self.records = records
+        self.stores = stores
+        self.products = products
+
+    def _code(self, names: List[str], name: str, label: str) -> int:
+        try:
+            return names.index(str(name))
+        except ValueError:
+            raise KeyError(f"Unknown {label} '{name}' in demo data") from None
+
+    def daily(self, store_id: Optional[str] = None, product_id: Optional[str] = None) -> DailySales:
+        """Daily units sold in total, or for one store and/or product."""
+        mask = None
+        if store_id is not None:
+            mask = self.store_codes == self._code(self.stores, store_id, 'store')
+        if product_id is not None:
+            product_mask = self.product_codes == self._code(self.products, product_id, 'product')
+            mask = product_mask if mask is None else mask & product_mask
+
+        day_index, units, records = self.day_index, self.units, self.records
+        if mask is not None:
+            day_index, units, records = day_index[mask], units[mask], records[mask]
+
+        totals = np.bincount(day_index, weights=units, minlength=len(self.days))
+        present = np.bincount(day_index, minlength=len(self.days)) > 0
+        return DailySales(np.asarray(self.days[present]), totals[present], int(records.sum()))
+
+    def breakdown(self, by: str = 'store') -> dict:
+        """Daily series for every store (by='store') or product (by='product')."""
+        if by == 'store':
+            return {name: self.daily(store_id=name) for name in self.stores}
+        if by == 'product':
+            return {name: self.daily(product_id=name) for name in self.products}
+        raise ValueError(f"Unknown breakdown '{by}', expected 'store' or 'product'")
+
+
+def _source_version(csv_path: str) -> str:
+    stat = os.stat(csv_path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def _cache_root() -> str:
+    return os.getenv('DEMO_CACHE_DIR', os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), 'demo'))
+
+
+def parse_csv(csv_path: str) -> DemoTable:
+    """Read only the needed columns and sum units per (day, store, product).
+
+    Date and Units Sold are required. Store ID and Product ID are optional; when
+    one is missing every row belongs to a single 'all' store or product.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise MissingColumnsError(f"Required columns not found: {missing}. Available columns: {header.tolist()}")
+
+    dtypes = {name: dtype for name, dtype in COLUMNS.items() if name in header}
+    df = pd.read_csv(csv_path, usecols=list(dtypes), dtype=dtypes)
+    for name in ('Store ID', 'Product ID'):
+        if name not in df:
+            df[name] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), ['all'])
+
+    grouped = (
+        df.groupby(['Date', 'Store ID', 'Product ID'], observed=True, sort=False)['Units Sold']
+        .agg(['sum', 'size'])
+        .reset_index()
+    )
+
+    # Parse each distinct date once rather than once per row
+    date_labels = grouped['Date'].cat.categories
+    parsed = pd.to_datetime(date_labels).values.astype('datetime64[D]')
+    order = np.argsort(parsed, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    return DemoTable(
+        days=parsed[order],
+        day_index=rank[grouped['Date'].cat.codes.to_numpy()].astype(np.int32),
+        store_codes=grouped['Store ID'].cat.codes.to_numpy().astype(np.int32),
+        product_codes=grouped['Product ID'].cat.codes.to_numpy().astype(np.int32),
+        units=grouped['sum'].to_numpy(dtype=np.float64),
+        records=grouped['size'].to_numpy(dtype=np.int32),
+        stores=grouped['Store ID'].cat.categories.astype(str).tolist(),
+        products=grouped['Product ID'].cat.categories.astype(str).tolist(),
+    )
+
+
+def _write(table: DemoTable, root: str, version: str) -> None:
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=root, prefix='.tmp-')
+    try:
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), getattr(table, name))
+        with open(os.path.join(tmp_dir, 'labels.json'), 'w') as f:
+            json.dump({'stores': table.stores, 'products': table.products}, f)
+        # Readers only ever see a complete directory
+        os.rename(tmp_dir, os.path.join(root, version))
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    for name in os.listdir(root):
+        if name != version and not name.startswith('.tmp-'):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def _read(version_dir: str) -> DemoTable:
+    arrays = {name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode='r') for name in ARRAYS}
+    with open(os.path.join(version_dir, 'labels.json')) as f:
+        labels = json.load(f)
+    return DemoTable(stores=labels['stores'], products=labels['products'], **arrays)
+
+
+def load_demo_table(csv_path: str) -> DemoTable:
+    """Cached columns for csv_path, rebuilt when the CSV's size or mtime changes."""
+    root = _cache_root()
+    version = _source_version(csv_path)
+    version_dir = os.path.join(root, version)
+    if os.path.isdir(version_dir):
+        try:
+            return _read(version_dir)
+        except (OSError, ValueError, KeyError):
+            shutil.rmtree(version_dir, ignore_errors=True)
+
+    table = parse_csv(csv_path)
+    try:
+        _write(table, root, version)
+    except OSError:
+        # Another process may have just built the same version; either way the parsed table is good
+        pass
+    return table
@@ -0,0 +1,160 @@
+"""Level-gated diagnostics and per-stage timing for the forecasting modules.
+
+Everything goes to stderr through the 'forecast' logger, so stdout stays
+reserved for results. FORECAST_LOG_LEVEL sets the level (default WARNING).
+Expensive facts, such as collection counts or database listings, are only
+gathered when diagnostics_enabled() is true, which means DEBUG level or
+FORECAST_DIAGNOSTICS=1.
+
+Timing uses a trace per request:
+
+    with start_trace('forecast') as trace:
+        with stage('fetch'):
+            ...
+
+Each stage() adds its wall time to the active trace, and the trace logs
+its timings at INFO level when it ends. stage() is a no-op when no trace is
+active.
+
+Heavy dependencies (statsmodels, prophet) are imported on first use. To see
+what a script's startup costs, run it with --import-profile (or
+FORECAST_IMPORT_PROFILE=1): every first import is timed per top-level
+package and the breakdown is written to stderr when the process exits.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import builtins
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+_logger = logging.getLogger('forecast')
+if not _logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter('[%(name)s] %(levelname)s %(message)s'))
+    _logger.addHandler(_handler)
+    _logger.setLevel(os.getenv('FORECAST_LOG_LEVEL', 'WARNING').upper())
+    _logger.propagate = False
+
+_current_trace: contextvars.ContextVar[Optional['Trace']] = contextvars.ContextVar('forecast_trace', default=None)
+
+
+def get_logger(name: Optional[str] = None) -> logging.Logger:
+    return _logger.getChild(name) if name else _logger
+
+
+def diagnostics_enabled() -> bool:
+    """Whether expensive diagnostic queries should run."""
+    return os.getenv('FORECAST_DIAGNOSTICS', '') in ('1', 'true') or _logger.isEnabledFor(logging.DEBUG)
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.timings: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage_name: str, seconds: float) -> None:
+        self.timings[stage_name] = self.timings.get(stage_name, 0.0) + seconds
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            'trace': self.name,
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'stages_ms': {name: round(seconds * 1000, 2) for name, seconds in self.timings.items()},
+        }
+
+
+@contextmanager
+def start_trace(name: str) -> Iterator[Trace]:
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        if _logger.isEnabledFor(logging.INFO):
+            _logger.info(json.dumps(trace.summary()))
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block against the active trace (connect, fetch, fit, predict, serialize, ...)."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+_import_times: Optional[Dict[str, float]] = None
+_profile_started = 0.0
+
+
+def profile_imports() -> None:
+    """Time every module imported from now on, as self time per top-level package."""
+    global _import_times, _profile_started
+    if _import_times is not None:
+        return
+    _import_times = {}
+    _profile_started = time.perf_counter()
+    original_import = builtins.__import__
+    # Time spent in nested imports, one accumulator per import in progress
+    nested: List[float] = []
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return original_import(name, globals, locals, fromlist, level)
+        nested.append(0.0)
+        started = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            package = name.partition('.')[0]
+            _import_times[package] = _import_times.get(package, 0.0) + elapsed - nested.pop()
+            if nested:
+                nested[-1] += elapsed
+
+    builtins.__import__ = timed_import
+    atexit.register(report_imports)
+
+
+def import_report(limit: int = 15) -> Dict[str, object]:
+    """Slowest packages imported since profile_imports(), in milliseconds."""
+    times = _import_times or {}
+    slowest = sorted(times.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return {
+        'imports_ms': round(sum(times.values()) * 1000, 1),
+        'elapsed_ms': round((time.perf_counter() - _profile_started) * 1000, 1) if _import_times is not None else 0.0,
+        'packages_ms': {package: round(seconds * 1000, 1) for package, seconds in slowest},
+    }
+
+
+def report_imports() -> None:
+    report = import_report()
+    print(f"Import profile: {report['imports_ms']} ms importing, {report['elapsed_ms']} ms since start",
+          file=sys.stderr)
+    for package, ms in report['packages_ms'].items():
+        print(f"  {package:<24} {ms:>9.1f} ms", file=sys.stderr)
+
+
+def profile_imports_if_requested(argv: Sequence[str]) -> None:
+    """Start the import profile for --import-profile or FORECAST_IMPORT_PROFILE=1.
+
+    Call it before the script's other imports so they are included.
+    """
+    if '--import-profile' in argv or os.getenv('FORECAST_IMPORT_PROFILE', '') in ('1', 'true'):
+        profile_imports()
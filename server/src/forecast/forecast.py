@@ -1,45 +1,45 @@
 import sys
+from diagnostics import profile_imports_if_requested
+# Before the other imports, so --import-profile covers them
+profile_imports_if_requested(sys.argv)
 import pandas as pd
-from prophet import Prophet
-from pymongo import MongoClient
 import os
 from datetime import datetime, timedelta
 import pathlib
 import json
 import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from bson import ObjectId
+from mongo_connection import get_client, get_database
+from sales_series import DailySales, fetch_daily_sales, fetch_daily_sales_by_product
+from calendar_series import CalendarSeries
+from diagnostics import diagnostics_enabled, get_logger, stage, start_trace
+from prophet_models import fit_or_load
+from demo_dataset import MissingColumnsError, load_demo_table
+from ndjson import NDJSONWriter, date_strings, strip_flags, wants_ndjson
+
+log = get_logger('forecast')
 
 def get_mongodb_connection():
-    try:
-        mongo_uri = os.getenv('DATABASE_URL', 'mongodb://localhost:27017')
-        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
-        # Test the connection
-        client.server_info()
-        return client
-    except Exception as e:
-        print(f"MongoDB connection error: {str(e)}", file=sys.stderr)
-        return None
+    """Shared pooled client; connects lazily on the first operation."""
+    return get_client()
+
+def log_collection_diagnostics(client, db, collection, query):
+    """Collection-wide facts for debugging; each call scans or counts the whole collection."""
+    log.debug("Available databases: %s", client.list_database_names())
+    log.debug("Available collections: %s", db.list_collection_names())
+    log.debug("Total sales documents: %s", collection.count_documents({}))
+    if query:
+        log.debug("Sales matching query: %s", collection.count_documents(query))
+    log.debug("Sample document structure: %s", collection.find_one({}))
 
 def get_sales_data(product_id=None):
-    client = get_mongodb_connection()
-    if not client:
-        print("Failed to connect to MongoDB", file=sys.stderr)
-        return []
-        
     try:
-        # List all databases
-        print("Available databases:", client.list_database_names(), file=sys.stderr)
-        
-        # Use the 'dev' database instead of 'inventory_management'
-        db = client['dev']
-        # List all collections
-        print("Available collections:", db.list_collection_names(), file=sys.stderr)
-        
-        collection = db['sales']
-        
-        # Count total documents in sales collection
-        total_sales = collection.count_documents({})
-        print(f"Total sales documents: {total_sales}", file=sys.stderr)
+        with stage('connect'):
+            client = get_mongodb_connection()
+            # Use the 'dev' database instead of 'inventory_management' (MONGO_DB_NAME)
+            db = get_database()
+            collection = db['sales']
         
         query = {}
         if product_id:
@@ -48,49 +48,149 @@ def get_sales_data(product_id=None):
                 product_id = ObjectId(product_id)
             except:
                 print(f"Invalid product ID format: {product_id}", file=sys.stderr)
-                return []
+                return DailySales.empty()
             
             query['product'] = product_id
-            print(f"Querying sales for product: {product_id}", file=sys.stderr)
-            
-            # Count documents matching the query
-            matching_sales = collection.count_documents(query)
-            print(f"Sales matching query: {matching_sales}", file=sys.stderr)
-            
-            # Print a sample document to see the structure
-            sample = collection.find_one({})
-            if sample:
-                print(f"Sample document structure: {sample}", file=sys.stderr)
         
-        # Print the query for debugging
-        print(f"MongoDB query: {query}", file=sys.stderr)
+        # Only on demand: these count or list the entire collection
+        if diagnostics_enabled():
+            log_collection_diagnostics(client, db, collection, query)
+        log.debug("MongoDB query: %s", query)
         
-        # Find all matching documents
-        cursor = collection.find(query)
-        sales_data = list(cursor)
+        # Sum quantities per day inside MongoDB instead of fetching every sale document
+        with stage('fetch'):
+            sales_data = fetch_daily_sales(collection, query.get('product'))
         
-        print(f"Found {len(sales_data)} sales records", file=sys.stderr)
-        
-        if len(sales_data) > 0:
-            print(f"Sample sales record: {sales_data[0]}", file=sys.stderr)
-            # Transform the data to match expected format
-            transformed_data = []
-            for sale in sales_data:
-                transformed_data.append({
-                    'date': sale['date'],
-                    'quantity': sale['quantity']
-                })
-            return transformed_data
-        
-        return []
+        log.info("Found %s sales records over %s days", sales_data.records, len(sales_data))
+        return sales_data
     except Exception as e:
         print(f"Error fetching sales data: {str(e)}", file=sys.stderr)
-        return []
-    finally:
-        if client:
-            client.close()
+        return DailySales.empty()
+
+def get_sales_data_batch(product_ids=None):
+    """Fetch daily sales for many products with one grouped aggregation over the sales collection.
+
+    product_ids is a list of id strings, or None/'all' for every product.
+    Returns {product_id: DailySales}.
+    """
+    try:
+        collection = get_database()['sales']
+
+        object_ids = None
+        if product_ids and product_ids != 'all':
+            object_ids = []
+            for product_id in product_ids:
+                try:
+                    object_ids.append(ObjectId(product_id))
+                except:
+                    print(f"Invalid product ID format: {product_id}", file=sys.stderr)
+            if not object_ids:
+                return {}
+
+        with stage('fetch'):
+            sales_by_product = fetch_daily_sales_by_product(collection, object_ids)
+
+        log.info("Fetched sales for %s products", len(sales_by_product))
+        return sales_by_product
+    except Exception as e:
+        print(f"Error fetching batch sales data: {str(e)}", file=sys.stderr)
+        return {}
+
+def sales_to_frame(sales_data, timezone=None):
+    """Convert daily sales (or sale records) to the ds/y frame Prophet expects, one row per calendar day."""
+    product_df = CalendarSeries.from_sales(sales_data, timezone=timezone).to_frame()
+    return product_df.rename(columns={'date': 'ds', 'quantity': 'y'})
+
+def predict_prophet(product_df, periods=60, product_id=None, horizon_only=False):
+    """Fit Prophet on a ds/y frame and return its ds/yhat predictions as a frame.
+
+    With a product_id the fitted model is persisted and reused or warm-started
+    on the next call. horizon_only skips predicting over the history and
+    returns only the future days.
+    """
+    model, _ = fit_or_load(product_df, product_id)
+
+    with stage('predict'):
+        # Make future dataframe (e.g., 30 days)
+        future = model.make_future_dataframe(periods=periods, include_history=not horizon_only)
+        return model.predict(future)[['ds', 'yhat']]
+
+def forecast_columns(forecast_df):
+    """ds strings and yhat values as parallel lists."""
+    return {'ds': date_strings(forecast_df['ds']), 'yhat': forecast_df['yhat'].tolist()}
+
+def forecast_records(forecast_df):
+    """ds/yhat records built from the columns, without DataFrame.to_dict."""
+    columns = forecast_columns(forecast_df)
+    return [{'ds': ds, 'yhat': yhat} for ds, yhat in zip(columns['ds'], columns['yhat'])]
 
-def forecast(product_id=None, is_demo=False):
+def fit_prophet_forecast(product_df, periods=60, product_id=None, horizon_only=False):
+    """Fit Prophet on a ds/y frame and return the forecast as date/yhat records."""
+    forecast_df = predict_prophet(product_df, periods, product_id, horizon_only)
+
+    with stage('serialize'):
+        return forecast_records(forecast_df)
+
+def forecast_product_sales(product_id, sales_data, horizon_only=False, columnar=False):
+    """Forecast one product from already fetched sales; runs inside the batch process pool.
+
+    With columnar set the forecast is returned as {'ds': [...], 'yhat': [...]}.
+    """
+    try:
+        if not sales_data.records:
+            return {"product_id": product_id, "error": "No sales data found for this product."}
+        if sales_data.records < 10:
+            return {"product_id": product_id, "error": "Not enough sales data to forecast. Minimum 10 sales records required."}
+        product_df = sales_to_frame(sales_data)
+        if columnar:
+            forecast_df = predict_prophet(product_df, product_id=product_id, horizon_only=horizon_only)
+            return {"product_id": product_id, "forecast": forecast_columns(forecast_df)}
+        return {"product_id": product_id,
+                "forecast": fit_prophet_forecast(product_df, product_id=product_id, horizon_only=horizon_only)}
+    except Exception as e:
+        error_msg = f"Error in forecast: {str(e)}"
+        print(f"{error_msg} for product {product_id}\n{traceback.format_exc()}", file=sys.stderr)
+        return {"product_id": product_id, "error": error_msg}
+
+def forecast_batch(product_ids='all', max_workers=None, horizon_only=False, columnar=False):
+    """Forecast many products from a single sales scan.
+
+    Yields one result dict per product as soon as its model finishes.
+    """
+    sales_by_product = get_sales_data_batch(product_ids)
+
+    # Requested products without any sales still get a result line
+    if product_ids and product_ids != 'all':
+        for product_id in product_ids:
+            sales_by_product.setdefault(product_id, DailySales.empty())
+
+    if not sales_by_product:
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(forecast_product_sales, product_id, sales_data, horizon_only, columnar)
+            for product_id, sales_data in sales_by_product.items()
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+def stream_forecast_batch(writer, product_ids='all', max_workers=None, horizon_only=False):
+    """Write each product's forecast points (or its error) as soon as the product finishes."""
+    for product_result in forecast_batch(product_ids, max_workers, horizon_only, columnar=True):
+        product_id = product_result['product_id']
+        if 'error' in product_result:
+            writer.error(product_result['error'], product_id=product_id)
+        else:
+            writer.rows('point', product_result['forecast'], product_id=product_id)
+    writer.end()
+
+def forecast_frame(product_id=None, is_demo=False, horizon_only=False, store_id=None, demo_product_id=None):
+    """Prophet ds/yhat frame for a product or for the demo CSV, or an {"error": ...} dict.
+
+    In demo mode store_id and demo_product_id narrow the series to one store
+    and/or one product of the CSV.
+    """
     try:
         if is_demo:
             # For demo, use the CSV file
@@ -101,69 +201,89 @@ def forecast(product_id=None, is_demo=False):
                 print(f"CSV file not found at {csv_path}", file=sys.stderr)
                 return {"error": f"CSV file not found at {csv_path}"}
                 
-            print(f"Reading CSV file from {csv_path}", file=sys.stderr)
-            df = pd.read_csv(csv_path)
-            print(f"CSV columns: {df.columns.tolist()}", file=sys.stderr)
-            
-            # Check if required columns exist
-            if 'Date' not in df.columns or 'Units Sold' not in df.columns:
-                print(f"Required columns not found. Available columns: {df.columns.tolist()}", file=sys.stderr)
-                return {"error": "CSV file does not contain required columns (Date, Units Sold)"}
-                
-            # Aggregate sales by date
-            product_df = df.groupby('Date')['Units Sold'].sum().reset_index()
-            product_df = product_df.rename(columns={'Date': 'ds', 'Units Sold': 'y'})
-            
-            # Convert date to datetime
-            product_df['ds'] = pd.to_datetime(product_df['ds'])
+            with stage('fetch'):
+                try:
+                    # Parsed once per CSV version, then memory-mapped from the columnar cache
+                    table = load_demo_table(str(csv_path))
+                    sales_data = table.daily(store_id=store_id, product_id=demo_product_id)
+                except MissingColumnsError as e:
+                    print(str(e), file=sys.stderr)
+                    return {"error": "CSV file does not contain required columns (Date, Units Sold)"}
+                except KeyError as e:
+                    return {"error": str(e.args[0])}
+
+            product_df = sales_to_frame(sales_data)
         else:
             # Get sales data from MongoDB
             sales_data = get_sales_data(product_id)
             
-            if not sales_data:
+            if not sales_data.records:
                 return {"error": "No sales data found for this product."}
                 
-            if len(sales_data) < 10:
+            if sales_data.records < 10:
                 return {"error": "Not enough sales data to forecast. Minimum 10 sales records required."}
                 
             # Convert MongoDB data to DataFrame
-            df = pd.DataFrame(sales_data)
-            df['date'] = pd.to_datetime(df['date'])
-            product_df = df[['date', 'quantity']]
-            product_df = product_df.rename(columns={'date': 'ds', 'quantity': 'y'})
-        
-        # Train model
-        model = Prophet()
-        model.fit(product_df)
+            product_df = sales_to_frame(sales_data)
         
-        # Make future dataframe (e.g., 30 days)
-        future = model.make_future_dataframe(periods=60)
-        forecast = model.predict(future)
-        
-        # Select only important columns
-        result = forecast[['ds', 'yhat']]
-        
-        # Convert dates to string format for JSON serialization
-        result['ds'] = result['ds'].dt.strftime('%Y-%m-%d')
-        
-        # Return results as JSON
-        return result.to_dict(orient='records')
+        # Train (or reuse) the model
+        model_key = f"demo-{store_id or 'all'}-{demo_product_id or 'all'}" if is_demo else product_id
+        return predict_prophet(product_df, product_id=model_key, horizon_only=horizon_only)
         
     except Exception as e:
         error_msg = f"Error in forecast: {str(e)}\n{traceback.format_exc()}"
         print(error_msg, file=sys.stderr)
         return {"error": error_msg}
 
+def forecast(product_id=None, is_demo=False, horizon_only=False, store_id=None, demo_product_id=None):
+    """Forecast as a list of ds/yhat records, or an {"error": ...} dict."""
+    result = forecast_frame(product_id, is_demo, horizon_only, store_id, demo_product_id)
+    if isinstance(result, dict):
+        return result
+    with stage('serialize'):
+        return forecast_records(result)
+
+def stream_forecast(writer, product_id=None, is_demo=False, horizon_only=False, store_id=None, demo_product_id=None):
+    """Write the forecast as NDJSON point records."""
+    result = forecast_frame(product_id, is_demo, horizon_only, store_id, demo_product_id)
+    if isinstance(result, dict):
+        writer.error(result['error'])
+    else:
+        with stage('serialize'):
+            writer.rows('point', {'ds': result['ds'], 'yhat': result['yhat']})
+    writer.end()
+
 if __name__ == "__main__":
+    # --ndjson streams typed records line by line (see ndjson.py) instead of one JSON document
+    streaming = wants_ndjson(sys.argv)
+    args = strip_flags(sys.argv[1:])
     try:
-        if len(sys.argv) > 1:
-            if sys.argv[1] == 'demo':
-                result = forecast(is_demo=True)
-            else:
-                result = forecast(product_id=sys.argv[1])
-            print(json.dumps(result))
+        if args and args[0] == 'batch':
+            # batch [all | id1,id2,...]: one JSON line per product as each finishes
+            target = args[1] if len(args) > 1 else 'all'
+            product_ids = 'all' if target == 'all' else [p for p in target.split(',') if p]
+            with start_trace('forecast_batch'):
+                if streaming:
+                    stream_forecast_batch(NDJSONWriter(), product_ids)
+                else:
+                    for product_result in forecast_batch(product_ids):
+                        print(json.dumps(product_result), flush=True)
+        elif args:
+            options = {'is_demo': True} if args[0] == 'demo' else {'product_id': args[0]}
+            with start_trace('forecast'):
+                if streaming:
+                    stream_forecast(NDJSONWriter(), **options)
+                else:
+                    result = forecast(**options)
+                    with stage('serialize'):
+                        output = json.dumps(result)
+            if not streaming:
+                print(output)
         else:
             print(json.dumps({"error": "Product ID or demo mode required"}))
     except Exception as e:
         error_msg = f"Error in main: {str(e)}\n{traceback.format_exc()}"
-        print(json.dumps({"error": error_msg}))
\ No newline at end of file
+        if streaming:
+            NDJSONWriter().error(error_msg)
+        else:
+            print(json.dumps({"error": error_msg}))
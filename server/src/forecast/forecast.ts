@@ -1,91 +1,191 @@
-import { Router } from 'express';
-import { exec } from 'child_process';
+import { Request, Response, Router } from 'express';
 import productControllers from '../modules/product/product.controllers';
 import verifyAuth from '../middlewares/verifyAuth';
-import path from 'path';
+import { ForecastWorkerRequestType, ForecastWorkerService } from '../services/forecastWorker.service';
 
 const forecastRoutes = Router();
 
 // Apply authentication middleware to all forecast routes
 forecastRoutes.use(verifyAuth);
 
-// Demo forecast endpoint
-forecastRoutes.post('/demo', (req, res) => {
-  const scriptPath = path.join(__dirname, 'forecast.py');
-  
-  // Run Python script in demo mode with properly escaped path
-  exec(`python3 "${scriptPath}" demo`, (error, stdout, stderr) => {
-    if (error) {
-      console.error(`Error: ${error.message}`);
-      console.error(`Stderr: ${stderr}`);
-      return res.status(500).json({ error: 'Error running forecast script. Please check the server logs for details.' });
+// ?format=ndjson: write forecast points to the response as the worker produces them
+const streamForecast = async (res: Response, payload: object) => {
+  res.setHeader('Content-Type', 'application/x-ndjson');
+  try {
+    await ForecastWorkerService.getInstance().stream('forecast', payload, (record) => {
+      res.write(JSON.stringify(record) + '\n');
+    });
+  } catch (error) {
+    console.error('Forecast worker error:', error);
+    res.write(JSON.stringify({ type: 'error', error: 'Error running forecast script.' }) + '\n');
+  }
+  res.end();
+};
+
+// Catalogue jobs (backtests, model routing) can outgrow the request timeout, so they run on the job worker
+// under their own one
+const JOB_TIMEOUT_MS = Number(process.env.FORECAST_JOB_TIMEOUT_MS) || 60 * 60 * 1000;
+
+// Runs a catalogue job that streams one record per product. ?format=ndjson writes each record as soon as its
+// product finishes; otherwise the products are collected into one JSON array
+const runCatalogueJob = async (
+  req: Request,
+  res: Response,
+  type: ForecastWorkerRequestType,
+  payload: object,
+  failure: string
+) => {
+  const ndjson = req.query.format === 'ndjson';
+  const products: object[] = [];
+  let error: string | undefined;
+  if (ndjson) {
+    res.setHeader('Content-Type', 'application/x-ndjson');
+  }
+  try {
+    await ForecastWorkerService.getInstance().streamJob(
+      type,
+      payload,
+      (record) => {
+        if (ndjson) {
+          res.write(JSON.stringify(record) + '\n');
+        } else if (record.type === 'section') {
+          products.push(record.data);
+        } else if (record.type === 'error') {
+          // Errors without a product reject the whole request (e.g. an unknown model)
+          if (record.product_id) {
+            products.push({ product_id: record.product_id, error: record.error });
+          } else {
+            error = record.error;
+          }
+        }
+      },
+      JOB_TIMEOUT_MS
+    );
+  } catch (e) {
+    console.error('Forecast worker error:', e);
+    if (!ndjson) {
+      return res.status(500).json({ error: `${failure} Please check the server logs for details.` });
     }
-    if (stderr) {
-      console.error(`Stderr: ${stderr}`);
+    res.write(JSON.stringify({ type: 'error', error: failure }) + '\n');
+  }
+  if (ndjson) {
+    return res.end();
+  }
+  if (error) {
+    return res.status(400).json({ error });
+  }
+  res.json(products);
+};
+
+// Demo forecast endpoint
+forecastRoutes.post('/demo', async (req, res) => {
+  const payload = {
+    demo: true,
+    // Optional ?store=S001&product=P0001 narrow the demo series
+    store_id: req.query.store,
+    demo_product_id: req.query.product,
+    // ?horizon=future returns only the forecast days, skipping the in-sample fit
+    horizon_only: req.query.horizon === 'future'
+  };
+  if (req.query.format === 'ndjson') {
+    return streamForecast(res, payload);
+  }
+
+  try {
+    // Run the forecast in demo mode on the persistent Python worker
+    const forecastData = await ForecastWorkerService.getInstance().request('forecast', payload);
+    if (forecastData.error) {
+      if (forecastData.error.includes('CSV file not found')) {
+        return res.status(404).json({ error: 'Demo data file not found. Please contact the administrator.' });
+      }
+      return res.status(500).json({ error: forecastData.error });
     }
+    res.json(forecastData);
+  } catch (error) {
+    console.error('Forecast worker error:', error);
+    res.status(500).json({ error: 'Error running forecast script. Please check the server logs for details.' });
+  }
+});
 
-    try {
-      // Parse Python output and send it to frontend
-      const forecastData = JSON.parse(stdout);
-      if (forecastData.error) {
-        if (forecastData.error.includes('CSV file not found')) {
-          return res.status(404).json({ error: 'Demo data file not found. Please contact the administrator.' });
-        }
-        return res.status(500).json({ error: forecastData.error });
+// Reconciled forecasts for total, category, brand and product in one request
+forecastRoutes.post('/hierarchy', async (req, res) => {
+  const payload = {
+    // Optional ?category=<id>&brand=<id> restrict the hierarchy to their products
+    category_id: req.query.category,
+    brand_id: req.query.brand,
+    // bottom_up, ols, wls or mint (default)
+    method: req.query.method,
+    horizon: req.query.horizon ? Number(req.query.horizon) : undefined
+  };
+
+  try {
+    const forecastData = await ForecastWorkerService.getInstance().request('forecast_hierarchy', payload);
+    if (forecastData.error) {
+      if (forecastData.error.includes('No products found') || forecastData.error.includes('Not enough sales data')) {
+        return res.status(200).json({ error: forecastData.error, nodes: [] });
+      }
+      if (forecastData.error.includes('Invalid category or brand ID') || forecastData.error.includes('Unknown reconciliation method')) {
+        return res.status(400).json({ error: forecastData.error });
       }
-      res.json(forecastData);
-    } catch (parseError) {
-      console.error('Parse Error:', parseError);
-      console.error('Raw output:', stdout);
-      res.status(500).json({ error: 'Failed to parse forecast data.' });
+      return res.status(500).json({ error: forecastData.error });
     }
-  });
+    res.json(forecastData);
+  } catch (error) {
+    console.error('Forecast worker error:', error);
+    res.status(500).json({ error: 'Error running hierarchical forecast. Please check the server logs for details.' });
+  }
+});
+
+// Out-of-sample accuracy (MAPE/MASE) per product and model from rolling-origin backtests
+forecastRoutes.post('/backtest', async (req, res) => {
+  const { product_ids, models, horizon, folds, step, window, window_size, history_days } = req.body || {};
+  const payload = { product_ids, models, horizon, folds, step, window, window_size, history_days };
+  return runCatalogueJob(req, res, 'backtest', payload, 'Error running backtest.');
+});
+
+// Cheapest adequate model per product (cached), plus its forecast when a horizon is given
+forecastRoutes.post('/route', async (req, res) => {
+  const { product_ids, horizon, refresh } = req.body || {};
+  return runCatalogueJob(req, res, 'route', { product_ids, horizon, refresh }, 'Error routing forecast models.');
 });
 
 // Product-specific forecast endpoint
-forecastRoutes.post('/:productId', (req, res) => {
+forecastRoutes.post('/:productId', async (req, res) => {
   const { productId } = req.params;
-  const scriptPath = path.join(__dirname, 'forecast.py');
-
-  // Run Python script with product ID and properly escaped path
-  exec(`python3 "${scriptPath}" ${productId}`, (error, stdout, stderr) => {
-    if (error) {
-      console.error(`Error: ${error.message}`);
-      console.error(`Stderr: ${stderr}`);
-      return res.status(500).json({ error: 'Error running forecast script. Please check the server logs for details.' });
-    }
-    if (stderr) {
-      console.error(`Stderr: ${stderr}`);
-    }
+  const payload = {
+    product_id: productId,
+    horizon_only: req.query.horizon === 'future'
+  };
+  if (req.query.format === 'ndjson') {
+    return streamForecast(res, payload);
+  }
 
-    try {
-      // Parse Python output and send it to frontend
-      const forecastData = JSON.parse(stdout);
-      if (forecastData.error) {
-        if (forecastData.error.includes('No sales data found')) {
-          return res.status(200).json({ 
-            error: 'No sales data found for this product. Please add some sales records first.',
-            data: []
-          });
-        }
-        if (forecastData.error.includes('Not enough sales data')) {
-          return res.status(200).json({ 
-            error: 'Not enough sales data to forecast. Minimum 10 sales records required.',
-            data: []
-          });
-        }
-        if (forecastData.error.includes('Connection refused')) {
-          return res.status(503).json({ error: 'Database connection error. Please try again later.' });
-        }
-        return res.status(500).json({ error: forecastData.error });
+  try {
+    // Run the forecast for this product on the persistent Python worker
+    const forecastData = await ForecastWorkerService.getInstance().request('forecast', payload);
+    if (forecastData.error) {
+      if (forecastData.error.includes('No sales data found')) {
+        return res.status(200).json({ 
+          error: 'No sales data found for this product. Please add some sales records first.',
+          data: []
+        });
+      }
+      if (forecastData.error.includes('Not enough sales data')) {
+        return res.status(200).json({ 
+          error: 'Not enough sales data to forecast. Minimum 10 sales records required.',
+          data: []
+        });
+      }
+      if (forecastData.error.includes('Connection refused')) {
+        return res.status(503).json({ error: 'Database connection error. Please try again later.' });
       }
-      res.json(forecastData);
-    } catch (parseError) {
-      console.error('Parse Error:', parseError);
-      console.error('Raw output:', stdout);
-      res.status(500).json({ error: 'Failed to parse forecast data.' });
+      return res.status(500).json({ error: forecastData.error });
     }
-  });
+    res.json(forecastData);
+  } catch (error) {
+    console.error('Forecast worker error:', error);
+    res.status(500).json({ error: 'Error running forecast script. Please check the server logs for details.' });
+  }
 });
 
 // Export forecastRoutes as default and productControllers as a named export
@@ -0,0 +1,265 @@
+"""Hierarchical demand forecasts over total, category, brand and product.
+
+Daily sales are fetched once per product with a single grouped aggregation
+and laid out as a product x day matrix. Every aggregate series (total, each
+category, each brand) is a row of S @ Y, where S is the 0/1 summing matrix
+of the hierarchy, so no aggregate level ever goes back to the raw sales.
+
+Base forecasts for the nodes are fitted in a process pool and then
+reconciled so that every aggregate equals the sum of its products:
+
+    bottom_up  only products are fitted; aggregates are their sums
+    ols        least-squares projection onto the coherent subspace (W = I)
+    wls        W = diagonal of the in-sample residual variances
+    mint       W = shrinkage estimate of the residual covariance (MinT)
+
+Products without a brand are grouped under 'unbranded'. Category and brand
+are separate groupings of the same products, so the hierarchy is grouped
+rather than strictly nested; the summing matrix handles both the same way.
+"""
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from diagnostics import get_logger, stage
+from mongo_connection import get_database
+from ndjson import date_strings
+from sales_series import daily_matrix, fetch_daily_sales_by_product
+
+log = get_logger('hierarchy')
+
+RECONCILE_METHODS = ('bottom_up', 'ols', 'wls', 'mint')
+LEVELS = ('total', 'category', 'brand', 'product')
+UNBRANDED = 'unbranded'
+DEFAULT_HORIZON = 30
+HISTORY_DAYS = int(os.getenv('HIERARCHY_HISTORY_DAYS', 365))
+# Seconds each node's SARIMAX fit (including its order search) may take
+NODE_TIME_BUDGET = float(os.getenv('HIERARCHY_NODE_TIME_BUDGET', 5.0))
+# Cache namespace of the node fits, apart from the stock forecast fits of the same products
+ARIMA_NAMESPACE = 'hierarchy-arima'
+# Nodes with fewer selling days than this get the moving average instead of SARIMAX
+MIN_SALES_DAYS = 10
+# Early residuals are dominated by the diffuse initialization of the state
+RESIDUAL_BURN_IN = 7
+
+
+class Hierarchy:
+    """Summing matrix over a set of products.
+
+    Rows are ordered total, categories, brands, products; the product rows
+    form an identity block, so S @ bottom gives every node's series.
+    """
+
+    def __init__(self, product_ids: Sequence[str], categories: Sequence[str], brands: Sequence[str]):
+        self.product_ids = list(product_ids)
+        category_ids = sorted(set(categories))
+        brand_ids = sorted(set(brands))
+        self.nodes: List[Tuple[str, str]] = (
+            [('total', 'total')]
+            + [('category', category) for category in category_ids]
+            + [('brand', brand) for brand in brand_ids]
+            + [('product', product_id) for product_id in self.product_ids]
+        )
+
+        n_products = len(self.product_ids)
+        columns = np.arange(n_products)
+        category_rows = 1 + np.searchsorted(category_ids, categories)
+        brand_rows = 1 + len(category_ids) + np.searchsorted(brand_ids, brands)
+        self.summing = np.zeros((len(self.nodes), n_products))
+        self.summing[0] = 1.0
+        self.summing[category_rows, columns] = 1.0
+        self.summing[brand_rows, columns] = 1.0
+        self.summing[len(self.nodes) - n_products + columns, columns] = 1.0
+
+    @property
+    def n_bottom(self) -> int:
+        return len(self.product_ids)
+
+    def aggregate(self, bottom: np.ndarray) -> np.ndarray:
+        """Series (or forecasts) for every node from the product rows."""
+        return self.summing @ bottom
+
+
+def fetch_product_hierarchy(category_id: Optional[str] = None,
+                            brand_id: Optional[str] = None) -> Dict[str, Tuple[str, str]]:
+    """{product_id: (category_id, brand_id)} for the products in scope."""
+    query: Dict[str, Any] = {}
+    if category_id:
+        query['category'] = ObjectId(category_id)
+    if brand_id:
+        query['brand'] = ObjectId(brand_id)
+    products = get_database()['products'].find(query, {'_id': 1, 'category': 1, 'brand': 1})
+    return {
+        str(product['_id']): (str(product['category']), str(product['brand']) if product.get('brand') else UNBRANDED)
+        for product in products
+    }
+
+
+def _moving_average_fit(values: np.ndarray, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Flat forecast at the last 7-day mean; residuals against the trailing mean."""
+    window = min(7, len(values))
+    trailing = np.convolve(values, np.ones(window) / window, mode='full')[:len(values)]
+    # The first days average over fewer than window values
+    trailing[:window] = np.cumsum(values[:window]) / np.arange(1, window + 1)
+    forecast = np.full(horizon, values[-window:].mean() if len(values) else 0.0)
+    return forecast, values - trailing
+
+
+def fit_node(node_key: str, values: np.ndarray, horizon: int,
+             time_budget: float = NODE_TIME_BUDGET) -> Dict[str, Any]:
+    """Base forecast and in-sample residuals for one node; runs inside the process pool.
+
+    Reuses the cached or warm-started SARIMAX fit of the stock optimization
+    forecast path, keyed by node in its own namespace, and falls back to the moving average when the
+    series is too sparse, the fit fails or the budget runs out.
+    """
+    from stock_optimization import fit_forecast_model
+
+    model: Dict[str, Any] = {'method': 'moving_average'}
+    if np.count_nonzero(values) < MIN_SALES_DAYS:
+        forecast, residuals = _moving_average_fit(values, horizon)
+        model['reason'] = f"fewer than {MIN_SALES_DAYS} selling days"
+    else:
+        try:
+            results, order, source = fit_forecast_model(values, node_key, time.monotonic() + time_budget,
+                                                        ARIMA_NAMESPACE)
+            forecast = np.asarray(results.get_forecast(horizon).predicted_mean)
+            residuals = np.asarray(results.resid, dtype=np.float64)
+            model = {'method': 'arima', 'order': list(order), 'source': source}
+        except Exception as e:
+            forecast, residuals = _moving_average_fit(values, horizon)
+            model['reason'] = f"ARIMA fit failed: {type(e).__name__}: {str(e)}"
+    return {'forecast': forecast, 'residuals': residuals, 'model': model}
+
+
+def fit_nodes(node_keys: Sequence[str], series: np.ndarray, horizon: int,
+              max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """fit_node for every row of series, in a process pool when more than one CPU is available."""
+    workers = max_workers or os.cpu_count() or 1
+    arguments = (node_keys, list(series), repeat(horizon))
+    if workers <= 1 or len(node_keys) <= 1:
+        return list(map(fit_node, *arguments))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(node_keys) // (workers * 4))
+        return list(executor.map(fit_node, *arguments, chunksize=chunksize))
+
+
+def shrinkage_covariance(residuals: np.ndarray) -> np.ndarray:
+    """Covariance of node residuals (nodes x days) shrunk towards its diagonal.
+
+    Uses the Schafer-Strimmer intensity for the correlations, as in the MinT
+    paper, so the estimate stays invertible with many nodes and few days.
+    """
+    n_days = residuals.shape[1]
+    errors = residuals.T
+    covariance = errors.T @ errors / n_days
+    variances = np.maximum(np.diag(covariance), 1e-12)
+    scale = np.sqrt(variances)
+    standardized = errors / scale
+    correlation = covariance / np.outer(scale, scale)
+
+    squares = standardized ** 2
+    correlation_variance = (squares.T @ squares - (standardized.T @ standardized) ** 2 / n_days)
+    correlation_variance /= n_days * (n_days - 1)
+    off_diagonal = ~np.eye(len(variances), dtype=bool)
+    denominator = np.sum(correlation[off_diagonal] ** 2)
+    intensity = np.sum(correlation_variance[off_diagonal]) / denominator if denominator > 0 else 1.0
+    intensity = float(np.clip(intensity, 0.0, 1.0))
+
+    return intensity * np.diag(variances) + (1 - intensity) * covariance
+
+
+def reconcile(base: np.ndarray, hierarchy: Hierarchy, method: str = 'mint',
+              residuals: Optional[np.ndarray] = None) -> np.ndarray:
+    """Coherent product forecasts (products x horizon) from base forecasts of every node.
+
+    For bottom_up base may hold only the product rows.
+    """
+    if method not in RECONCILE_METHODS:
+        raise ValueError(f"Unknown reconciliation method '{method}', expected one of {', '.join(RECONCILE_METHODS)}")
+    if method == 'bottom_up':
+        return base[-hierarchy.n_bottom:]
+
+    summing = hierarchy.summing
+    if method == 'ols':
+        weighted = summing
+    elif method == 'wls':
+        weighted = summing / np.maximum(residuals.var(axis=1), 1e-12)[:, None]
+    else:
+        covariance = shrinkage_covariance(residuals)
+        try:
+            weighted = np.linalg.solve(covariance, summing)
+        except np.linalg.LinAlgError:
+            weighted = np.linalg.pinv(covariance) @ summing
+    # P = (S' W^-1 S)^-1 S' W^-1, applied to the base forecasts
+    return np.linalg.lstsq(summing.T @ weighted, weighted.T @ base, rcond=None)[0]
+
+
+def forecast_hierarchy(category_id: Optional[str] = None, brand_id: Optional[str] = None, method: str = 'mint',
+                       horizon: int = DEFAULT_HORIZON, max_workers: Optional[int] = None,
+                       history_days: Optional[int] = None) -> Dict[str, Any]:
+    """Reconciled daily forecasts for total, category, brand and product nodes.
+
+    category_id and/or brand_id restrict the hierarchy to their products.
+    Returns {'method', 'horizon', 'dates', 'nodes': [{'level', 'id',
+    'forecast', 'base', 'model'}]} or an {"error": ...} dict.
+    """
+    try:
+        if method not in RECONCILE_METHODS:
+            return {"error": f"Unknown reconciliation method '{method}', expected one of {', '.join(RECONCILE_METHODS)}"}
+        horizon = int(horizon)
+        with stage('fetch'):
+            try:
+                products = fetch_product_hierarchy(category_id, brand_id)
+            except Exception as e:
+                return {"error": f"Invalid category or brand ID: {str(e)}"}
+            if not products:
+                return {"error": "No products found for this category or brand."}
+            object_ids = [ObjectId(product_id) for product_id in products] if (category_id or brand_id) else None
+            # One aggregation for every product; deleted products' sales are ignored
+            sales_by_product = fetch_daily_sales_by_product(get_database()['sales'], object_ids)
+
+        product_ids = sorted(products)
+        dates, bottom = daily_matrix(sales_by_product, product_ids, history_days or HISTORY_DAYS)
+        if len(dates) < MIN_SALES_DAYS:
+            return {"error": f"Not enough sales data for a hierarchical forecast. Minimum {MIN_SALES_DAYS} days required."}
+
+        hierarchy = Hierarchy(product_ids, *zip(*(products[product_id] for product_id in product_ids)))
+        series = hierarchy.aggregate(bottom)
+        log.info("Hierarchy of %s nodes over %s products and %s days", len(hierarchy.nodes), len(product_ids), len(dates))
+
+        # Bottom-up only needs the products' own forecasts
+        fitted_rows = (np.arange(len(hierarchy.nodes) - hierarchy.n_bottom, len(hierarchy.nodes))
+                       if method == 'bottom_up' else np.arange(len(hierarchy.nodes)))
+        node_keys = [f"hierarchy-{level}-{node_id}" for level, node_id in (hierarchy.nodes[i] for i in fitted_rows)]
+        with stage('model'):
+            fits = fit_nodes(node_keys, series[fitted_rows], horizon, max_workers)
+        base = np.vstack([fit['forecast'] for fit in fits])
+        residuals = np.vstack([fit['residuals'] for fit in fits])[:, RESIDUAL_BURN_IN:]
+
+        with stage('reconcile'):
+            # Demand cannot go negative; clipping the products keeps the aggregates coherent
+            reconciled = hierarchy.aggregate(np.maximum(reconcile(base, hierarchy, method, residuals), 0))
+
+        base_by_row = dict(zip(fitted_rows.tolist(), zip(base, (fit['model'] for fit in fits))))
+        nodes = []
+        for row, (level, node_id) in enumerate(hierarchy.nodes):
+            node = {'level': level, 'id': node_id, 'forecast': reconciled[row].tolist()}
+            if row in base_by_row:
+                node_base, model = base_by_row[row]
+                node.update(base=np.maximum(node_base, 0).tolist(), model=model)
+            nodes.append(node)
+
+        forecast_dates = np.arange(dates[-1] + 1, dates[-1] + 1 + horizon)
+        return {'method': method, 'horizon': horizon, 'dates': date_strings(forecast_dates), 'nodes': nodes}
+    except Exception as e:
+        error_msg = f"Error in hierarchical forecast: {str(e)}"
+        print(f"{error_msg}\n{traceback.format_exc()}", file=sys.stderr)
+        return {"error": error_msg}
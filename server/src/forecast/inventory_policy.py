@@ -0,0 +1,233 @@
+"""Vectorized inventory policies: safety stock, reorder point and EOQ.
+
+Every argument of compute_policies may be a scalar or an array with one
+value per SKU (or any shape that broadcasts), so a whole catalogue is
+computed in a single NumPy call:
+
+    safety_stock      z * sqrt(L * sigma_d^2 + mu_d^2 * sigma_L^2)
+    reorder_point     mu_d * L + safety_stock
+    eoq               sqrt(2 * D * K / h), D = 365 * mu_d
+    annual_cost       K * D / eoq + h * (eoq / 2 + safety_stock)
+
+with mu_d and sigma_d the daily demand mean and standard deviation, L the
+lead time in days (sigma_L its standard deviation), K the cost per order and
+h the holding cost per unit per year. z comes from a precomputed
+service-level lookup table instead of an inverse normal call per SKU.
+
+what_if() evaluates the same policies over a grid of parameter values, one
+row per scenario, and catalogue_policies() builds the replenishment table for
+every product from one sales aggregation.
+"""
+import sys
+import itertools
+import traceback
+from statistics import NormalDist
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from bson import ObjectId
+
+from diagnostics import get_logger, stage
+from mongo_connection import get_database
+from sales_series import daily_matrix, fetch_daily_sales_by_product
+
+log = get_logger('inventory_policy')
+
+DEFAULT_LEAD_TIME = 7
+DEFAULT_SERVICE_LEVEL = 0.95
+DEFAULT_ORDERING_COST = 50.0
+# Per unit per year
+DEFAULT_HOLDING_COST = 0.2
+DAYS_PER_YEAR = 365
+
+POLICY_PARAMETERS = ('lead_time', 'service_level', 'ordering_cost', 'holding_cost', 'lead_time_std')
+POLICY_METRICS = ('safety_stock', 'reorder_point', 'economic_order_quantity', 'annual_cost')
+
+# Cycle service levels covered by the z table; values outside are clipped
+MIN_SERVICE_LEVEL = 0.5
+MAX_SERVICE_LEVEL = 0.9999
+SERVICE_LEVEL_STEP = 0.0001
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+
+def _build_z_table() -> Tuple[np.ndarray, np.ndarray]:
+    count = int(round((MAX_SERVICE_LEVEL - MIN_SERVICE_LEVEL) / SERVICE_LEVEL_STEP)) + 1
+    levels = np.linspace(MIN_SERVICE_LEVEL, MAX_SERVICE_LEVEL, count)
+    normal = NormalDist()
+    return levels, np.array([normal.inv_cdf(level) for level in levels])
+
+
+SERVICE_LEVELS, Z_SCORES = _build_z_table()
+
+
+def service_level_z(service_level: ArrayLike) -> np.ndarray:
+    """Standard normal z for cycle service levels, read off the lookup table."""
+    levels = np.clip(np.asarray(service_level, dtype=np.float64), MIN_SERVICE_LEVEL, MAX_SERVICE_LEVEL)
+    return np.interp(levels, SERVICE_LEVELS, Z_SCORES)
+
+
+def demand_stats(daily_demand: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean and sample standard deviation of daily demand along the last axis.
+
+    NaN days (before a product's first sale) are left out; a series with
+    fewer than two days has a standard deviation of 0.
+    """
+    demand = np.asarray(daily_demand, dtype=np.float64)
+    present = np.isfinite(demand)
+    days = present.sum(axis=-1)
+    values = np.where(present, demand, 0.0)
+    mean = np.divide(values.sum(axis=-1), days, out=np.zeros(days.shape), where=days > 0)
+    squares = np.where(present, (demand - np.expand_dims(mean, -1)) ** 2, 0.0).sum(axis=-1)
+    std = np.sqrt(np.divide(squares, days - 1, out=np.zeros(days.shape), where=days > 1))
+    return mean, std
+
+
+def compute_policies(mean_demand: ArrayLike, std_demand: ArrayLike, lead_time: ArrayLike = DEFAULT_LEAD_TIME,
+                     service_level: ArrayLike = DEFAULT_SERVICE_LEVEL,
+                     ordering_cost: ArrayLike = DEFAULT_ORDERING_COST,
+                     holding_cost: ArrayLike = DEFAULT_HOLDING_COST,
+                     lead_time_std: ArrayLike = 0.0) -> Dict[str, np.ndarray]:
+    """Safety stock, reorder point, EOQ and annual cost for every SKU at once.
+
+    All arguments broadcast against each other; results have the broadcast
+    shape. A holding cost that is not positive raises ValueError.
+    """
+    mean_demand, std_demand, lead_time, ordering_cost, holding_cost, lead_time_std = (
+        np.asarray(value, dtype=np.float64)
+        for value in (mean_demand, std_demand, lead_time, ordering_cost, holding_cost, lead_time_std)
+    )
+    _check_holding_cost(holding_cost)
+    z = service_level_z(service_level)
+
+    lead_time_demand_std = np.sqrt(lead_time * std_demand ** 2 + mean_demand ** 2 * lead_time_std ** 2)
+    safety_stock = z * lead_time_demand_std
+    reorder_point = mean_demand * lead_time + safety_stock
+    annual_demand = mean_demand * DAYS_PER_YEAR
+    eoq = np.sqrt(2 * annual_demand * ordering_cost / holding_cost)
+    ordering = np.divide(ordering_cost * annual_demand, eoq, out=np.zeros(np.broadcast(eoq, ordering_cost).shape),
+                         where=eoq > 0)
+    annual_cost = ordering + holding_cost * (eoq / 2 + safety_stock)
+
+    shape = np.broadcast(mean_demand, std_demand, lead_time, z, ordering_cost, holding_cost, lead_time_std).shape
+    return {
+        'mean_demand': np.broadcast_to(mean_demand, shape),
+        'std_demand': np.broadcast_to(std_demand, shape),
+        'z_score': np.broadcast_to(z, shape),
+        'safety_stock': np.broadcast_to(safety_stock, shape),
+        'reorder_point': np.broadcast_to(reorder_point, shape),
+        'economic_order_quantity': np.broadcast_to(eoq, shape),
+        'annual_cost': np.broadcast_to(annual_cost, shape),
+    }
+
+
+def policy_levels(daily_demand: ArrayLike, **parameters: Any) -> Dict[str, float]:
+    """Policy for one SKU's daily demand history, as the optimal_levels dict of the forecast scripts."""
+    mean_demand, std_demand = demand_stats(daily_demand)
+    policy = compute_policies(mean_demand, std_demand, **parameters)
+    return {
+        'mean_demand': float(policy['mean_demand']),
+        'std_demand': float(policy['std_demand']),
+        'safety_stock': float(policy['safety_stock']),
+        'reorder_point': float(policy['reorder_point']),
+        'economic_order_quantity': float(policy['economic_order_quantity'])
+    }
+
+
+def _check_holding_cost(holding_cost: ArrayLike) -> None:
+    # EOQ divides by the holding cost; zero or negative costs have no meaningful order quantity
+    if not np.all(np.asarray(holding_cost, dtype=np.float64) > 0):
+        raise ValueError("holding_cost must be positive")
+
+
+def _check_parameters(parameters: Dict[str, Any]) -> None:
+    unknown = sorted(set(parameters) - set(POLICY_PARAMETERS))
+    if unknown:
+        raise ValueError(f"Unknown policy parameters {unknown}; expected {', '.join(POLICY_PARAMETERS)}")
+    if 'holding_cost' in parameters:
+        _check_holding_cost(parameters['holding_cost'])
+
+
+def what_if(mean_demand: ArrayLike, std_demand: ArrayLike, grid: Dict[str, Sequence[float]],
+            **parameters: Any) -> Dict[str, Any]:
+    """Policies for every combination of the grid values.
+
+    grid maps parameter names to the values to try, e.g.
+    {'service_level': [0.9, 0.95, 0.99], 'lead_time': [5, 7, 14]}. Other
+    parameters are fixed from the keyword arguments (scalars or per-SKU
+    arrays). Returns the scenarios and each metric as a scenarios x SKUs
+    array, from a single broadcast compute_policies call.
+    """
+    _check_parameters(grid)
+    _check_parameters(parameters)
+    names = list(grid)
+    scenarios = np.array(list(itertools.product(*(grid[name] for name in names))), dtype=np.float64)
+    swept = {name: scenarios[:, [column]] for column, name in enumerate(names)}
+    fixed = {name: np.asarray(value, dtype=np.float64)[None, ...] for name, value in parameters.items()
+             if name not in swept}
+
+    policy = compute_policies(np.asarray(mean_demand, dtype=np.float64)[None, ...],
+                              np.asarray(std_demand, dtype=np.float64)[None, ...], **fixed, **swept)
+    return {
+        'scenarios': [dict(zip(names, row)) for row in scenarios.tolist()],
+        **{metric: policy[metric] for metric in POLICY_METRICS},
+    }
+
+
+def _per_product(values: Optional[Dict[str, float]], product_ids: Sequence[str], default: float) -> np.ndarray:
+    """Array of per-product overrides (e.g. lead times), default where none is given."""
+    values = values or {}
+    return np.array([float(values.get(product_id, default)) for product_id in product_ids])
+
+
+def catalogue_policies(product_ids: Union[str, Sequence[str]] = 'all', history_days: Optional[int] = None,
+                       lead_times: Optional[Dict[str, float]] = None, sweep: Optional[Dict[str, Sequence[float]]] = None,
+                       **parameters: Any) -> Dict[str, Any]:
+    """Replenishment table for many products from one sales aggregation.
+
+    Demand stats count days without sales as zero demand, from each
+    product's own first sale on. lead_times maps
+    product IDs to their own lead time; other parameters apply to every
+    product. With sweep the metrics become scenarios x products lists (see
+    what_if). Returns columnar lists keyed by 'product_id' and metric name,
+    or an {"error": ...} dict.
+    """
+    try:
+        _check_parameters(parameters)
+        if sweep:
+            _check_parameters(sweep)
+        object_ids = None
+        if product_ids and product_ids != 'all':
+            try:
+                object_ids = [ObjectId(product_id) for product_id in product_ids]
+            except Exception as e:
+                return {"error": f"Invalid product ID format: {str(e)}"}
+
+        with stage('fetch'):
+            sales_by_product = fetch_daily_sales_by_product(get_database()['sales'], object_ids)
+        ids = sorted(sales_by_product) if object_ids is None else [str(product_id) for product_id in object_ids]
+        if not ids:
+            return {"error": "No sales data found."}
+
+        dates, demand = daily_matrix(sales_by_product, ids, history_days, from_first_sale=True)
+        if len(dates) < 2:
+            return {"error": "Not enough sales data. At least 2 days of sales are required."}
+        mean_demand, std_demand = demand_stats(demand)
+        if lead_times:
+            parameters['lead_time'] = _per_product(lead_times, ids, parameters.get('lead_time', DEFAULT_LEAD_TIME))
+        log.info("Computing policies for %s products over %s days", len(ids), len(dates))
+
+        with stage('policy'):
+            if sweep:
+                table = what_if(mean_demand, std_demand, sweep, **parameters)
+                metrics = {metric: table[metric].tolist() for metric in POLICY_METRICS}
+                return {'product_id': ids, 'mean_demand': mean_demand.tolist(), 'std_demand': std_demand.tolist(),
+                        'scenarios': table['scenarios'], **metrics}
+            policy = compute_policies(mean_demand, std_demand, **parameters)
+        return {'product_id': ids, **{name: values.tolist() for name, values in policy.items()}}
+    except ValueError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        error_msg = f"Error computing inventory policies: {str(e)}"
+        print(f"{error_msg}\n{traceback.format_exc()}", file=sys.stderr)
+        return {"error": error_msg}
@@ -0,0 +1,235 @@
+"""Monte Carlo evaluation of (s, Q) reorder policies.
+
+Demand paths are the fitted model's forecast plus in-sample residuals
+resampled in 7-day blocks (a moving block bootstrap, so weekly patterns in
+the errors survive). Residuals come from the cached SARIMAX fit of the stock
+optimization forecast or, with model='prophet', from the Prophet fit.
+
+simulate_policies() then runs every path and every candidate policy at once:
+the state is a policies x paths array and only the days are iterated. Each
+day received orders are booked, demand is served from stock (unmet demand is
+lost), and an order of Q arrives lead_time days later whenever the inventory
+position drops to s or below.
+
+Reported per policy, averaged over the paths:
+
+    fill_rate      share of demand served from stock
+    stockout_days  days with unmet demand
+    holding_cost   holding cost over the horizon (holding_cost per unit per year)
+    orders         orders placed
+
+simulate_catalogue() evaluates many SKUs from one sales aggregation, one SKU
+per process.
+"""
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from diagnostics import get_logger, stage
+from inventory_policy import DAYS_PER_YEAR, DEFAULT_HOLDING_COST, DEFAULT_LEAD_TIME, compute_policies, demand_stats
+from mongo_connection import get_database
+from sales_series import DailySales, daily_matrix, fetch_daily_sales_by_product, parse_product_ids
+
+log = get_logger('inventory_simulation')
+
+DEFAULT_PATHS = int(os.getenv('SIMULATION_PATHS', 1000))
+# Long enough for several EOQ replenishment cycles
+DEFAULT_HORIZON = 365
+DEFAULT_SERVICE_LEVELS = (0.9, 0.95, 0.98, 0.99)
+DEFAULT_TARGET_FILL_RATE = 0.95
+BLOCK_DAYS = 7
+HISTORY_DAYS = 365
+MIN_HISTORY_DAYS = 14
+# Seconds the SARIMAX fit behind the demand paths may take
+FIT_TIME_BUDGET = float(os.getenv('SIMULATION_FIT_TIME_BUDGET', 5.0))
+# Cache namespace of the demand fits, apart from the stock forecast fits of the same products
+ARIMA_NAMESPACE = 'simulation-arima'
+DEMAND_MODELS = ('arima', 'prophet')
+
+
+def _arima_demand(values: np.ndarray, product_id: Optional[str], horizon: int) -> Tuple[np.ndarray, np.ndarray, str]:
+    from stock_optimization import fit_forecast_model
+    try:
+        results, _, _ = fit_forecast_model(values, product_id, time.monotonic() + FIT_TIME_BUDGET,
+                                          ARIMA_NAMESPACE)
+        return np.asarray(results.get_forecast(horizon).predicted_mean), np.asarray(results.resid), 'arima'
+    except Exception as e:
+        log.warning("ARIMA fit for simulation failed, using the mean demand: %s", e)
+        return np.full(horizon, values.mean()), values - values.mean(), 'mean'
+
+
+def _prophet_demand(values: np.ndarray, dates: np.ndarray, product_id: Optional[str],
+                    horizon: int) -> Tuple[np.ndarray, np.ndarray, str]:
+    import pandas as pd
+    from prophet_models import fit_or_load, window_namespace
+
+    model, _ = fit_or_load(pd.DataFrame({'ds': pd.DatetimeIndex(dates), 'y': values}), product_id,
+                           window_namespace(HISTORY_DAYS))
+    yhat = model.predict(model.make_future_dataframe(periods=horizon))['yhat'].to_numpy()
+    return yhat[-horizon:], values - yhat[:-horizon], 'prophet'
+
+
+def demand_model(values: np.ndarray, dates: np.ndarray, product_id: Optional[str] = None, horizon: int = DEFAULT_HORIZON,
+                 model: str = 'arima') -> Tuple[np.ndarray, np.ndarray, str]:
+    """Point forecast over the horizon, in-sample residuals and the model that produced them."""
+    if model not in DEMAND_MODELS:
+        raise ValueError(f"Unknown demand model '{model}', expected one of {', '.join(DEMAND_MODELS)}")
+    if model == 'prophet':
+        return _prophet_demand(values, dates, product_id, horizon)
+    return _arima_demand(values, product_id, horizon)
+
+
+def sample_demand_paths(forecast: np.ndarray, residuals: np.ndarray, n_paths: int,
+                        rng: np.random.Generator, block: int = BLOCK_DAYS) -> np.ndarray:
+    """paths x horizon demand: forecast plus block-bootstrapped residuals, floored at 0."""
+    horizon = len(forecast)
+    residuals = np.asarray(residuals, dtype=np.float64)
+    residuals = residuals[np.isfinite(residuals)]
+    if len(residuals) == 0:
+        return np.tile(np.maximum(forecast, 0), (n_paths, 1))
+    block = min(block, len(residuals))
+    n_blocks = -(-horizon // block)
+    starts = rng.integers(0, len(residuals) - block + 1, size=(n_paths, n_blocks))
+    indices = (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :horizon]
+    return np.maximum(forecast + residuals[indices], 0)
+
+
+def simulate_policies(demand: np.ndarray, reorder_point: Union[float, np.ndarray], order_quantity: Union[float, np.ndarray],
+                      lead_time: int = DEFAULT_LEAD_TIME, initial_stock: Optional[Union[float, np.ndarray]] = None,
+                      holding_cost: float = DEFAULT_HOLDING_COST) -> Dict[str, np.ndarray]:
+    """Simulate (s, Q) policies over demand paths.
+
+    demand is paths x days; reorder_point and order_quantity hold one value
+    per policy. Stock starts at initial_stock (default s + Q) with nothing
+    on order. Returns per-policy metrics averaged over the paths.
+    """
+    demand = np.asarray(demand, dtype=np.float64)
+    n_paths, horizon = demand.shape
+    s = np.atleast_1d(np.asarray(reorder_point, dtype=np.float64))[:, None]
+    q = np.atleast_1d(np.asarray(order_quantity, dtype=np.float64))[:, None]
+    s, q = np.broadcast_arrays(s, q)
+    shape = (s.shape[0], n_paths)
+    lead_time = max(int(lead_time), 1)
+
+    start = s + q if initial_stock is None else np.atleast_1d(np.asarray(initial_stock, dtype=np.float64))[:, None]
+    on_hand = np.broadcast_to(start, shape).copy()
+    on_order = np.zeros(shape)
+    # Quantities arriving at the start of each day; orders placed on day t land on day t + lead_time
+    arrivals = np.zeros((horizon + lead_time,) + shape)
+    served = np.zeros(shape)
+    stockout_days = np.zeros(shape)
+    stock_days = np.zeros(shape)
+    orders = np.zeros(shape)
+
+    for day in range(horizon):
+        on_hand += arrivals[day]
+        on_order -= arrivals[day]
+        today = demand[:, day]
+        filled = np.minimum(on_hand, today)
+        served += filled
+        stockout_days += today > filled
+        on_hand -= filled
+        stock_days += on_hand
+
+        reorder = on_hand + on_order <= s
+        placed = np.where(reorder, q, 0.0)
+        arrivals[day + lead_time] += placed
+        on_order += placed
+        orders += reorder
+
+    total_demand = demand.sum(axis=1)
+    fill_rate = np.divide(served, total_demand, out=np.ones(shape), where=total_demand > 0)
+    return {
+        'fill_rate': fill_rate.mean(axis=1),
+        'fill_rate_p5': np.percentile(fill_rate, 5, axis=1),
+        'stockout_days': stockout_days.mean(axis=1),
+        'holding_cost': (stock_days * holding_cost / DAYS_PER_YEAR).mean(axis=1),
+        'orders': orders.mean(axis=1),
+    }
+
+
+def evaluate_sku(product_id: Optional[str], sales: DailySales, n_paths: int = DEFAULT_PATHS,
+                 horizon: int = DEFAULT_HORIZON, model: str = 'arima',
+                 service_levels: Sequence[float] = DEFAULT_SERVICE_LEVELS,
+                 target_fill_rate: float = DEFAULT_TARGET_FILL_RATE, seed: Optional[int] = None,
+                 **policy_parameters: Any) -> Dict[str, Any]:
+    """Simulate the analytic policy at each service level for one SKU; runs inside the process pool.
+
+    The recommended policy is the cheapest to hold whose mean fill rate
+    reaches target_fill_rate (the highest fill rate when none does).
+    """
+    try:
+        dates, matrix = daily_matrix({'sku': sales}, ['sku'], HISTORY_DAYS)
+        values = matrix[0]
+        if len(values) < MIN_HISTORY_DAYS:
+            return {'product_id': product_id,
+                    'error': f"Not enough sales data to simulate. Minimum {MIN_HISTORY_DAYS} days required."}
+
+        forecast, residuals, source = demand_model(values, dates, product_id, horizon, model)
+        rng = np.random.default_rng(seed)
+        demand = sample_demand_paths(forecast, residuals, n_paths, rng)
+
+        mean_demand, std_demand = demand_stats(values)
+        levels = np.asarray(service_levels, dtype=np.float64)
+        policy = compute_policies(mean_demand, std_demand, service_level=levels, **policy_parameters)
+        simulated = simulate_policies(demand, policy['reorder_point'], policy['economic_order_quantity'],
+                                      lead_time=policy_parameters.get('lead_time', DEFAULT_LEAD_TIME),
+                                      holding_cost=policy_parameters.get('holding_cost', DEFAULT_HOLDING_COST))
+
+        meets = np.flatnonzero(simulated['fill_rate'] >= target_fill_rate)
+        best = (meets[np.argmin(simulated['holding_cost'][meets])] if len(meets)
+                else int(np.argmax(simulated['fill_rate'])))
+        return {
+            'product_id': product_id,
+            'demand_model': source,
+            'paths': n_paths,
+            'horizon': horizon,
+            'policies': {
+                'service_level': levels.tolist(),
+                'reorder_point': policy['reorder_point'].tolist(),
+                'order_quantity': policy['economic_order_quantity'].tolist(),
+                **{name: values.tolist() for name, values in simulated.items()},
+            },
+            'recommended': int(best),
+        }
+    except Exception as e:
+        error_msg = f"Error in policy simulation: {str(e)}"
+        print(f"{error_msg} for product {product_id}\n{traceback.format_exc()}", file=sys.stderr)
+        return {'product_id': product_id, 'error': error_msg}
+
+
+def _evaluate_with_options(product_id: str, sales: DailySales, options: Dict[str, Any]) -> Dict[str, Any]:
+    return evaluate_sku(product_id, sales, **options)
+
+
+def simulate_catalogue(product_ids: Union[str, Sequence[str]] = 'all', max_workers: Optional[int] = None,
+                       **options: Any) -> List[Dict[str, Any]]:
+    """evaluate_sku for many products from one sales aggregation, in parallel across SKUs.
+
+    options are passed to evaluate_sku; a seed makes each SKU's paths
+    reproducible. Requested IDs that are not valid ObjectIds get an error
+    entry of their own.
+    """
+    object_ids, invalid = parse_product_ids(product_ids)
+    results = [{'product_id': product_id, 'error': f"Invalid product ID format: {product_id}"}
+               for product_id in invalid]
+    with stage('fetch'):
+        sales_by_product = fetch_daily_sales_by_product(get_database()['sales'], object_ids)
+    if object_ids is not None:
+        for product_id in object_ids:
+            sales_by_product.setdefault(str(product_id), DailySales.empty())
+
+    ids = sorted(sales_by_product)
+    sales = [sales_by_product[product_id] for product_id in ids]
+    workers = max_workers or os.cpu_count() or 1
+    with stage('simulate'):
+        if workers <= 1 or len(ids) <= 1:
+            return results + [evaluate_sku(product_id, data, **options) for product_id, data in zip(ids, sales)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return results + list(executor.map(_evaluate_with_options, ids, sales, repeat(options)))
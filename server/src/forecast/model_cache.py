@@ -0,0 +1,188 @@
+"""On-disk cache of fitted ARIMA/SARIMAX models.
+
+Entries are keyed by product ID plus a fingerprint of the input series, so a
+product whose sales have not changed skips the order grid search and refit.
+Each entry stores the selected order, fitted parameters, AIC/BIC and residual
+statistics as a small JSON file. The cache is bounded by entry count and total
+size (least recently used entries are evicted first) and entries expire after
+a TTL.
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import tempfile
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'models')
+# Puts between directory scans even when the running totals are within bounds; other
+# processes write to the same directory and this process' totals do not see their entries
+EVICT_INTERVAL = 100
+# A scan that has to evict trims the cache to this share of its bounds, so a full cache
+# is not rescanned on every following put
+EVICT_TARGET = 0.9
+
+
+def series_fingerprint(series: Any) -> str:
+    """Hash the values (and the dates, when the series has a DatetimeIndex) of a series."""
+    digest = hashlib.sha1()
+    values = np.ascontiguousarray(np.asarray(series, dtype=np.float64))
+    digest.update(values.tobytes())
+    index = getattr(series, 'index', None)
+    if index is not None and hasattr(index, 'asi8'):
+        digest.update(np.ascontiguousarray(index.asi8).tobytes())
+    return digest.hexdigest()
+
+
+def fitted_record(results: Any, order: tuple) -> Dict[str, Any]:
+    """Build a cache entry from a statsmodels results object."""
+    resid = np.asarray(results.resid, dtype=np.float64)
+    return {
+        'order': [int(v) for v in order],
+        'params': [float(v) for v in np.asarray(results.params)],
+        'aic': float(results.aic),
+        'bic': float(results.bic),
+        'residuals_mean': float(np.mean(resid)),
+        'residuals_std': float(np.std(resid)),
+    }
+
+
+class ModelCache:
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.cache_dir = cache_dir or os.getenv('MODEL_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_entries = max_entries or int(os.getenv('MODEL_CACHE_MAX_ENTRIES', 5000))
+        self.max_bytes = max_bytes or int(os.getenv('MODEL_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+        self.ttl_seconds = ttl_seconds or float(os.getenv('MODEL_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+        self.enabled = os.getenv('MODEL_CACHE_DISABLED', '') not in ('1', 'true')
+        # Entry count and size as of the last scan plus what this process wrote since;
+        # None until the first put scans the directory
+        self._entries: Optional[int] = None
+        self._bytes = 0
+        self._puts_since_scan = 0
+
+    def key(self, namespace: str, product_id: Optional[str], series: Any, **params: Any) -> str:
+        """Cache key for one model kind, product and series; params hold the search settings."""
+        digest = hashlib.sha1(series_fingerprint(series).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return f"{self.product_key(namespace, product_id)}-{digest.hexdigest()[:24]}"
+
+    @staticmethod
+    def product_key(namespace: str, product_id: Optional[str]) -> str:
+        """Key for entries that hold one model per product regardless of series version."""
+        product_part = re.sub(r'[^A-Za-z0-9_]', '_', str(product_id)) if product_id else 'anonymous'
+        return f"{namespace}-{product_part}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get('created_at', 0) > self.ttl_seconds:
+            self._remove(path)
+            return None
+
+        # Touch the file so eviction sees it as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['record']
+
+    def put(self, key: str, record: Dict[str, Any], created_at: Optional[float] = None) -> None:
+        """Store a record; created_at (default now) starts its TTL."""
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temp file first so concurrent readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'created_at': time.time() if created_at is None else created_at, 'record': record}, f)
+                size = f.tell()
+            os.replace(tmp_path, self._path(key))
+            self._note_write(size)
+        except OSError as e:
+            print(f"Model cache write failed for {key}: {str(e)}", file=sys.stderr)
+
+    def _note_write(self, size: int) -> None:
+        """Scan and evict only when the running totals pass a bound or EVICT_INTERVAL puts went by.
+
+        Overwritten keys count as new entries, so the totals err high and
+        at worst trigger an early scan, which resets them.
+        """
+        self._puts_since_scan += 1
+        if self._entries is not None:
+            self._entries += 1
+            self._bytes += size
+            if self._entries <= self.max_entries and self._bytes <= self.max_bytes \
+                    and self._puts_since_scan < EVICT_INTERVAL:
+                return
+        self.evict()
+
+    def evict(self) -> None:
+        """Drop least recently used entries until the cache is within its size bounds."""
+        self._puts_since_scan = 0
+        try:
+            names = [name for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+        except OSError:
+            return
+
+        entries = []
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        max_entries, max_bytes = self.max_entries, self.max_bytes
+        if len(entries) > max_entries or total_bytes > max_bytes:
+            max_entries, max_bytes = int(max_entries * EVICT_TARGET), int(max_bytes * EVICT_TARGET)
+        while entries and (len(entries) > max_entries or total_bytes > max_bytes):
+            _, size, path = entries.pop(0)
+            total_bytes -= size
+            self._remove(path)
+        self._entries, self._bytes = len(entries), total_bytes
+
+    def clear(self) -> None:
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            self._remove(os.path.join(self.cache_dir, name))
+        self._entries, self._bytes = 0, 0
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_default_cache: Optional[ModelCache] = None
+
+
+def get_model_cache() -> ModelCache:
+    """Process-wide cache instance configured from the environment."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ModelCache()
+    return _default_cache
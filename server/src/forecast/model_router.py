@@ -0,0 +1,236 @@
+"""Per-SKU choice between the forecasting paths.
+
+Each series is classified from cheap statistics: its length, the
+Syntetos-Boylan demand class (average interval between selling days and
+squared CV of the sizes on those days), weekly seasonal strength and the CV
+and weekday pattern reported by analyze_sales_patterns. The class decides
+which models are worth trying, cheapest first:
+
+    fewer than MIN_MODEL_DAYS days   moving_average
+    intermittent or lumpy            croston, arima
+    seasonal, PROPHET_MIN_DAYS+      moving_average, arima, prophet
+    otherwise                        moving_average, arima
+
+Candidates are backtested in that order (see backtest.py). The first one
+whose out-of-sample MASE meets ROUTER_MASE_TARGET is chosen; when none does,
+the most accurate one tried. Decisions are cached per product and reused
+until the series has grown by ROUTE_REFRESH_DAYS days or the cache entry
+expires, so a product is only re-evaluated now and then and the long tail
+never pays for a Prophet fit. stream_route() writes each product's decision
+as soon as it is made.
+"""
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from backtest import backtest_model
+from croston import croston_forecast
+from diagnostics import get_logger, stage
+from model_cache import get_model_cache
+from mongo_connection import get_database
+from ndjson import date_strings
+from sales_patterns import pattern_statistics
+from sales_series import DailySales, daily_matrix, fetch_daily_sales_by_product, parse_product_ids
+
+log = get_logger('model_router')
+
+# Relative cost order of the forecasting paths
+MODEL_COSTS = ('moving_average', 'croston', 'arima', 'prophet')
+MIN_MODEL_DAYS = 60
+PROPHET_MIN_DAYS = 180
+# Syntetos-Boylan cut-offs
+ADI_CUTOFF = 1.32
+CV2_CUTOFF = 0.49
+SEASONAL_STRENGTH_CUTOFF = 0.3
+MASE_TARGET = float(os.getenv('ROUTER_MASE_TARGET', 1.0))
+ROUTE_REFRESH_DAYS = int(os.getenv('ROUTE_REFRESH_DAYS', 28))
+HISTORY_DAYS = 730
+BACKTEST_HORIZON = 14
+BACKTEST_FOLDS = 3
+DEFAULT_HORIZON = 30
+# Seconds the ARIMA forecast of a routed SKU may take
+ARIMA_TIME_BUDGET = float(os.getenv('FORECAST_TIME_BUDGET', 2.0))
+NAMESPACE = 'model-route'
+# Cache namespace of the routed ARIMA forecasts, apart from the stock forecast fits of the same products
+ARIMA_NAMESPACE = 'route-arima'
+
+
+def demand_class(adi: float, cv2: float) -> str:
+    if adi < ADI_CUTOFF:
+        return 'smooth' if cv2 < CV2_CUTOFF else 'erratic'
+    return 'intermittent' if cv2 < CV2_CUTOFF else 'lumpy'
+
+
+def series_features(dates: np.ndarray, values: np.ndarray) -> Dict[str, Any]:
+    """Length, demand class, volatility and weekly seasonal strength of a zero-filled daily series."""
+    report = pattern_statistics(dates, values)
+    sizes = values[values > 0]
+    adi = len(values) / len(sizes) if len(sizes) else float('inf')
+    cv2 = float((sizes.std() / sizes.mean()) ** 2) if len(sizes) else 0.0
+
+    # Share of the variance explained by the weekday means from the pattern report
+    weekday_means = np.zeros(7)
+    for weekday, mean in report['seasonality']['daily_patterns'].items():
+        weekday_means[int(weekday)] = mean
+    weekdays = (dates.astype('datetime64[D]').astype(np.int64) + 3) % 7
+    variance = values.var()
+    seasonal_strength = max(0.0, 1 - (values - weekday_means[weekdays]).var() / variance) if variance > 0 else 0.0
+
+    return {
+        'days': len(values),
+        'selling_days': int(len(sizes)),
+        'adi': float(adi) if np.isfinite(adi) else None,
+        'cv2': cv2,
+        'demand_class': demand_class(adi, cv2),
+        'cv': report['volatility']['coefficient_of_variation'],
+        'volatility_level': report['volatility']['volatility_level'],
+        'seasonal_strength': float(seasonal_strength),
+    }
+
+
+def candidate_models(features: Dict[str, Any]) -> List[str]:
+    """Models worth backtesting for these features, cheapest first."""
+    if features['days'] < MIN_MODEL_DAYS:
+        return ['moving_average']
+    if features['demand_class'] in ('intermittent', 'lumpy'):
+        return ['croston', 'arima']
+    if features['seasonal_strength'] >= SEASONAL_STRENGTH_CUTOFF and features['days'] >= PROPHET_MIN_DAYS:
+        return ['moving_average', 'arima', 'prophet']
+    return ['moving_average', 'arima']
+
+
+def choose_model(product_id: Optional[str], dates: np.ndarray, values: np.ndarray,
+                 candidates: Sequence[str]) -> Dict[str, Any]:
+    """Backtest candidates cheapest first and stop at the first one meeting the MASE target."""
+    if len(candidates) == 1:
+        return {'model': candidates[0], 'reason': 'only candidate', 'scores': {}}
+    scores: Dict[str, Dict[str, Any]] = {}
+    for model in candidates:
+        result = backtest_model(product_id, model, dates, values, BACKTEST_HORIZON, BACKTEST_FOLDS)
+        scores[model] = {name: result.get(name) for name in ('mase', 'mape', 'elapsed_ms', 'error')
+                         if result.get(name) is not None}
+        if result.get('mase') is not None and result['mase'] <= MASE_TARGET:
+            return {'model': model, 'reason': f"cheapest model with MASE <= {MASE_TARGET}", 'scores': scores}
+
+    scored = [(scores[model]['mase'], model) for model in candidates if 'mase' in scores[model]]
+    if not scored:
+        return {'model': candidates[0], 'reason': 'no candidate could be backtested', 'scores': scores}
+    return {'model': min(scored)[1], 'reason': 'lowest MASE; none met the target', 'scores': scores}
+
+
+def route_series(dates: np.ndarray, values: np.ndarray, product_id: Optional[str] = None,
+                 refresh: bool = False) -> Dict[str, Any]:
+    """Model decision for a zero-filled daily series, reused from the cache while still fresh."""
+    cache = get_model_cache()
+    key = cache.product_key(NAMESPACE, product_id)
+    last_date = str(dates[-1])
+    if product_id and not refresh:
+        cached = cache.get(key)
+        if cached and 0 <= (dates[-1] - np.datetime64(cached['last_date'])).astype(int) < ROUTE_REFRESH_DAYS:
+            return {**cached['decision'], 'source': 'cached'}
+
+    features = series_features(dates, values)
+    decision = {'features': features, **choose_model(product_id, dates, values, candidate_models(features))}
+    if product_id:
+        cache.put(key, {'last_date': last_date, 'decision': decision})
+    return {**decision, 'source': 'routed'}
+
+
+def forecast_with(model: str, dates: np.ndarray, values: np.ndarray, horizon: int = DEFAULT_HORIZON,
+                  product_id: Optional[str] = None) -> np.ndarray:
+    """Daily forecast over the horizon from the chosen model; ARIMA falls back to the moving average."""
+    if model == 'croston':
+        return croston_forecast(values, horizon)
+    if model == 'arima':
+        from stock_optimization import fit_forecast_model
+        try:
+            results, _, _ = fit_forecast_model(values, product_id, time.monotonic() + ARIMA_TIME_BUDGET,
+                                              ARIMA_NAMESPACE)
+            return np.maximum(np.asarray(results.get_forecast(horizon).predicted_mean), 0)
+        except Exception as e:
+            log.warning("ARIMA forecast for %s failed, using moving average: %s", product_id, e)
+    elif model == 'prophet':
+        import pandas as pd
+        from prophet_models import fit_or_load, window_namespace
+        prophet, _ = fit_or_load(pd.DataFrame({'ds': pd.DatetimeIndex(dates), 'y': values}), product_id,
+                                 window_namespace(HISTORY_DAYS))
+        future = pd.DataFrame({'ds': pd.DatetimeIndex(np.arange(dates[-1] + 1, dates[-1] + 1 + horizon))})
+        return np.maximum(prophet.predict(future)['yhat'].to_numpy(), 0)
+    return np.full(horizon, values[-7:].mean())
+
+
+def route_product(product_id: str, sales: DailySales, horizon: Optional[int] = None,
+                  refresh: bool = False) -> Dict[str, Any]:
+    """Route one product and, with a horizon, forecast it with the chosen model; runs inside the process pool."""
+    try:
+        dates, matrix = daily_matrix({product_id: sales}, [product_id], HISTORY_DAYS)
+        values = matrix[0]
+        if len(values) < 7:
+            return {'product_id': product_id, 'error': "Not enough sales data to route. Minimum 7 days required."}
+        result: Dict[str, Any] = {'product_id': product_id,
+                                  'route': route_series(dates, values, product_id, refresh)}
+        if horizon:
+            with stage('model'):
+                forecast = forecast_with(result['route']['model'], dates, values, horizon, product_id)
+            result['forecast'] = {
+                'date': date_strings(np.arange(dates[-1] + 1, dates[-1] + 1 + horizon)),
+                'forecasted_quantity': forecast.tolist(),
+            }
+        return result
+    except Exception as e:
+        error_msg = f"Error routing product: {str(e)}"
+        print(f"{error_msg} {product_id}\n{traceback.format_exc()}", file=sys.stderr)
+        return {'product_id': product_id, 'error': error_msg}
+
+
+def route_products(product_ids: Union[str, Sequence[str]] = 'all', horizon: Optional[int] = None,
+                   refresh: bool = False, max_workers: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Model decision (and forecast, with a horizon) of each product from one sales aggregation, as it finishes.
+
+    Requested IDs that are not valid ObjectIds are yielded first, with an error.
+    """
+    object_ids, invalid = parse_product_ids(product_ids)
+    for product_id in invalid:
+        yield {'product_id': product_id, 'error': f"Invalid product ID format: {product_id}"}
+    with stage('fetch'):
+        sales_by_product = fetch_daily_sales_by_product(get_database()['sales'], object_ids)
+    if object_ids is not None:
+        for product_id in object_ids:
+            sales_by_product.setdefault(str(product_id), DailySales.empty())
+
+    ids = sorted(sales_by_product)
+    workers = max_workers or os.cpu_count() or 1
+    if workers <= 1 or len(ids) <= 1:
+        for product_id in ids:
+            yield route_product(product_id, sales_by_product[product_id], horizon, refresh)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(route_product, product_id, sales_by_product[product_id], horizon, refresh)
+                   for product_id in ids]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def route_catalogue(product_ids: Union[str, Sequence[str]] = 'all', horizon: Optional[int] = None,
+                    refresh: bool = False, max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Model decisions (and forecasts, with a horizon) for many products from one sales aggregation."""
+    return list(route_products(product_ids, horizon, refresh, max_workers))
+
+
+def stream_route(writer: Any, product_ids: Union[str, Sequence[str]] = 'all', horizon: Optional[int] = None,
+                 refresh: bool = False, max_workers: Optional[int] = None) -> None:
+    """A 'product' section per routed product as soon as it finishes, or an error record."""
+    counts = {'products': 0, 'failed': 0}
+    for result in route_products(product_ids, horizon, refresh, max_workers):
+        if 'error' in result:
+            counts['failed'] += 1
+            writer.error(result['error'], product_id=result['product_id'])
+            continue
+        counts['products'] += 1
+        writer.section('product', result)
+    writer.end(**counts)
@@ -0,0 +1,76 @@
+"""Process-wide pooled MongoDB client for the forecasting scripts.
+
+One MongoClient per process, created lazily on first use and reused by every
+call, with pool size and timeouts taken from the environment:
+
+    DATABASE_URL                       connection string (default mongodb://localhost:27017)
+    MONGO_DB_NAME                      database name (default dev)
+    MONGO_MAX_POOL_SIZE                connections per client (default 20)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS  default 5000
+    MONGO_CONNECT_TIMEOUT_MS           default 5000
+    MONGO_SOCKET_TIMEOUT_MS            default 60000
+
+MongoClient is thread-safe but not fork-safe, so a forked child (for example
+a process pool worker) drops the inherited client and builds its own.
+"""
+import os
+import threading
+from typing import Optional
+
+from pymongo import MongoClient
+from pymongo.database import Database
+
+_client: Optional[MongoClient] = None
+_client_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def _create_client() -> MongoClient:
+    return MongoClient(
+        os.getenv('DATABASE_URL', 'mongodb://localhost:27017'),
+        maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', 20)),
+        serverSelectionTimeoutMS=int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+        connectTimeoutMS=int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+        socketTimeoutMS=int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 60000)),
+        # Lazy connect: nothing touches the network until the first operation
+        connect=False,
+    )
+
+
+def get_client() -> MongoClient:
+    """Shared client for this process; safe to call from any thread."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            _client = _create_client()
+            _client_pid = pid
+    return _client
+
+
+def get_database(name: Optional[str] = None) -> Database:
+    return get_client()[name or os.getenv('MONGO_DB_NAME', 'dev')]
+
+
+def close_client() -> None:
+    """Close the shared client, e.g. on worker shutdown."""
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def _reset_after_fork() -> None:
+    # The parent's sockets and monitor threads are unusable here; forget them without closing
+    global _client, _client_pid, _lock
+    _client = None
+    _client_pid = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,144 @@
+"""Streaming NDJSON output for the forecasting scripts.
+
+Each line is one JSON object with a "type" field:
+
+    {"type": "point", "ds": "2024-01-01", "yhat": 12.3}          forecast points
+    {"type": "anomaly", "date": "...", "actual_value": ...}      flagged days
+    {"type": "section", "name": "optimal_levels", "data": {...}} metric groups
+    {"type": "error", "error": "..."}
+    {"type": "end"}                                              always last
+
+Column data (dates, floats) is encoded a whole column at a time: numbers go
+through one json.dumps call per column instead of one per value, and no
+per-row dicts are built. NaN and infinities are written as null.
+"""
+import sys
+import json
+from typing import Any, Iterator, List, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 1000
+
+
+def to_builtin(value: Any) -> Any:
+    """json.dumps fallback for NumPy and pandas scalars."""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def without_nan(value: Any) -> Any:
+    """Copy of a JSON-like value with NaN and infinities (also inside arrays) replaced by None."""
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    if isinstance(value, np.ndarray):
+        return without_nan(value.tolist())
+    if isinstance(value, Mapping):
+        return {key: without_nan(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [without_nan(item) for item in value]
+    return value
+
+
+def dumps(value: Any) -> str:
+    """Strict JSON: non-finite numbers become null instead of the NaN token JSON.parse rejects."""
+    try:
+        return json.dumps(value, default=to_builtin, allow_nan=False)
+    except ValueError:
+        # Only values that actually hold NaN pay for the copy
+        return json.dumps(without_nan(value), default=to_builtin, allow_nan=False)
+
+
+def date_strings(values: Any) -> List[str]:
+    """YYYY-MM-DD strings for datetime-like values, converted in one vectorized call."""
+    days = np.asarray(pd.DatetimeIndex(values).values).astype('datetime64[D]')
+    return np.datetime_as_string(days).tolist()
+
+
+def encode_column(values: Any) -> List[str]:
+    """JSON text for every value of a column."""
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.to_numpy()
+    array = np.asarray(values)
+    if array.dtype.kind in 'Mm' or isinstance(values, pd.DatetimeIndex):
+        # ISO dates never need escaping
+        return [f'"{text}"' for text in date_strings(array)]
+    if array.dtype.kind in 'fiub':
+        if array.dtype.kind == 'f':
+            array = np.where(np.isfinite(array), array, np.nan)
+        # One C-level dumps for the whole column, then split; numbers never contain ", "
+        text = json.dumps(array.tolist())[1:-1]
+        cells = text.split(', ') if text else []
+        return ['null' if cell == 'NaN' else cell for cell in cells]
+    return [dumps(value) for value in array.tolist()]
+
+
+def encode_rows(record_type: str, columns: Mapping[str, Any], **fields: Any) -> Iterator[str]:
+    """One NDJSON line (without the newline) per row of the given columns.
+
+    fields are constant values added to every line, e.g. product_id.
+    """
+    prefix = dumps({'type': record_type, **fields})[:-1]
+    names = [json.dumps(name) for name in columns]
+    encoded = [encode_column(values) for values in columns.values()]
+    for row in zip(*encoded):
+        yield prefix + ''.join(f", {name}: {cell}" for name, cell in zip(names, row)) + '}'
+
+
+class NDJSONWriter:
+    """Writes typed NDJSON records to a stream as soon as they are produced.
+
+    prefix and suffix wrap every line, which lets the worker tag records with
+    their request id without re-encoding them. The stream is flushed after
+    each record and every CHUNK_ROWS rows.
+    """
+
+    def __init__(self, stream: Any = None, prefix: str = '', suffix: str = ''):
+        self.stream = stream or sys.stdout
+        self.prefix = prefix
+        self.suffix = suffix + '\n'
+        self.closed = False
+
+    def _write(self, line: str) -> None:
+        self.stream.write(self.prefix + line + self.suffix)
+
+    def record(self, record_type: str, **fields: Any) -> None:
+        self._write(dumps({'type': record_type, **fields}))
+        self.stream.flush()
+
+    def rows(self, record_type: str, columns: Mapping[str, Any], **fields: Any) -> None:
+        for count, line in enumerate(encode_rows(record_type, columns, **fields), 1):
+            self._write(line)
+            if count % CHUNK_ROWS == 0:
+                self.stream.flush()
+        self.stream.flush()
+
+    def section(self, name: str, data: Any) -> None:
+        self.record('section', name=name, data=data)
+
+    def error(self, message: str, **fields: Any) -> None:
+        self.record('error', error=message, **fields)
+
+    def end(self, **fields: Any) -> None:
+        if not self.closed:
+            self.closed = True
+            self.record('end', **fields)
+
+
+def wants_ndjson(argv: Sequence[str]) -> bool:
+    """True when a CLI was started with --ndjson."""
+    return '--ndjson' in argv
+
+
+def strip_flags(argv: Sequence[str]) -> List[str]:
+    return [arg for arg in argv if not arg.startswith('--')]
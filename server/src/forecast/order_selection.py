@@ -0,0 +1,237 @@
+"""Shared ARIMA order selection engine.
+
+Fits (p, d, q) candidates in a process pool, in waves of increasing model
+size. Candidates whose simpler neighbours failed to fit, or whose neighbours'
+AIC is far above the best found so far, are pruned before they are fitted.
+Differencing and ADF stationarity results are computed once per series and
+reused across candidates and callers. When the time budget runs out the best
+order found so far is returned.
+"""
+import os
+import sys
+import time
+import atexit
+import hashlib
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_TIME_BUDGET = float(os.getenv('ORDER_SEARCH_TIME_BUDGET', 30))
+DEFAULT_AIC_MARGIN = float(os.getenv('ORDER_SEARCH_AIC_MARGIN', 10))
+# Forecast worker processes the Node server runs side by side; they share the CPUs
+WORKER_POOL_SIZE = max(int(os.getenv('FORECAST_WORKER_POOL_SIZE', 1)), 1)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_differencing_memo: Dict[Tuple[str, int], Tuple[np.ndarray, int]] = {}
+
+
+def _memo_key(data: Any) -> str:
+    values = np.ascontiguousarray(np.asarray(data, dtype=np.float64))
+    return hashlib.sha1(values.tobytes()).hexdigest()
+
+
+def difference_series(data: Any, max_d: int = 2, threshold: float = 0.05) -> Tuple[np.ndarray, int]:
+    """Difference the series until the ADF test calls it stationary.
+
+    Returns the differenced values and the number of differences applied.
+    Results are memoized per series so repeated searches do not rerun the tests.
+    """
+    key = (_memo_key(data), max_d)
+    if key in _differencing_memo:
+        return _differencing_memo[key]
+
+    from statsmodels.tsa.stattools import adfuller
+
+    diff_data = np.asarray(data, dtype=np.float64)
+    d = 0
+    while d < max_d:
+        try:
+            if adfuller(diff_data)[1] < threshold:
+                break
+        except Exception:
+            # Too short or constant to test; treat as stationary
+            break
+        diff_data = np.diff(diff_data)
+        d += 1
+
+    if len(_differencing_memo) > 256:
+        _differencing_memo.clear()
+    _differencing_memo[key] = (diff_data, d)
+    return diff_data, d
+
+
+def _fit_candidate(data: Any, order: tuple, model_kind: str, model_kwargs: Dict[str, Any],
+                   fit_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Fit one candidate; runs in a pool process and returns a picklable record."""
+    from model_cache import fitted_record
+    warnings.filterwarnings('ignore')
+
+    if model_kind == 'arima':
+        from statsmodels.tsa.arima.model import ARIMA
+        results = ARIMA(data, order=order, **model_kwargs).fit(**fit_kwargs)
+    else:
+        from statsmodels.tsa.statespace.sarimax import SARIMAX
+        results = SARIMAX(data, order=order, **model_kwargs).fit(disp=False, **fit_kwargs)
+
+    record = fitted_record(results, order)
+    if not np.isfinite(record['aic']):
+        raise ValueError(f"Non-finite AIC for order {order}")
+    return record
+
+
+def default_workers() -> int:
+    """ORDER_SEARCH_WORKERS, or this process' share of the CPUs among the forecast worker processes."""
+    return int(os.getenv('ORDER_SEARCH_WORKERS', 0)) or (os.cpu_count() or 1) // WORKER_POOL_SIZE
+
+
+def _get_executor(max_workers: Optional[int]) -> Optional[ProcessPoolExecutor]:
+    """Process-wide pool, recreated after a fork or a timed-out search; None inside pool children."""
+    global _executor, _executor_pid
+    if multiprocessing.parent_process() is not None:
+        # Already running inside a pool process (forecast_batch, route_catalogue, anomaly_batch):
+        # the batch pool uses the CPUs, and nesting pools would oversubscribe them
+        return None
+    if _executor is None or _executor_pid != os.getpid():
+        workers = max_workers or default_workers()
+        if workers <= 1:
+            return None
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _reset_executor() -> None:
+    """Terminate the pool; cancel() cannot stop fits that are already running, and later
+    searches would queue behind them. The next search starts a fresh pool."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        return
+    processes = list((getattr(_executor, '_processes', None) or {}).values())
+    _executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+    _executor, _executor_pid = None, None
+
+
+@atexit.register
+def _shutdown_executor() -> None:
+    if _executor is not None and _executor_pid == os.getpid():
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _parents(order: tuple) -> List[tuple]:
+    p, d, q = order
+    parents = []
+    if p > 0:
+        parents.append((p - 1, d, q))
+    if q > 0:
+        parents.append((p, d, q - 1))
+    return parents
+
+
+def _should_prune(order: tuple, outcomes: Dict[tuple, Optional[float]], best_aic: float,
+                  aic_margin: float, candidate_set: set) -> bool:
+    """Prune when every simpler neighbour in the grid failed, was pruned, or sits well above the best AIC."""
+    parents = [parent for parent in _parents(order) if parent in candidate_set]
+    if not parents:
+        return False
+    for parent in parents:
+        aic = outcomes.get(parent)
+        if aic is not None and aic <= best_aic + aic_margin:
+            return False
+    return True
+
+
+def select_order(data: Any, candidates: Iterable[tuple], model_kind: str = 'sarimax',
+                 model_kwargs: Optional[Dict[str, Any]] = None, fit_kwargs: Optional[Dict[str, Any]] = None,
+                 time_budget: Optional[float] = None, aic_margin: Optional[float] = None,
+                 max_workers: Optional[int] = None, max_d: Optional[int] = None) -> Dict[str, Any]:
+    """Search candidate (p, d, q) orders and return the lowest-AIC fit.
+
+    model_kind is 'sarimax' (statsmodels SARIMAX) or 'arima' (statsmodels ARIMA).
+    When max_d is given, d values above the ADF-selected differencing order are
+    skipped as over-differenced.
+
+    Returns a dict with the best fitted record ('order', 'params', 'aic', 'bic',
+    residual stats) under 'best' (None if nothing fitted) plus search counters.
+    """
+    model_kwargs = model_kwargs or {}
+    fit_kwargs = fit_kwargs or {}
+    time_budget = DEFAULT_TIME_BUDGET if time_budget is None else time_budget
+    aic_margin = DEFAULT_AIC_MARGIN if aic_margin is None else aic_margin
+    deadline = time.monotonic() + time_budget
+
+    candidates = [tuple(int(v) for v in order) for order in candidates]
+    if max_d is not None:
+        _, selected_d = difference_series(data, max_d)
+        candidates = [order for order in candidates if order[1] <= selected_d]
+    candidate_set = set(candidates)
+
+    # Waves of increasing p + q: simpler models are fitted first and bound the larger ones
+    waves: Dict[int, List[tuple]] = {}
+    for order in candidates:
+        waves.setdefault(order[0] + order[2], []).append(order)
+
+    outcomes: Dict[tuple, Optional[float]] = {}
+    best: Optional[Dict[str, Any]] = None
+    stats = {'fitted': 0, 'failed': 0, 'pruned': 0, 'timed_out': False}
+    executor = _get_executor(max_workers)
+
+    for size in sorted(waves):
+        best_aic = best['aic'] if best else float('inf')
+        wave = []
+        for order in waves[size]:
+            if _should_prune(order, outcomes, best_aic, aic_margin, candidate_set):
+                outcomes[order] = None
+                stats['pruned'] += 1
+            else:
+                wave.append(order)
+
+        records = []
+        if executor is not None:
+            futures = {
+                executor.submit(_fit_candidate, data, order, model_kind, model_kwargs, fit_kwargs): order
+                for order in wave
+            }
+            pending = set(futures)
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        records.append(future.result())
+                    except Exception:
+                        outcomes[futures[future]] = None
+                        stats['failed'] += 1
+            if pending:
+                _reset_executor()
+                executor = None
+                stats['timed_out'] = True
+        else:
+            for order in wave:
+                if time.monotonic() >= deadline:
+                    stats['timed_out'] = True
+                    break
+                try:
+                    records.append(_fit_candidate(data, order, model_kind, model_kwargs, fit_kwargs))
+                except Exception:
+                    outcomes[order] = None
+                    stats['failed'] += 1
+
+        for record in records:
+            outcomes[tuple(record['order'])] = record['aic']
+            stats['fitted'] += 1
+            if best is None or record['aic'] < best['aic']:
+                best = record
+
+        if stats['timed_out']:
+            print(f"Order search hit its {time_budget}s budget; returning best so far", file=sys.stderr)
+            break
+
+    return {'best': best, **stats}
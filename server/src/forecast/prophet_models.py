@@ -0,0 +1,121 @@
+"""Persisted, warm-started Prophet models.
+
+The latest fitted model for each product is kept on disk together with the
+fingerprint of the ds/y series it was fitted on:
+
+- same fingerprint: the stored model is loaded and used as is, with no Stan run
+- different fingerprint (usually one more day of sales): a new model is fitted
+  starting from the stored model's parameters, which converges in a fraction
+  of the iterations of a cold fit
+- nothing stored, or the warm start does not fit the new model's shape: cold fit
+
+Storage reuses ModelCache (atomic writes, LRU eviction, TTL) in its own
+directory, configured from the environment:
+
+    PROPHET_MODEL_DIR        default .cache/prophet next to this file
+    PROPHET_MODEL_MAX_BYTES  default 256 MiB
+    MODEL_CACHE_DISABLED     also turns persistence off
+"""
+import os
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+if TYPE_CHECKING:
+    from prophet import Prophet
+
+from model_cache import DEFAULT_CACHE_DIR, ModelCache, series_fingerprint
+from diagnostics import get_logger, stage
+
+log = get_logger('prophet_models')
+
+NAMESPACE = 'prophet'
+
+_store: Optional[ModelCache] = None
+
+
+def get_prophet_store() -> ModelCache:
+    global _store
+    if _store is None:
+        _store = ModelCache(
+            cache_dir=os.getenv('PROPHET_MODEL_DIR', os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), 'prophet')),
+            max_bytes=int(os.getenv('PROPHET_MODEL_MAX_BYTES', 256 * 1024 * 1024)),
+        )
+    return _store
+
+
+def frame_fingerprint(product_df: pd.DataFrame) -> str:
+    return series_fingerprint(pd.Series(product_df['y'].to_numpy(), index=pd.DatetimeIndex(product_df['ds'])))
+
+
+def warm_start_params(model: 'Prophet') -> Dict[str, Any]:
+    """Stan init values taken from a fitted model (the warm-start recipe from the Prophet docs)."""
+    params = {name: model.params[name][0][0] for name in ('k', 'm', 'sigma_obs')}
+    params.update({name: model.params[name][0] for name in ('delta', 'beta')})
+    return params
+
+
+def _cold_fit(product_df: pd.DataFrame) -> 'Prophet':
+    # prophet (and its Stan backend) load on the first fit, not when the scripts start
+    from prophet import Prophet
+    return Prophet().fit(product_df)
+
+
+def fit_from(product_df: pd.DataFrame, previous: Optional['Prophet'] = None) -> Tuple['Prophet', str]:
+    """Fit warm-started from a previous model when one is given, plus 'warm' or 'cold'."""
+    if previous is not None:
+        from prophet import Prophet
+        try:
+            return Prophet().fit(product_df, init=warm_start_params(previous)), 'warm'
+        except Exception as e:
+            # Changepoint or seasonality count changed with the new history; start over
+            log.info("Warm start failed, refitting from scratch: %s", e)
+    return _cold_fit(product_df), 'cold'
+
+
+def window_namespace(history_days: int) -> str:
+    """Namespace for models fitted on a trailing window of history_days days.
+
+    Callers that fit on a window must not share the full-history models'
+    entry, or each would keep overwriting (and warm-refitting) the other's.
+    """
+    return f"{NAMESPACE}-{history_days}d"
+
+
+def fit_or_load(product_df: pd.DataFrame, product_id: Optional[str] = None,
+                namespace: str = NAMESPACE) -> Tuple['Prophet', str]:
+    """Fitted Prophet model for a ds/y frame, plus how it was obtained ('cached', 'warm' or 'cold').
+
+    Without a product_id nothing is stored or reused. The model is stored
+    per product within namespace (see window_namespace).
+    """
+    if product_id is None:
+        with stage('fit'):
+            return _cold_fit(product_df), 'cold'
+
+    from prophet.serialize import model_from_json, model_to_json
+
+    store = get_prophet_store()
+    key = store.product_key(namespace, product_id)
+    fingerprint = frame_fingerprint(product_df)
+
+    previous = None
+    with stage('load'):
+        entry = store.get(key)
+        if entry is not None:
+            try:
+                previous = model_from_json(entry['model'])
+            except Exception as e:
+                log.warning("Discarding unreadable Prophet model for %s: %s", product_id, e)
+                entry = None
+
+    if entry is not None and entry['fingerprint'] == fingerprint:
+        return previous, 'cached'
+
+    with stage('fit'):
+        model, method = fit_from(product_df, previous)
+
+    with stage('store'):
+        store.put(key, {'fingerprint': fingerprint, 'model': model_to_json(model)})
+    log.info("Prophet model for %s: %s fit", product_id, method)
+    return model, method
@@ -0,0 +1,65 @@
+"""Packed binary sales columns, an alternative to JSON lists of sale dicts.
+
+Layout (little-endian):
+
+    magic     4 bytes  b'SLS1'
+    count     uint32   number of sales
+    days      int32[count]    epoch day numbers (days since 1970-01-01) of
+                              each sale's calendar day in SALES_TIMEZONE
+    quantity  float32[count]
+
+The sender buckets the timestamps into SALES_TIMEZONE days (salesDay() in
+the Node worker service), the same days the sales aggregation uses.
+
+decode() wraps the two columns with np.frombuffer, so no per-sale parsing
+happens and the arrays share memory with the input buffer. The persistent
+worker takes the same bytes base64-encoded in a request's "sales_packed"
+field.
+"""
+import base64
+import struct
+from typing import Any, NamedTuple, Union
+
+import numpy as np
+
+MAGIC = b'SLS1'
+HEADER = struct.Struct('<4sI')
+DAY_DTYPE = np.dtype('<i4')
+QUANTITY_DTYPE = np.dtype('<f4')
+
+
+class SalesColumns(NamedTuple):
+    days: np.ndarray
+    quantity: np.ndarray
+
+
+def is_packed(buffer: Union[bytes, bytearray, memoryview]) -> bool:
+    return bytes(buffer[:len(MAGIC)]) == MAGIC
+
+
+def encode(days: Any, quantity: Any) -> bytes:
+    days = np.asarray(days, dtype=DAY_DTYPE)
+    quantity = np.asarray(quantity, dtype=QUANTITY_DTYPE)
+    if days.shape != quantity.shape or days.ndim != 1:
+        raise ValueError("days and quantity must be 1-d arrays of the same length")
+    return HEADER.pack(MAGIC, len(days)) + days.tobytes() + quantity.tobytes()
+
+
+def decode(buffer: Union[bytes, bytearray, memoryview]) -> SalesColumns:
+    """Read-only column views into a packed buffer."""
+    if len(buffer) < HEADER.size:
+        raise ValueError("Packed sales buffer is shorter than its header")
+    magic, count = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"Not a packed sales buffer (magic {magic!r})")
+    expected = HEADER.size + count * (DAY_DTYPE.itemsize + QUANTITY_DTYPE.itemsize)
+    if len(buffer) != expected:
+        raise ValueError(f"Packed sales buffer holds {len(buffer)} bytes, expected {expected} for {count} sales")
+    days = np.frombuffer(buffer, dtype=DAY_DTYPE, count=count, offset=HEADER.size)
+    quantity = np.frombuffer(buffer, dtype=QUANTITY_DTYPE, count=count, offset=HEADER.size + days.nbytes)
+    return SalesColumns(days, quantity)
+
+
+def decode_base64(text: str) -> SalesColumns:
+    return decode(base64.b64decode(text))
+
@@ -0,0 +1,343 @@
+"""Sales pattern statistics for stock optimization and dashboards.
+
+pattern_statistics() builds the analyze_sales_patterns report from date and
+quantity arrays in one vectorized pass. It does not create DataFrame columns,
+and it picks the top and bottom days with a partial selection instead of a
+full sort.
+
+SalesPatternAccumulator keeps the same report up to date one sale at a time.
+Sales for the current (latest) day are summed into an open day. When a later
+date arrives, the open day is folded into running totals, a sorted value list,
+top/bottom heaps and weekday/month sums. A refresh therefore never reprocesses
+history; matches() checks a tracked product against its stored daily totals.
+"""
+import os
+import heapq
+import bisect
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+TOP_K = 3
+TREND_WINDOW = 7
+
+
+def _weekday(dates: np.ndarray) -> np.ndarray:
+    # 1970-01-01 was a Thursday; Monday is 0 as in pandas dayofweek
+    return (dates.astype('datetime64[D]').astype(np.int64) + 3) % 7
+
+
+def _month(dates: np.ndarray) -> np.ndarray:
+    return dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+
+def top_k_indices(values: np.ndarray, k: int, largest: bool = True) -> np.ndarray:
+    """Indices of the k largest (or smallest) values, best first, ties in index order.
+
+    Matches DataFrame.nlargest / nsmallest with keep='first' using np.partition
+    instead of a full sort.
+    """
+    n = len(values)
+    k = min(k, n)
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    keys = values if largest else -values
+    kth = np.partition(keys, n - k)[n - k]
+    above = np.flatnonzero(keys > kth)
+    ties = np.flatnonzero(keys == kth)[:k - len(above)]
+    selected = np.concatenate([above, ties])
+    return selected[np.lexsort((selected, -keys[selected]))]
+
+
+def _patterns(sums: np.ndarray, counts: np.ndarray, offset: int) -> Dict[int, float]:
+    present = np.flatnonzero(counts)
+    return {int(i + offset): float(sums[i] / counts[i]) for i in present}
+
+
+def _report(count: int, total: float, median: float, std: float, minimum: float, maximum: float,
+            first_window: float, last_window: float, weekday_sums: np.ndarray, weekday_counts: np.ndarray,
+            month_sums: np.ndarray, month_counts: np.ndarray, first_half: float, second_half: float,
+            peaks: List[Tuple[str, float]], lows: List[Tuple[str, float]]) -> Dict[str, Any]:
+    """Shape the statistics like the original DataFrame-based analysis."""
+    mean = total / count
+    trend_direction = ("increasing" if last_window > first_window
+                       else "decreasing" if last_window < first_window else "stable")
+    cv = std / mean if mean != 0 else 0
+    if count > 1:
+        growth_rate = ((second_half - first_half) / first_half * 100) if first_half != 0 else 0
+    else:
+        growth_rate = 0
+
+    return {
+        'basic_stats': {
+            'total_sales': float(total),
+            'mean_daily_sales': float(mean),
+            'median_daily_sales': float(median),
+            'std_daily_sales': float(std),
+            'min_daily_sales': float(minimum),
+            'max_daily_sales': float(maximum),
+            'sales_range': float(maximum - minimum)
+        },
+        'trend_analysis': {
+            'trend_direction': trend_direction,
+            'trend_strength': float(abs(last_window - first_window) / first_window * 100) if first_window != 0 else 0
+        },
+        'seasonality': {
+            'daily_patterns': _patterns(weekday_sums, weekday_counts, 0),
+            'monthly_patterns': _patterns(month_sums, month_counts, 1)
+        },
+        'volatility': {
+            'coefficient_of_variation': float(cv),
+            'volatility_level': 'high' if cv > 1 else 'medium' if cv > 0.5 else 'low'
+        },
+        'growth': {
+            'growth_rate': float(growth_rate),
+            'growth_status': 'growing' if growth_rate > 5 else 'declining' if growth_rate < -5 else 'stable'
+        },
+        'peak_analysis': {
+            'peak_dates': [date for date, _ in peaks],
+            'peak_values': [float(value) for _, value in peaks]
+        },
+        'low_analysis': {
+            'low_dates': [date for date, _ in lows],
+            'low_values': [float(value) for _, value in lows]
+        }
+    }
+
+
+def _check_length(count: int) -> None:
+    if count < TREND_WINDOW:
+        raise ValueError(f"At least {TREND_WINDOW} days of sales are needed for trend analysis")
+
+
+def pattern_statistics(dates: np.ndarray, values: np.ndarray) -> Dict[str, Any]:
+    """Pattern report for date-sorted datetime64 dates and float quantities."""
+    values = np.asarray(values, dtype=np.float64)
+    dates = np.asarray(dates).astype('datetime64[D]')
+    count = len(values)
+    _check_length(count)
+
+    half = count // 2
+    first_half = values[:half].sum()
+    second_half = values[half:].sum()
+    weekdays = _weekday(dates)
+    months = _month(dates) - 1
+
+    def picks(indices):
+        return [(str(dates[i]), values[i]) for i in indices]
+
+    return _report(
+        count=count,
+        total=first_half + second_half,
+        median=np.median(values),
+        std=values.std(ddof=1),
+        minimum=values.min(),
+        maximum=values.max(),
+        first_window=values[:TREND_WINDOW].mean(),
+        last_window=values[-TREND_WINDOW:].mean(),
+        weekday_sums=np.bincount(weekdays, weights=values, minlength=7),
+        weekday_counts=np.bincount(weekdays, minlength=7),
+        month_sums=np.bincount(months, weights=values, minlength=12),
+        month_counts=np.bincount(months, minlength=12),
+        first_half=first_half / half if half else 0.0,
+        second_half=second_half / (count - half),
+        peaks=picks(top_k_indices(values, TOP_K, largest=True)),
+        lows=picks(top_k_indices(values, TOP_K, largest=False)),
+    )
+
+
+class SalesPatternAccumulator:
+    """Incrementally maintained pattern report for one product's daily sales."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        # Prefix sums of closed days, for the first/second half growth split
+        self.prefix = [0.0]
+        self.sorted_values: List[float] = []
+        self.first_window: List[float] = []
+        self.last_window: deque = deque(maxlen=TREND_WINDOW)
+        self.weekday_sums = np.zeros(7)
+        self.weekday_counts = np.zeros(7, dtype=np.int64)
+        self.month_sums = np.zeros(12)
+        self.month_counts = np.zeros(12, dtype=np.int64)
+        # Min-heaps of the best TOP_K days: (value, -index, date) and (-value, -index, date)
+        self.peaks: List[Tuple[float, int, str]] = []
+        self.lows: List[Tuple[float, int, str]] = []
+        self.open_date: Optional[np.datetime64] = None
+        self.open_value = 0.0
+
+    @classmethod
+    def from_daily(cls, dates: np.ndarray, values: np.ndarray) -> 'SalesPatternAccumulator':
+        accumulator = cls()
+        for date, value in zip(np.asarray(dates).astype('datetime64[D]'), np.asarray(values, dtype=np.float64)):
+            accumulator.add_sale(date, float(value))
+        return accumulator
+
+    @property
+    def days(self) -> int:
+        return self.count + (self.open_date is not None)
+
+    def add_sale(self, date: Any, quantity: float) -> None:
+        """Add a sale; dates must not go back before the latest day seen."""
+        date = np.datetime64(date, 'D')
+        if self.open_date is not None and date < self.open_date:
+            raise ValueError(f"Sale dated {date} is older than the latest day {self.open_date}")
+        if self.open_date is not None and date == self.open_date:
+            self.open_value += float(quantity)
+            return
+        if self.open_date is not None:
+            self._close_day(self.open_date, self.open_value)
+        self.open_date = date
+        self.open_value = float(quantity)
+
+    def _close_day(self, date: np.datetime64, value: float) -> None:
+        index = self.count
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        self.prefix.append(self.prefix[-1] + value)
+        bisect.insort(self.sorted_values, value)
+        if len(self.first_window) < TREND_WINDOW:
+            self.first_window.append(value)
+        self.last_window.append(value)
+
+        weekday = int(_weekday(np.array([date]))[0])
+        month = int(_month(np.array([date]))[0]) - 1
+        self.weekday_sums[weekday] += value
+        self.weekday_counts[weekday] += 1
+        self.month_sums[month] += value
+        self.month_counts[month] += 1
+
+        label = str(date)
+        self._push(self.peaks, (value, -index, label))
+        self._push(self.lows, (-value, -index, label))
+
+    @staticmethod
+    def _push(heap: list, item: tuple) -> None:
+        if len(heap) < TOP_K:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    def matches(self, dates: np.ndarray, values: np.ndarray) -> bool:
+        """Whether the tracked days are these date-sorted daily totals, e.g. the history now stored.
+
+        Compares the day count, the open day, the running totals of every
+        closed day and their weekday and month counts, without replaying
+        the history.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        dates = np.asarray(dates).astype('datetime64[D]')
+        if self.open_date is None or len(values) != self.days:
+            return False
+        if dates[-1] != self.open_date or values[-1] != self.open_value:
+            return False
+        closed = dates[:-1]
+        return (np.array_equal(np.cumsum(values[:-1]), self.prefix[1:])
+                and np.array_equal(np.bincount(_weekday(closed), minlength=7), self.weekday_counts)
+                and np.array_equal(np.bincount(_month(closed) - 1, minlength=12), self.month_counts))
+
+    def _median_with(self, extra: float) -> float:
+        """Median of the closed days plus one extra value, read off the sorted list."""
+        values = self.sorted_values
+        position = bisect.bisect_left(values, extra)
+
+        def at(rank):
+            if rank < position:
+                return values[rank]
+            return extra if rank == position else values[rank - 1]
+
+        size = len(values) + 1
+        return (at((size - 1) // 2) + at(size // 2)) / 2
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current report, identical to pattern_statistics over all days so far."""
+        if self.open_date is None:
+            raise ValueError("No sales recorded")
+        _check_length(self.days)
+        value = self.open_value
+        count = self.count + 1
+        index = self.count
+
+        delta = value - self.mean
+        mean = self.mean + delta / count
+        m2 = self.m2 + delta * (value - mean)
+        total = self.prefix[-1] + value
+        half = count // 2
+
+        weekday = int(_weekday(np.array([self.open_date]))[0])
+        month = int(_month(np.array([self.open_date]))[0]) - 1
+        weekday_sums, weekday_counts = self.weekday_sums.copy(), self.weekday_counts.copy()
+        month_sums, month_counts = self.month_sums.copy(), self.month_counts.copy()
+        weekday_sums[weekday] += value
+        weekday_counts[weekday] += 1
+        month_sums[month] += value
+        month_counts[month] += 1
+
+        first_window = (self.first_window + [value])[:TREND_WINDOW]
+        last_window = (list(self.last_window) + [value])[-TREND_WINDOW:]
+        label = str(self.open_date)
+        peaks = sorted(self.peaks + [(value, -index, label)], reverse=True)[:TOP_K]
+        lows = sorted(self.lows + [(-value, -index, label)], reverse=True)[:TOP_K]
+
+        return _report(
+            count=count,
+            total=total,
+            median=self._median_with(value),
+            std=np.sqrt(m2 / (count - 1)),
+            minimum=min(self.minimum, value),
+            maximum=max(self.maximum, value),
+            first_window=float(np.mean(first_window)),
+            last_window=float(np.mean(last_window)),
+            weekday_sums=weekday_sums,
+            weekday_counts=weekday_counts,
+            month_sums=month_sums,
+            month_counts=month_counts,
+            first_half=self.prefix[half] / half,
+            second_half=(total - self.prefix[half]) / (count - half),
+            peaks=[(date, key) for key, _, date in peaks],
+            lows=[(date, -key) for key, _, date in lows],
+        )
+
+
+class PatternTracker:
+    """Per-product accumulators, least recently used products dropped first."""
+
+    def __init__(self, max_products: Optional[int] = None):
+        self.max_products = max_products or int(os.getenv('PATTERN_MAX_TRACKED_PRODUCTS', 1000))
+        self.accumulators: 'OrderedDict[str, SalesPatternAccumulator]' = OrderedDict()
+
+    def get(self, product_id: str) -> Optional[SalesPatternAccumulator]:
+        accumulator = self.accumulators.get(product_id)
+        if accumulator is not None:
+            self.accumulators.move_to_end(product_id)
+        return accumulator
+
+    def load(self, product_id: str, dates: np.ndarray, values: np.ndarray) -> SalesPatternAccumulator:
+        accumulator = SalesPatternAccumulator.from_daily(dates, values)
+        self.accumulators[product_id] = accumulator
+        self.accumulators.move_to_end(product_id)
+        while len(self.accumulators) > self.max_products:
+            self.accumulators.popitem(last=False)
+        return accumulator
+
+    def discard(self, product_id: str) -> None:
+        self.accumulators.pop(product_id, None)
+
+
+_tracker: Optional[PatternTracker] = None
+
+
+def get_pattern_tracker() -> PatternTracker:
+    global _tracker
+    if _tracker is None:
+        _tracker = PatternTracker()
+    return _tracker
@@ -0,0 +1,154 @@
+"""Daily demand series built server-side from the sales collection.
+
+The aggregation projects only date and quantity, sums them per calendar day
+inside MongoDB and returns compact NumPy arrays, so the forecasting scripts
+no longer pull every raw sale document over the wire.
+
+Days are calendar days in SALES_TIMEZONE (default UTC), the same setting
+the Node server uses to pack sales for the worker.
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+SALES_TIMEZONE = os.getenv('SALES_TIMEZONE', 'UTC')
+
+
+class DailySales:
+    """Daily totals for one product: datetime64[D] dates and float64 quantities."""
+
+    __slots__ = ('dates', 'quantities', 'records')
+
+    def __init__(self, dates: np.ndarray, quantities: np.ndarray, records: int):
+        self.dates = dates
+        self.quantities = quantities
+        # Number of raw sale documents behind the daily totals
+        self.records = records
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def to_series(self) -> pd.Series:
+        return pd.Series(self.quantities, index=pd.DatetimeIndex(self.dates, name='date'), name='quantity')
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({'date': pd.DatetimeIndex(self.dates), 'quantity': self.quantities})
+
+    @classmethod
+    def empty(cls) -> 'DailySales':
+        return cls(np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64), 0)
+
+    @classmethod
+    def from_groups(cls, days: List[str], quantities: List[float], records: int) -> 'DailySales':
+        dates = np.array(days, dtype='datetime64[D]')
+        values = np.asarray(quantities, dtype=np.float64)
+        # $push does not promise to keep the $sort order, so sort here
+        order = np.argsort(dates, kind='stable')
+        return cls(dates[order], values[order], records)
+
+
+def _day_expression(timezone: str) -> Dict[str, Any]:
+    # $toDate also accepts dates stored as ISO strings
+    return {'$dateToString': {'format': '%Y-%m-%d', 'date': {'$toDate': '$date'}, 'timezone': timezone}}
+
+
+def daily_sales_pipeline(product_ids: Optional[Iterable[ObjectId]] = None, timezone: str = SALES_TIMEZONE,
+                         by_product: bool = False) -> List[Dict[str, Any]]:
+    """Aggregation that sums quantity per day (and per product when by_product is set)."""
+    pipeline: List[Dict[str, Any]] = []
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        match = product_ids[0] if len(product_ids) == 1 else {'$in': product_ids}
+        pipeline.append({'$match': {'product': match}})
+
+    group_id: Dict[str, Any] = {'day': _day_expression(timezone)}
+    if by_product:
+        group_id['product'] = '$product'
+
+    pipeline += [
+        {'$project': {'_id': 0, 'product': 1, 'date': 1, 'quantity': 1}},
+        {'$group': {'_id': group_id, 'quantity': {'$sum': '$quantity'}, 'records': {'$sum': 1}}},
+        {'$sort': {'_id.day': 1}},
+    ]
+
+    if by_product:
+        pipeline.append({'$group': {
+            '_id': '$_id.product',
+            'days': {'$push': '$_id.day'},
+            'quantities': {'$push': '$quantity'},
+            'records': {'$sum': '$records'},
+        }})
+    return pipeline
+
+
+def fetch_daily_sales(collection: Any, product_id: Optional[ObjectId] = None,
+                      timezone: str = SALES_TIMEZONE) -> DailySales:
+    """Daily totals for one product (or all sales when product_id is None)."""
+    product_ids = [product_id] if product_id is not None else None
+    days, quantities, records = [], [], 0
+    for group in collection.aggregate(daily_sales_pipeline(product_ids, timezone), allowDiskUse=True):
+        days.append(group['_id']['day'])
+        quantities.append(group['quantity'])
+        records += group['records']
+    return DailySales.from_groups(days, quantities, records)
+
+
+def fetch_daily_sales_by_product(collection: Any, product_ids: Optional[Iterable[ObjectId]] = None,
+                                 timezone: str = SALES_TIMEZONE) -> Dict[str, DailySales]:
+    """Daily totals for many products from one aggregation, keyed by product ID string."""
+    pipeline = daily_sales_pipeline(product_ids, timezone, by_product=True)
+    return {
+        str(group['_id']): DailySales.from_groups(group['days'], group['quantities'], group['records'])
+        for group in collection.aggregate(pipeline, allowDiskUse=True)
+    }
+
+
+def parse_product_ids(product_ids: Union[str, Sequence[str], None]) -> Tuple[Optional[List[ObjectId]], List[str]]:
+    """ObjectIds of the requested products (None for 'all') and the requested IDs that are not valid ObjectIds."""
+    if not product_ids or product_ids == 'all':
+        return None, []
+    object_ids = [ObjectId(product_id) for product_id in product_ids if ObjectId.is_valid(product_id)]
+    invalid = [str(product_id) for product_id in product_ids if not ObjectId.is_valid(product_id)]
+    return object_ids, invalid
+
+
+def daily_matrix(sales_by_product: Dict[str, DailySales], product_ids: Sequence[str],
+                 history_days: Optional[int] = None,
+                 from_first_sale: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """Dates and a product x day matrix of units sold; days without sales are 0.
+
+    The grid runs from the first to the last day any product sold, limited to
+    the last history_days days when given. With from_first_sale the days
+    before a product's own first sale (all of them for products without
+    sales) are NaN rather than 0, so a recently launched product's stats are
+    not diluted by days it was not on sale.
+    """
+    last_days = [sales.dates[-1] for sales in sales_by_product.values() if len(sales)]
+    if not last_days:
+        return np.array([], dtype='datetime64[D]'), np.zeros((len(product_ids), 0))
+    end = max(last_days)
+    first = min(sales.dates[0] for sales in sales_by_product.values() if len(sales))
+    start = first if history_days is None else max(first, end - history_days + 1)
+    dates = np.arange(start, end + 1)
+
+    matrix = np.full((len(product_ids), len(dates)), np.nan if from_first_sale else 0.0)
+    for row, product_id in enumerate(product_ids):
+        sales = sales_by_product.get(product_id)
+        if sales is None or not len(sales):
+            continue
+        offsets = (sales.dates - start).astype(np.int64)
+        keep = offsets >= 0
+        if from_first_sale:
+            matrix[row, max(int(offsets[0]), 0):] = 0.0
+        matrix[row, offsets[keep]] = sales.quantities[keep]
+    return dates, matrix
+
+
+def sales_frame(data: Union[DailySales, List[Dict[str, Any]], pd.DataFrame]) -> pd.DataFrame:
+    """date/quantity frame from either daily totals or a list of sale records."""
+    if isinstance(data, DailySales):
+        return data.to_frame()
+    return pd.DataFrame(data)
@@ -1,167 +1,250 @@
 import sys
+from diagnostics import profile_imports_if_requested
+# Before the other imports, so --import-profile covers them
+profile_imports_if_requested(sys.argv)
 import pandas as pd
 import numpy as np
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from pymongo import MongoClient
 import os
+import time
 from datetime import datetime, timedelta
 import json
 import traceback
 from bson import ObjectId
-from statsmodels.tsa.stattools import adfuller
-from typing import Dict, List, Union, Any
+from typing import Dict, List, Optional, Tuple, Union, Any
+from itertools import product
+from model_cache import fitted_record, get_model_cache
+from mongo_connection import get_client, get_database
+from diagnostics import get_logger, stage, start_trace
+from sales_series import SALES_TIMEZONE, DailySales, fetch_daily_sales, sales_frame
+from order_selection import select_order
+from ndjson import NDJSONWriter, date_strings, strip_flags, wants_ndjson
+from sales_patterns import get_pattern_tracker, pattern_statistics
+from inventory_policy import policy_levels
+from calendar_series import calendar_for, to_epoch_days
+
+log = get_logger('stock_optimization')
+
+# Fast ARIMA path of run_arima_forecast: total latency budget, share of it the
+# order search may use, and the iteration cap for the limited fit
+FORECAST_TIME_BUDGET = float(os.getenv('FORECAST_TIME_BUDGET', 2.0))
+ORDER_SEARCH_SHARE = 0.5
+FORECAST_MAXITER = int(os.getenv('FORECAST_MAXITER', 25))
+INTERVAL_LEVEL = 0.95
+INTERVAL_Z = 1.96
+# Cache namespaces of the fast ARIMA fits. Callers that fit a different window of a
+# product's history (the demand forecast service, hierarchy, simulation, router) pass
+# their own, so their fits do not overwrite each other's warm-start entries
+NAMESPACE = 'stock-arima'
+DEMAND_NAMESPACE = 'demand-arima'
+# Seconds a searched order is reused for warm starts before the order search runs again
+ORDER_MAX_AGE = float(os.getenv('FORECAST_ORDER_MAX_AGE_SECONDS', 24 * 3600))
 
 def get_mongodb_connection():
-    try:
-        mongo_uri = os.getenv('DATABASE_URL', 'mongodb://localhost:27017')
-        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
-        client.server_info()
-        return client
-    except Exception as e:
-        print(f"MongoDB connection error: {str(e)}", file=sys.stderr)
-        return None
+    """Shared pooled client; connects lazily on the first operation."""
+    return get_client()
 
 def get_inventory_data(product_id=None):
     try:
-        # Connect to MongoDB
-        mongo_uri = os.getenv('DATABASE_URL')
-        print(f"Connecting to MongoDB with URI: {mongo_uri}", file=sys.stderr)
-        
-        client = MongoClient(mongo_uri)
-        db = client['dev']
+        # Shared pooled connection; no new client per call
+        with stage('connect'):
+            db = get_database()
         
         # Get sales records
         if product_id:
-            print(f"Searching for product_id: {product_id}", file=sys.stderr)
+            log.debug("Searching for product_id: %s", product_id)
             try:
                 # Convert string ID to ObjectId
                 product_obj_id = ObjectId(product_id)
                 query = {'product': product_obj_id}
-                print(f"Querying sales with: {query}", file=sys.stderr)
+                log.debug("Querying sales with: %s", query)
                 
-                # Get all sales records for this product
-                records = list(db.sales.find(query))
-                print(f"Found {len(records)} sales records", file=sys.stderr)
+                # Daily totals summed inside MongoDB; only date and quantity cross the wire
+                with stage('fetch'):
+                    data = fetch_daily_sales(db.sales, product_obj_id)
+                log.info("Found %s sales records over %s days", data.records, len(data))
                 
-                if not records:
-                    print(f"No sales records found for product_id: {product_id}", file=sys.stderr)
-                    return []
+                if not data.records:
+                    log.info("No sales records found for product_id: %s", product_id)
+                    return DailySales.empty()
                 
-                # Transform data
-                data = []
-                for record in records:
-                    # Ensure date is in datetime format
-                    sale_date = record.get('date')
-                    if isinstance(sale_date, str):
-                        sale_date = datetime.strptime(sale_date, '%Y-%m-%dT%H:%M:%S.%fZ')
-                    
-                    data.append({
-                        'date': sale_date.strftime('%Y-%m-%d'),
-                        'quantity': record.get('quantity', 0)
-                    })
-                
-                print(f"Transformed {len(data)} records", file=sys.stderr)
                 return data
                 
             except Exception as e:
                 print(f"Error processing sales data: {str(e)}\n{traceback.format_exc()}", file=sys.stderr)
-                return []
+                return DailySales.empty()
         else:
-            print("No product_id provided", file=sys.stderr)
-            return []
+            log.info("No product_id provided")
+            return DailySales.empty()
             
     except Exception as e:
         print(f"Error getting sales data: {str(e)}\n{traceback.format_exc()}", file=sys.stderr)
-        return []
+        return DailySales.empty()
 
 def is_stationary(data: pd.Series, threshold: float = 0.05) -> bool:
     """Test if the time series is stationary using Augmented Dickey-Fuller test."""
+    from statsmodels.tsa.stattools import adfuller
     result = adfuller(data)
     return result[1] < threshold
 
-def find_best_arima_order(data: pd.Series, max_p: int = 2, max_d: int = 1, max_q: int = 2) -> tuple:
+def search_arima_order(data: pd.Series, max_p: int = 2, max_d: int = 1, max_q: int = 2,
+                       product_id: str = None, time_budget: Optional[float] = None) -> Tuple[tuple, bool]:
+    """Best ARIMA order by AIC over a reduced grid, and whether the search finished within its budget."""
+    # Unchanged series for this product reuse the previously selected order
+    cache = get_model_cache()
+    cache_key = cache.key('sarimax-order', product_id, data, max_p=max_p, max_d=max_d, max_q=max_q)
+    cached = cache.get(cache_key)
+    if cached:
+        return tuple(cached['order']), True
+
+    # Candidates are fitted in parallel; over-differenced and dominated orders are pruned
+    candidates = product(range(max_p + 1), range(max_d + 1), range(max_q + 1))
+    search = select_order(data, candidates, fit_kwargs={'maxiter': 50}, time_budget=time_budget, max_d=max_d)
+    best = search['best']
+    complete = best is not None and not search['timed_out']
+
+    if complete:
+        cache.put(cache_key, best)
+    return (tuple(best['order']) if best else (1, 1, 1)), complete
+
+def find_best_arima_order(data: pd.Series, max_p: int = 2, max_d: int = 1, max_q: int = 2,
+                          product_id: str = None, time_budget: Optional[float] = None) -> tuple:
     """Find the best ARIMA order using AIC with reduced search space."""
-    best_aic = float('inf')
-    best_order = None
-    
-    # Reduced search space for faster computation
-    for p in range(max_p + 1):
-        for d in range(max_d + 1):
-            for q in range(max_q + 1):
-                try:
-                    model = SARIMAX(data, order=(p, d, q))
-                    results = model.fit(disp=False, maxiter=50)
-                    if results.aic < best_aic:
-                        best_aic = results.aic
-                        best_order = (p, d, q)
-                except:
-                    continue
+    return search_arima_order(data, max_p, max_d, max_q, product_id, time_budget)[0]
+
+class BudgetExceeded(Exception):
+    pass
+
+def _deadline_callback(deadline: float):
+    """Optimizer callback that aborts the fit once the deadline passes."""
+    def check(*_):
+        if time.monotonic() > deadline:
+            raise BudgetExceeded()
+    return check
+
+def fit_forecast_model(values: np.ndarray, product_id: Optional[str], deadline: float, namespace: str = NAMESPACE):
+    """Fitted SARIMAX results for the fast forecast path, plus where the order came from.
+
+    An unchanged series reuses its cached parameters without optimizing. A
+    product whose series changed warm-starts from its last order and
+    parameters, until that order is ORDER_MAX_AGE seconds old. Otherwise the
+    order search runs on part of the remaining budget. Orders from a search
+    that ran out of budget are never reused. Fits are capped at
+    FORECAST_MAXITER iterations and raise BudgetExceeded when the deadline
+    passes.
+    """
+    # Imported here so the moving-average and pattern paths never load statsmodels
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    cache = get_model_cache()
+    exact_key = cache.key(namespace, product_id, values)
+    latest_key = cache.product_key(f'{namespace}-latest', product_id)
+
+    cached = cache.get(exact_key)
+    if cached and cached.get('order_complete'):
+        order = tuple(cached['order'])
+        return SARIMAX(values, order=order).filter(np.asarray(cached['params'])), order, 'cached'
+
+    latest = cache.get(latest_key) if product_id else None
+    start_params = None
+    if latest and latest.get('order_complete') and time.time() - latest.get('searched_at', 0) < ORDER_MAX_AGE:
+        order, source, complete, searched_at = tuple(latest['order']), 'warm', True, latest['searched_at']
+        start_params = np.asarray(latest['params'])
+    else:
+        remaining = deadline - time.monotonic()
+        order, complete = search_arima_order(values, product_id=product_id,
+                                             time_budget=max(remaining * ORDER_SEARCH_SHARE, 0))
+        source, searched_at = 'searched', time.time()
+    if time.monotonic() > deadline:
+        raise BudgetExceeded()
+
+    results = SARIMAX(values, order=order).fit(disp=False, maxiter=FORECAST_MAXITER, start_params=start_params,
+                                               callback=_deadline_callback(deadline))
+    record = {**fitted_record(results, order), 'order_complete': complete, 'searched_at': searched_at}
+    cache.put(exact_key, record)
+    if product_id:
+        # Dated from the order search, so warm fits do not keep extending the entry's TTL
+        cache.put(latest_key, record, created_at=searched_at)
+    return results, order, source
+
+def moving_average_forecast(quantity: pd.Series, steps: int):
+    """Last values of the 7-day rolling mean, with bands from its in-sample error."""
+    rolling = quantity.rolling(window=7).mean()
+    forecast = rolling.iloc[-steps:]
     
-    return best_order if best_order else (1, 1, 1)
+    # Replace NaN values with mean of the forecast
+    mean_forecast = forecast.mean()
+    forecast = forecast.fillna(mean_forecast).to_numpy()
+    spread = INTERVAL_Z * np.nanstd((quantity - rolling).to_numpy())
+    return forecast, forecast - spread, forecast + spread
 
-def run_arima_forecast(data: List[Dict[str, Any]]) -> Dict[str, Any]:
+def run_arima_forecast(data: Union[DailySales, List[Dict[str, Any]]], columnar: bool = False,
+                       product_id: Optional[str] = None, time_budget: Optional[float] = None,
+                       timezone: Optional[str] = None, namespace: str = NAMESPACE) -> Dict[str, Any]:
+    """Demand forecast with 95% intervals and stock levels.
+
+    The ARIMA path must finish within time_budget seconds (FORECAST_TIME_BUDGET,
+    default 2); otherwise, or when the fit fails, the 7-day moving average is
+    used. 'model' reports which path ran. With columnar set 'forecast' holds
+    parallel lists instead of records. Sales are put on the daily calendar
+    first (days without sales count as 0, timestamps fall on days in timezone).
+    namespace keys the cached fits and calendar of the product's series; a
+    caller sending its own window of the history passes its own.
+    """
+    started = time.monotonic()
+    budget = FORECAST_TIME_BUDGET if time_budget is None else time_budget
     try:
-        # Convert data to DataFrame
-        df = pd.DataFrame(data)
-        
-        # Convert date strings to datetime objects
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.sort_values('date')
-        df.set_index('date', inplace=True)
+        with stage('calendar'):
+            calendar = calendar_for(data, key=(namespace, product_id) if product_id else None, timezone=timezone)
         
         # Ensure we have enough data points
-        if len(df) < 10:
+        if calendar.records < 10:
             return {"error": "Not enough data points for ARIMA forecast. Minimum 10 points required."}
         
-        # Use simple moving average for faster computation
         forecast_steps = 30
-        forecast = df['quantity'].rolling(window=7).mean().iloc[-forecast_steps:]
-        
-        # Replace NaN values with mean of the forecast
-        mean_forecast = forecast.mean()
-        forecast = forecast.fillna(mean_forecast)
-        
-        # Calculate optimal stock levels
-        mean_demand = df['quantity'].mean()
-        std_demand = df['quantity'].std()
-        
-        # Calculate safety stock using service level of 95%
-        service_level = 0.95
-        z_score = 1.645  # for 95% service level
-        safety_stock = z_score * std_demand * np.sqrt(7)
+        quantity = calendar.to_series()
+        model: Dict[str, Any] = {'method': 'arima'}
+        try:
+            with stage('model'):
+                results, order, source = fit_forecast_model(quantity.to_numpy(), product_id, started + budget,
+                                                            namespace)
+                prediction = results.get_forecast(forecast_steps)
+                forecast = np.asarray(prediction.predicted_mean)
+                bounds = np.asarray(prediction.conf_int(alpha=1 - INTERVAL_LEVEL))
+            lower, upper = bounds[:, 0], bounds[:, 1]
+            model.update({'order': list(order), 'source': source})
+        except BudgetExceeded:
+            forecast, lower, upper = moving_average_forecast(quantity, forecast_steps)
+            model = {'method': 'moving_average', 'reason': f"ARIMA fit exceeded the {budget}s budget"}
+        except Exception as e:
+            log.warning("ARIMA forecast failed, using moving average: %s", e)
+            forecast, lower, upper = moving_average_forecast(quantity, forecast_steps)
+            model = {'method': 'moving_average', 'reason': f"ARIMA fit failed: {str(e)}"}
+        model['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
         
-        # Calculate reorder point
-        lead_time = 7  # assuming 7 days lead time
-        reorder_point = (mean_demand * lead_time) + safety_stock
+        # Demand cannot go negative
+        forecast, lower, upper = np.maximum(forecast, 0), np.maximum(lower, 0), np.maximum(upper, 0)
         
-        # Calculate optimal order quantity (EOQ)
-        holding_cost = 0.2  # 20% of item cost per year
-        ordering_cost = 50  # fixed cost per order
-        annual_demand = mean_demand * 365
-        eoq = np.sqrt((2 * annual_demand * ordering_cost) / holding_cost)
+        # Safety stock, reorder point and EOQ at the default 95% service level and 7-day lead time
+        optimal_levels = policy_levels(quantity.to_numpy())
         
         # Prepare forecast results
-        forecast_dates = pd.date_range(start=df.index[-1] + timedelta(days=1), periods=len(forecast))
-        forecast_df = pd.DataFrame({
-            'date': [d.strftime('%Y-%m-%d') for d in forecast_dates],
-            'forecasted_quantity': forecast.values
-        })
+        forecast_columns = {
+            'date': date_strings(calendar.future_dates(len(forecast))),
+            'forecasted_quantity': forecast.tolist(),
+            'lower_bound': lower.tolist(),
+            'upper_bound': upper.tolist()
+        }
         
         # Convert to records
-        forecast_records = forecast_df.to_dict(orient='records')
-        
-        # Prepare optimal levels
-        optimal_levels = {
-            'mean_demand': float(mean_demand),
-            'std_demand': float(std_demand),
-            'safety_stock': float(safety_stock),
-            'reorder_point': float(reorder_point),
-            'economic_order_quantity': float(eoq)
-        }
+        if columnar:
+            forecast_records = forecast_columns
+        else:
+            forecast_records = [dict(zip(forecast_columns, row)) for row in zip(*forecast_columns.values())]
         
         return {
             'forecast': forecast_records,
-            'optimal_levels': optimal_levels
+            'optimal_levels': optimal_levels,
+            'model': model
         }
         
     except Exception as e:
@@ -195,147 +278,144 @@ def generate_sample_data():
     
     return df
 
-def analyze_sales_patterns(data: List[Dict[str, Any]]) -> Dict[str, Any]:
+def sales_arrays(data: Union[DailySales, List[Dict[str, Any]]]):
+    """Date-sorted datetime64[D] days with sales and their total quantities, without building an indexed frame."""
+    if isinstance(data, DailySales):
+        return data.dates, data.quantities
+    df = sales_frame(data)
+    # One total per SALES_TIMEZONE day, as in the daily aggregation, however many sales fell on it
+    days, day_index = np.unique(to_epoch_days(df['date'].to_numpy()), return_inverse=True)
+    quantities = np.bincount(day_index, weights=df['quantity'].to_numpy(dtype=np.float64), minlength=len(days))
+    return days.astype('datetime64[D]'), quantities
+
+def analyze_sales_patterns(data: Union[DailySales, List[Dict[str, Any]]]) -> Dict[str, Any]:
     """Analyze sales patterns including trends, seasonality, and key metrics"""
     try:
-        # Convert data to DataFrame
-        df = pd.DataFrame(data)
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.sort_values('date')
-        df.set_index('date', inplace=True)
-        
-        # 1. Basic Statistics
-        basic_stats = {
-            'total_sales': float(df['quantity'].sum()),
-            'mean_daily_sales': float(df['quantity'].mean()),
-            'median_daily_sales': float(df['quantity'].median()),
-            'std_daily_sales': float(df['quantity'].std()),
-            'min_daily_sales': float(df['quantity'].min()),
-            'max_daily_sales': float(df['quantity'].max()),
-            'sales_range': float(df['quantity'].max() - df['quantity'].min())
-        }
-        
-        # 2. Trend Analysis
-        # Calculate 7-day and 30-day moving averages
-        df['ma7'] = df['quantity'].rolling(window=7).mean()
-        df['ma30'] = df['quantity'].rolling(window=30).mean()
-        
-        # Calculate trend direction
-        first_ma7 = df['ma7'].dropna().iloc[0]
-        last_ma7 = df['ma7'].dropna().iloc[-1]
-        trend_direction = "increasing" if last_ma7 > first_ma7 else "decreasing" if last_ma7 < first_ma7 else "stable"
-        
-        # 3. Seasonality Analysis
-        # Add day of week and month columns
-        df['day_of_week'] = df.index.dayofweek
-        df['month'] = df.index.month
-        
-        # Calculate average sales by day of week
-        daily_patterns = df.groupby('day_of_week')['quantity'].mean().to_dict()
-        
-        # Calculate average sales by month
-        monthly_patterns = df.groupby('month')['quantity'].mean().to_dict()
-        
-        # 4. Volatility Analysis
-        # Calculate coefficient of variation
-        cv = df['quantity'].std() / df['quantity'].mean() if df['quantity'].mean() != 0 else 0
-        
-        # 5. Growth Analysis
-        if len(df) > 1:
-            first_month_avg = df['quantity'].iloc[:len(df)//2].mean()
-            last_month_avg = df['quantity'].iloc[len(df)//2:].mean()
-            growth_rate = ((last_month_avg - first_month_avg) / first_month_avg * 100) if first_month_avg != 0 else 0
-        else:
-            growth_rate = 0
-        
-        # 6. Peak Analysis
-        peak_days = df.nlargest(3, 'quantity')
-        peak_analysis = {
-            'peak_dates': [d.strftime('%Y-%m-%d') for d in peak_days.index],
-            'peak_values': [float(v) for v in peak_days['quantity']]
-        }
-        
-        # 7. Low Sales Analysis
-        low_days = df.nsmallest(3, 'quantity')
-        low_analysis = {
-            'low_dates': [d.strftime('%Y-%m-%d') for d in low_days.index],
-            'low_values': [float(v) for v in low_days['quantity']]
-        }
-        
-        return {
-            'basic_stats': basic_stats,
-            'trend_analysis': {
-                'trend_direction': trend_direction,
-                'trend_strength': float(abs(last_ma7 - first_ma7) / first_ma7 * 100) if first_ma7 != 0 else 0
-            },
-            'seasonality': {
-                'daily_patterns': daily_patterns,
-                'monthly_patterns': monthly_patterns
-            },
-            'volatility': {
-                'coefficient_of_variation': float(cv),
-                'volatility_level': 'high' if cv > 1 else 'medium' if cv > 0.5 else 'low'
-            },
-            'growth': {
-                'growth_rate': float(growth_rate),
-                'growth_status': 'growing' if growth_rate > 5 else 'declining' if growth_rate < -5 else 'stable'
-            },
-            'peak_analysis': peak_analysis,
-            'low_analysis': low_analysis
-        }
+        # Basic stats, trend, seasonality, volatility, growth and peaks in one pass over the arrays
+        return pattern_statistics(*sales_arrays(data))
         
     except Exception as e:
         print(f"Error in sales pattern analysis: {str(e)}", file=sys.stderr)
         return {"error": str(e)}
 
+def update_sales_patterns(product_id: str, sale: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Pattern report for a product, kept up to date one sale at a time.
+
+    The first call for a product loads its history; later calls only add the
+    new sale (already stored in MongoDB) to the tracked statistics. A call
+    without a sale checks the tracked statistics against the stored history
+    and reloads them when sales were edited or deleted since.
+    """
+    try:
+        tracker = get_pattern_tracker()
+        accumulator = tracker.get(product_id)
+        if accumulator is not None and sale is None:
+            inventory_data = get_inventory_data(product_id)
+            if not accumulator.matches(inventory_data.dates, inventory_data.quantities):
+                accumulator = tracker.load(product_id, inventory_data.dates, inventory_data.quantities)
+            return accumulator.snapshot()
+        if accumulator is not None:
+            try:
+                # Sales are grouped by SALES_TIMEZONE day, as in the daily aggregation
+                day = pd.Timestamp(sale['date'])
+                if day.tzinfo is not None:
+                    day = day.tz_convert(SALES_TIMEZONE).tz_localize(None)
+                accumulator.add_sale(day.to_datetime64(), float(sale['quantity']))
+            except ValueError:
+                # Back-dated sale; rebuild from the stored history
+                accumulator = None
+        if accumulator is None:
+            inventory_data = get_inventory_data(product_id)
+            accumulator = tracker.load(product_id, inventory_data.dates, inventory_data.quantities)
+        return accumulator.snapshot()
+    except Exception as e:
+        print(f"Error in sales pattern update: {str(e)}", file=sys.stderr)
+        return {"error": str(e)}
+
+def optimization_input(product_id=None, is_demo=False):
+    """Daily sales for the product, or generated sample data in demo mode or when the product has too few sales."""
+    if not is_demo:
+        # Get inventory data from MongoDB
+        inventory_data = get_inventory_data(product_id)
+        
+        if not inventory_data:
+            log.info("No sales data found, falling back to demo mode")
+        elif inventory_data.records < 10:  # Reduced minimum requirement
+            log.info("Not enough sales data, falling back to demo mode")
+        else:
+            return inventory_data
+    
+    log.info("Using demo mode - generating sample data")
+    # For demo, use sample data
+    df = generate_sample_data()
+    return df.to_dict(orient='records')
+
+def model_product_id(product_id, data):
+    """Product ID to cache models under; None for generated demo data."""
+    return product_id if isinstance(data, DailySales) else None
+
 def optimize_stock_levels(product_id=None, is_demo=False):
     try:
-        print(f"Starting stock optimization with product_id={product_id}, is_demo={is_demo}", file=sys.stderr)
+        log.info("Starting stock optimization with product_id=%s, is_demo=%s", product_id, is_demo)
+        data = optimization_input(product_id, is_demo)
         
-        if is_demo:
-            print("Using demo mode - generating sample data", file=sys.stderr)
-            # For demo, use sample data
-            df = generate_sample_data()
-            data = df.to_dict(orient='records')
-            forecast_result = run_arima_forecast(data)
+        with stage('fit'):
+            forecast_result = run_arima_forecast(data, product_id=model_product_id(product_id, data))
+        with stage('analyze'):
             pattern_analysis = analyze_sales_patterns(data)
-            return {**forecast_result, 'pattern_analysis': pattern_analysis}
-        else:
-            # Get inventory data from MongoDB
-            inventory_data = get_inventory_data(product_id)
-            
-            if not inventory_data:
-                print("No sales data found, falling back to demo mode", file=sys.stderr)
-                return optimize_stock_levels(None, True)
-                
-            if len(inventory_data) < 10:  # Reduced minimum requirement
-                print("Not enough sales data, falling back to demo mode", file=sys.stderr)
-                return optimize_stock_levels(None, True)
-            
-            forecast_result = run_arima_forecast(inventory_data)
-            pattern_analysis = analyze_sales_patterns(inventory_data)
-            return {**forecast_result, 'pattern_analysis': pattern_analysis}
+        return {**forecast_result, 'pattern_analysis': pattern_analysis}
         
     except Exception as e:
         error_msg = f"Error in stock optimization: {str(e)}\n{traceback.format_exc()}"
         print(error_msg, file=sys.stderr)
         return {"error": error_msg}
 
+def stream_stock_levels(writer, product_id=None, is_demo=False):
+    """Write forecast rows, then each metrics section as soon as it is computed."""
+    try:
+        data = optimization_input(product_id, is_demo)
+        
+        with stage('fit'):
+            forecast_result = run_arima_forecast(data, columnar=True, product_id=model_product_id(product_id, data))
+        if 'error' in forecast_result:
+            writer.error(forecast_result['error'])
+        else:
+            writer.rows('point', forecast_result['forecast'])
+            writer.section('optimal_levels', forecast_result['optimal_levels'])
+        
+        with stage('analyze'):
+            pattern_analysis = analyze_sales_patterns(data)
+        writer.section('pattern_analysis', pattern_analysis)
+    except Exception as e:
+        error_msg = f"Error in stock optimization: {str(e)}\n{traceback.format_exc()}"
+        print(error_msg, file=sys.stderr)
+        writer.error(error_msg)
+    writer.end()
+
 if __name__ == "__main__":
+    # --ndjson streams typed records line by line (see ndjson.py) instead of one JSON document
+    streaming = wants_ndjson(sys.argv)
+    args = strip_flags(sys.argv[1:])
     try:
-        if len(sys.argv) < 2:
+        if not args:
             print(json.dumps({"error": "No arguments provided"}))
             sys.exit(1)
             
-        script_path = sys.argv[0]
-        product_id = sys.argv[1] if sys.argv[1] != 'demo' else None
+        product_id = args[0] if args[0] != 'demo' else None
         is_demo = product_id is None
         
-        print(f"Running script with product_id={product_id}, is_demo={is_demo}", file=sys.stderr)
-        result = optimize_stock_levels(product_id, is_demo)
-        print(json.dumps(result))
+        log.info("Running script with product_id=%s, is_demo=%s", product_id, is_demo)
+        with start_trace('optimize'):
+            if streaming:
+                stream_stock_levels(NDJSONWriter(), product_id, is_demo)
+            else:
+                result = optimize_stock_levels(product_id, is_demo)
+                with stage('serialize'):
+                    output = json.dumps(result)
+        if not streaming:
+            print(output)
         
     except Exception as e:
         error_msg = f"Error in main: {str(e)}\n{traceback.format_exc()}"
         print(json.dumps({"error": error_msg}), file=sys.stderr)
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,89 @@
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import anomaly_batch
+from ndjson import NDJSONWriter
+
+
+def sales(values, start='2024-01-01'):
+    return [{'date': day.strftime('%Y-%m-%d'), 'quantity': float(value)}
+            for day, value in zip(pd.date_range(start, periods=len(values)), values)]
+
+
+def quiet(days=60, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.round(20 + rng.normal(0, 1, days), 1)
+
+
+def crashing_detect(product_id, sales, time_budget=None, columnar=False, timezone=None):
+    time.sleep(0.2)
+    if product_id == 'boom':
+        os._exit(1)
+    return {'product_id': product_id, 'anomalies': [], 'method': 'arima'}
+
+
+def slow_detect(product_id, sales, time_budget=None, columnar=False, timezone=None):
+    time.sleep(30 if product_id == 'slow' else 0.1)
+    return {'product_id': product_id, 'anomalies': [], 'method': 'arima'}
+
+
+def test_only_the_crashing_product_fails(monkeypatch):
+    monkeypatch.setattr(anomaly_batch, 'detect_product', crashing_detect)
+    products = [(product_id, None) for product_id in ('a', 'b', 'boom', 'c', 'd')]
+    results = list(anomaly_batch.detect_batch(products, max_workers=2, screen=False))
+    failures = {result['product_id']: result['error'] for result in results if 'error' in result}
+    assert failures == {'boom': 'Anomaly worker process died'}
+    assert sorted(result['product_id'] for result in results) == ['a', 'b', 'boom', 'c', 'd']
+
+
+def test_timed_out_product_fails_and_others_finish(monkeypatch):
+    monkeypatch.setattr(anomaly_batch, 'detect_product', slow_detect)
+    products = [(product_id, None) for product_id in ('a', 'slow', 'b', 'c')]
+    started = time.monotonic()
+    results = list(anomaly_batch.detect_batch(products, max_workers=2, timeout=2, screen=False))
+    assert time.monotonic() - started < 15
+    failures = {result['product_id']: result['error'] for result in results if 'error' in result}
+    assert failures == {'slow': 'Anomaly detection timed out after 2s'}
+    assert len(results) == 4
+
+
+def test_screen_settles_quiet_and_short_products(monkeypatch):
+    escalated = []
+
+    def detect(product_id, sales, time_budget=None, columnar=False, timezone=None):
+        escalated.append(product_id)
+        return {'product_id': product_id, 'anomalies': [], 'method': 'arima'}
+
+    monkeypatch.setattr(anomaly_batch, 'detect_product', detect)
+    spiky = quiet(seed=1)
+    spiky[40] += 60
+    products = [('quiet', sales(quiet())), ('spiky', sales(spiky)), ('short', sales(quiet(days=5)))]
+    results = {result['product_id']: result for result in anomaly_batch.detect_batch(products, max_workers=1)}
+
+    assert escalated == ['spiky']
+    assert results['quiet']['method'] == 'screen'
+    assert results['quiet']['anomalies'] == []
+    assert 'Not enough sales data' in results['short']['error']
+
+
+def test_stream_batch_records():
+    spiky = quiet(seed=2)
+    spiky[45] += 80
+    stream = io.StringIO()
+    anomaly_batch.stream_batch(NDJSONWriter(stream), [('spiky', sales(spiky)), ('short', sales([1, 2]))],
+                               max_workers=1)
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    kinds = [record['type'] for record in records]
+    assert kinds[0] == 'error' and records[0]['product_id'] == 'short'
+    section = records[kinds.index('section')]
+    assert section['data']['method'] == 'arima'
+    rows = [record for record in records if record['type'] == 'anomaly']
+    assert section['data']['anomalies'] == len(rows)
+    assert '2024-02-15' in [row['date'] for row in rows]
+    assert records[-1] == {'type': 'end', 'products': 1, 'failed': 1, 'escalated': 1}
@@ -0,0 +1,110 @@
+import io
+import json
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+import backtest
+from ndjson import NDJSONWriter
+from sales_series import DailySales
+
+
+@pytest.fixture
+def catalogue(monkeypatch):
+    """Two products with sales, one requested product without any."""
+    rng = np.random.default_rng(4)
+    dates = np.datetime64('2024-01-01') + np.arange(80)
+    weekly = 10 + 4 * np.sin(np.arange(80) * 2 * np.pi / 7)
+    sales = {
+        str(ObjectId()): DailySales(dates, np.round(weekly + rng.normal(0, 1, 80), 1), 80),
+        str(ObjectId()): DailySales(dates, rng.poisson(3, 80).astype(float), 80),
+    }
+    monkeypatch.setattr(backtest, 'get_database', lambda: {'sales': None})
+
+    def fetch_daily_sales_by_product(collection, object_ids):
+        wanted = sales if object_ids is None else [str(object_id) for object_id in object_ids]
+        return {product_id: sales[product_id] for product_id in wanted if product_id in sales}
+
+    monkeypatch.setattr(backtest, 'fetch_daily_sales_by_product', fetch_daily_sales_by_product)
+    return sorted(sales), str(ObjectId())
+
+
+def test_fold_origins():
+    np.testing.assert_array_equal(backtest.fold_origins(100, 14, 3), [58, 72, 86])
+    np.testing.assert_array_equal(backtest.fold_origins(100, 14, 3, step=7), [72, 79, 86])
+    np.testing.assert_array_equal(backtest.fold_origins(60, 14, 3), [32, 46])
+
+
+def test_moving_average_folds_use_days_before_origin():
+    values = np.arange(40.0)
+    forecasts = backtest.moving_average_folds(values, np.array([30, 35]), 3)
+    np.testing.assert_allclose(forecasts, [[26.0] * 3, [31.0] * 3])
+
+
+def test_accuracy_scores():
+    values = np.tile([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0], 6)
+    origins = np.array([28, 35])
+    perfect = values[origins[:, None] + np.arange(7)]
+    scores = backtest.accuracy(values, origins, perfect)
+    assert scores == {'mape': 0.0, 'mase': None, 'mae': 0.0, 'rmse': 0.0}
+
+    off = backtest.accuracy(values, origins, perfect + 1)
+    assert off['mae'] == 1.0 and off['rmse'] == 1.0
+    assert off['mape'] == pytest.approx(np.mean(1 / np.tile(np.arange(1, 8), 2)) * 100)
+
+
+def test_arima_folds_filter_with_first_fold_parameters():
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    rng = np.random.default_rng(5)
+    values = np.zeros(100)
+    for t in range(1, 100):
+        values[t] = 0.5 * values[t - 1] + rng.normal(0, 1)
+    values += 20
+    origins = backtest.fold_origins(100, 7, 3)
+    forecasts = backtest.arima_folds(values, origins, 7)
+
+    from stock_optimization import find_best_arima_order
+    order = find_best_arima_order(values[:origins[0]])
+    first = SARIMAX(values[:origins[0]], order=order).fit(disp=False, maxiter=backtest.ARIMA_MAXITER)
+    for fold, origin in enumerate(origins):
+        expected = SARIMAX(values[:origin], order=order).filter(first.params).forecast(7)
+        np.testing.assert_allclose(forecasts[fold], expected, rtol=1e-6)
+
+
+def test_backtest_model_errors():
+    result = backtest.backtest_model('p1', 'moving_average', None, np.ones(20))
+    assert 'Not enough history' in result['error']
+    assert 'Unknown model' in backtest.backtest_model('p1', 'naive', None, np.ones(80))['error']
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_backtest_catalogue(catalogue, max_workers):
+    (first, second), missing = catalogue
+    results = backtest.backtest_catalogue([first, second, missing, 'bad-id'], ['moving_average', 'croston'],
+                                          max_workers=max_workers)
+    assert results[0] == {'product_id': 'bad-id', 'error': 'Invalid product ID format: bad-id'}
+    by_id = {result['product_id']: result for result in results[1:]}
+    assert set(by_id) == {first, second, missing}
+    assert set(by_id[first]['models']) == {'moving_average', 'croston'}
+    # 80 days fit three of the five folds
+    assert by_id[first]['models']['moving_average']['folds'] == 3
+    assert by_id[first]['best'] in ('moving_average', 'croston')
+    assert by_id[missing]['best'] is None
+
+
+def test_stream_backtest_records(catalogue):
+    (first, second), _ = catalogue
+    stream = io.StringIO()
+    backtest.stream_backtest(NDJSONWriter(stream), [first, 'bad-id'], ['moving_average'], max_workers=1)
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record['type'] for record in records] == ['error', 'section', 'end']
+    assert records[0]['product_id'] == 'bad-id'
+    assert records[1]['name'] == 'product' and records[1]['data']['product_id'] == first
+    assert records[2] == {'type': 'end', 'products': 1, 'failed': 1}
+
+
+def test_unknown_models_are_rejected(catalogue):
+    with pytest.raises(ValueError):
+        backtest.backtest_catalogue('all', ['naive'])
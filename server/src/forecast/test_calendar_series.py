@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from calendar_series import CalendarCache, CalendarSeries, bucket_start, to_epoch_days
+from sales_series import DailySales
+
+JAN_1 = int(np.datetime64('2024-01-01').astype(np.int64))
+
+
+def daily(days, quantities):
+    dates = (JAN_1 + np.asarray(days)).astype('datetime64[D]')
+    return DailySales(dates, np.asarray(quantities, dtype=np.float64), len(days))
+
+
+def test_sale_records_fill_gaps_with_zeros():
+    series = CalendarSeries.from_sales([{'date': '2024-01-03', 'quantity': 2}, {'date': '2024-01-01', 'quantity': 1},
+                                        {'date': '2024-01-03', 'quantity': 4}])
+    assert series.start == JAN_1
+    np.testing.assert_array_equal(series.values, [1.0, 0.0, 6.0])
+    assert series.records == 3
+
+
+def test_offset_timestamps_use_the_timezone():
+    days = to_epoch_days(np.array(['2024-01-01T23:30:00+00:00', '2024-01-02T01:00:00+00:00']), 'Asia/Tokyo')
+    np.testing.assert_array_equal(days, [JAN_1 + 1, JAN_1 + 1])
+
+
+def test_weeks_start_on_monday():
+    # 2024-01-01 was a Monday
+    np.testing.assert_array_equal(bucket_start(JAN_1 + np.array([0, 6, 7, 13])), JAN_1 + np.array([0, 6, 7, 13]))
+    np.testing.assert_array_equal(bucket_start(JAN_1 + np.array([0, 6, 7, 13]), 'W'), JAN_1 + np.array([0, 0, 7, 7]))
+    series = CalendarSeries.from_days(JAN_1 + np.arange(14), np.ones(14)).resample('W')
+    np.testing.assert_array_equal(series.values, [7.0, 7.0])
+
+
+def test_append_replaces_last_bucket_and_grows():
+    series = CalendarSeries.from_days(JAN_1 + np.arange(3), [1.0, 2.0, 3.0])
+    series.append(JAN_1 + np.array([2, 5]), [4.0, 1.0], records=2)
+    np.testing.assert_array_equal(series.values, [1.0, 2.0, 4.0, 0.0, 0.0, 1.0])
+    series.append(JAN_1 + np.array([7]), [2.0])
+    np.testing.assert_array_equal(series.values, [1.0, 2.0, 4.0, 0.0, 0.0, 1.0, 0.0, 2.0])
+    with pytest.raises(ValueError):
+        series.append(JAN_1 + np.array([1]), [1.0])
+
+
+def test_cache_appends_unchanged_history():
+    cache = CalendarCache()
+    first = cache.calendar('p1', daily([0, 1, 3], [1, 2, 3]))
+    second = cache.calendar('p1', daily([0, 1, 3, 4, 6], [1, 2, 3, 5, 1]))
+    assert second is first
+    np.testing.assert_array_equal(second.values, [1, 2, 0, 3, 5, 0, 1])
+    assert second.records == 5
+
+
+def test_cache_rebuilds_when_last_day_total_changes():
+    cache = CalendarCache()
+    first = cache.calendar('p1', daily([0, 1, 2], [1, 2, 3]))
+    # A stored total that differs from the cached last day is revised history, not an append
+    second = cache.calendar('p1', daily([0, 1, 2], [1, 2, 5]))
+    assert second is not first
+    np.testing.assert_array_equal(second.values, [1, 2, 5])
+
+
+@pytest.mark.parametrize('days, quantities', [
+    ([0, 1, 2, 3], [1, 9, 3, 4]),    # revised earlier day
+    ([0, 2, 3], [1, 3, 4]),          # deleted day
+    ([1, 2, 3], [2, 3, 4]),          # deleted first day
+    ([0, 1], [1, 2]),                # ends before the cached series
+    ([0, 1, 2], [1, 2, 0.5]),        # last day lowered
+])
+def test_cache_rebuilds_revised_history(days, quantities):
+    cache = CalendarCache()
+    cache.calendar('p1', daily([0, 1, 2], [1, 2, 3]))
+    series = cache.calendar('p1', daily(days, quantities))
+    expected = CalendarSeries.from_sales(daily(days, quantities))
+    assert series.start == expected.start
+    np.testing.assert_array_equal(series.values, expected.values)
+
+
+def test_weekly_cache_checks_last_week():
+    cache = CalendarCache()
+    cache.calendar('p1', daily([0, 7, 8], [1, 2, 3]), 'W')
+    grown = cache.calendar('p1', daily([0, 7, 8, 9, 15], [1, 2, 3, 4, 5]), 'W')
+    np.testing.assert_array_equal(grown.values, [1, 9, 5])
+    revised = cache.calendar('p1', daily([0, 7, 9, 15], [1, 2, 4, 5]), 'W')
+    np.testing.assert_array_equal(revised.values, [1, 6, 5])
+
+
+def test_cache_does_not_write_into_caller_arrays():
+    sales = daily([0, 1, 2], [1, 2, 3])
+    cache = CalendarCache()
+    cache.calendar('p1', sales)
+    cache.calendar('p1', daily([0, 1, 2, 3], [1, 2, 3, 4]))
+    np.testing.assert_array_equal(sales.quantities, [1, 2, 3])
+
+
+def test_cache_evicts_least_recently_used():
+    cache = CalendarCache(max_entries=2)
+    for key in ('a', 'b'):
+        cache.calendar(key, daily([0], [1]))
+    cache.calendar('a', daily([0], [1]))
+    cache.calendar('c', daily([0], [1]))
+    assert list(cache.entries) == ['a', 'c']
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+import demo_dataset
+
+CSV = """Date,Store ID,Product ID,Category,Units Sold
+2024-01-02,S1,P1,Toys,3
+2024-01-01,S1,P1,Toys,1
+2024-01-01,S2,P1,Toys,2
+2024-01-01,S1,P2,Games,4
+2024-01-03,S2,P2,Games,5
+2024-01-01,S1,P1,Toys,6
+"""
+
+
+@pytest.fixture
+def csv_path(tmp_path, monkeypatch):
+    monkeypatch.setenv('DEMO_CACHE_DIR', str(tmp_path / 'demo'))
+    path = tmp_path / 'retail.csv'
+    path.write_text(CSV)
+    return str(path)
+
+
+def test_totals_per_day(csv_path):
+    sales = demo_dataset.load_demo_table(csv_path).daily()
+    np.testing.assert_array_equal(sales.dates, np.array(['2024-01-01', '2024-01-02', '2024-01-03'],
+                                                        dtype='datetime64[D]'))
+    np.testing.assert_array_equal(sales.quantities, [13, 3, 5])
+    assert sales.records == 6
+
+
+def test_store_and_product_filters(csv_path):
+    table = demo_dataset.load_demo_table(csv_path)
+    sales = table.daily(store_id='S1', product_id='P1')
+    np.testing.assert_array_equal(sales.quantities, [7, 3])
+    assert sales.records == 3
+    assert set(table.breakdown('product')) == {'P1', 'P2'}
+    np.testing.assert_array_equal(table.breakdown('store')['S2'].quantities, [2, 5])
+    with pytest.raises(KeyError):
+        table.daily(store_id='S9')
+    with pytest.raises(ValueError):
+        table.breakdown('category')
+
+
+def test_second_load_reads_cached_columns(csv_path, monkeypatch):
+    first = demo_dataset.load_demo_table(csv_path).daily()
+    monkeypatch.setattr(demo_dataset, 'parse_csv', lambda path: pytest.fail('CSV parsed again'))
+    second = demo_dataset.load_demo_table(csv_path).daily()
+    np.testing.assert_array_equal(first.quantities, second.quantities)
+
+
+def test_changed_csv_replaces_cache(csv_path):
+    demo_dataset.load_demo_table(csv_path)
+    with open(csv_path, 'a') as f:
+        f.write("2024-01-04,S1,P1,Toys,8\n")
+    assert demo_dataset.load_demo_table(csv_path).daily().quantities[-1] == 8
+    assert len(os.listdir(os.environ['DEMO_CACHE_DIR'])) == 1
+
+
+def test_optional_id_columns(tmp_path, monkeypatch):
+    monkeypatch.setenv('DEMO_CACHE_DIR', str(tmp_path / 'demo'))
+    path = tmp_path / 'totals.csv'
+    path.write_text("Date,Units Sold\n2024-01-01,2\n2024-01-01,3\n")
+    table = demo_dataset.load_demo_table(str(path))
+    assert table.stores == ['all'] and table.products == ['all']
+    np.testing.assert_array_equal(table.daily().quantities, [5])
+
+
+def test_missing_required_column(tmp_path):
+    path = tmp_path / 'bad.csv'
+    path.write_text("Date,Units\n2024-01-01,2\n")
+    with pytest.raises(demo_dataset.MissingColumnsError):
+        demo_dataset.parse_csv(str(path))
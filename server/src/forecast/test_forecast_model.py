@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+import pytest
+
+import stock_optimization
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """Counts order searches; the fake search finishes (complete=True) unless told otherwise."""
+    calls = {'count': 0, 'complete': True}
+
+    def search_arima_order(values, product_id=None, time_budget=None):
+        calls['count'] += 1
+        return (1, 0, 0), calls['complete']
+
+    monkeypatch.setattr(stock_optimization, 'search_arima_order', search_arima_order)
+    return calls
+
+
+def series(days, seed=7):
+    rng = np.random.default_rng(seed)
+    values = np.zeros(days)
+    for t in range(1, days):
+        values[t] = 0.5 * values[t - 1] + rng.normal(0, 1)
+    return values + 10
+
+
+def fit(values, namespace=stock_optimization.NAMESPACE):
+    return stock_optimization.fit_forecast_model(values, 'p1', time.monotonic() + 30, namespace)
+
+
+def test_unchanged_series_is_cached_and_new_day_warm_starts(searches):
+    values = series(81)
+    assert fit(values[:80])[2] == 'searched'
+    results, order, source = fit(values[:80])
+    assert (order, source) == ((1, 0, 0), 'cached')
+    assert fit(values)[2] == 'warm'
+    assert searches['count'] == 1
+    assert np.isfinite(results.forecast(3)).all()
+
+
+def test_incomplete_search_is_not_reused(searches):
+    searches['complete'] = False
+    values = series(81)
+    fit(values[:80])
+    assert fit(values[:80])[2] == 'searched'
+    assert fit(values)[2] == 'searched'
+    assert searches['count'] == 3
+
+
+def test_old_order_is_searched_again(searches, monkeypatch):
+    values = series(81)
+    fit(values[:80])
+    monkeypatch.setattr(stock_optimization, 'ORDER_MAX_AGE', 0)
+    assert fit(values)[2] == 'searched'
+    assert searches['count'] == 2
+
+
+def test_namespaces_keep_separate_fits(searches):
+    values = series(80)
+    fit(values)
+    assert fit(values, stock_optimization.DEMAND_NAMESPACE)[2] == 'searched'
+    assert fit(values)[2] == 'cached'
+
+
+def test_passed_deadline_raises(searches):
+    with pytest.raises(stock_optimization.BudgetExceeded):
+        stock_optimization.fit_forecast_model(series(80), 'p1', time.monotonic() - 1)
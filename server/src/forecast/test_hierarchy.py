@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+import hierarchy
+from hierarchy import Hierarchy, reconcile, shrinkage_covariance
+from sales_series import DailySales
+
+
+@pytest.fixture
+def tree():
+    return Hierarchy(['p1', 'p2', 'p3'], ['food', 'food', 'toys'], ['acme', hierarchy.UNBRANDED, 'acme'])
+
+
+def test_summing_matrix_rows(tree):
+    assert tree.nodes == [('total', 'total'), ('category', 'food'), ('category', 'toys'),
+                          ('brand', 'acme'), ('brand', 'unbranded'),
+                          ('product', 'p1'), ('product', 'p2'), ('product', 'p3')]
+    np.testing.assert_array_equal(tree.aggregate(np.array([1.0, 2.0, 4.0])), [7, 3, 4, 5, 2, 1, 2, 4])
+
+
+@pytest.mark.parametrize('method', ['ols', 'wls', 'mint'])
+def test_reconciled_forecasts_keep_coherent_base(tree, method):
+    rng = np.random.default_rng(0)
+    bottom = rng.uniform(1, 5, (3, 4))
+    residuals = rng.normal(0, 1, (len(tree.nodes), 50))
+    np.testing.assert_allclose(reconcile(tree.aggregate(bottom), tree, method, residuals), bottom)
+
+
+@pytest.mark.parametrize('method', ['ols', 'wls', 'mint'])
+def test_reconciliation_moves_incoherent_base(tree, method):
+    rng = np.random.default_rng(1)
+    base = tree.aggregate(rng.uniform(1, 5, (3, 4)))
+    base[0] += 6
+    residuals = rng.normal(0, 1, (len(tree.nodes), 50))
+    products = reconcile(base, tree, method, residuals)
+    assert products.shape == (3, 4)
+    # Part of the extra total lands on the products
+    assert products.sum() > base[-3:].sum()
+    assert products.sum() < base[0].sum()
+
+
+def test_bottom_up_and_unknown_method(tree):
+    base = np.arange(8.0)[:, None]
+    np.testing.assert_array_equal(reconcile(base, tree, 'bottom_up'), [[5], [6], [7]])
+    with pytest.raises(ValueError):
+        reconcile(base, tree, 'median')
+
+
+def test_shrinkage_covariance_is_positive_definite_with_few_days():
+    residuals = np.random.default_rng(2).normal(0, 1, (20, 5))
+    covariance = shrinkage_covariance(residuals)
+    np.testing.assert_allclose(covariance, covariance.T)
+    assert np.linalg.eigvalsh(covariance).min() > 0
+
+
+def test_sparse_node_uses_moving_average():
+    values = np.zeros(30)
+    values[[3, 10, 20]] = 7.0
+    fit = hierarchy.fit_node('hierarchy-product-p1', values, horizon=5)
+    assert fit['model']['method'] == 'moving_average'
+    np.testing.assert_allclose(fit['forecast'], np.full(5, values[-7:].mean()))
+    assert len(fit['residuals']) == len(values)
+
+
+def test_forecast_hierarchy_is_coherent(monkeypatch):
+    rng = np.random.default_rng(3)
+    dates = np.datetime64('2024-01-01') + np.arange(40)
+    sales = {product_id: DailySales(dates, rng.poisson(5, len(dates)).astype(float), len(dates))
+             for product_id in ('p1', 'p2', 'p3')}
+    monkeypatch.setattr(hierarchy, 'fetch_product_hierarchy', lambda category_id, brand_id: {
+        'p1': ('food', 'acme'), 'p2': ('food', hierarchy.UNBRANDED), 'p3': ('toys', 'acme')})
+    monkeypatch.setattr(hierarchy, 'fetch_daily_sales_by_product', lambda collection, object_ids: sales)
+    monkeypatch.setattr(hierarchy, 'get_database', lambda: {'sales': None})
+
+    def fit_node(node_key, values, horizon):
+        forecast, residuals = hierarchy._moving_average_fit(values, horizon)
+        return {'forecast': forecast, 'residuals': residuals, 'model': {'method': 'moving_average'}}
+
+    monkeypatch.setattr(hierarchy, 'fit_node', fit_node)
+
+    result = hierarchy.forecast_hierarchy(method='mint', horizon=7, max_workers=1)
+    assert result['dates'][0] == '2024-02-10' and len(result['dates']) == 7
+    forecasts = {(node['level'], node['id']): np.array(node['forecast']) for node in result['nodes']}
+    products = sum(forecasts[('product', product_id)] for product_id in ('p1', 'p2', 'p3'))
+    np.testing.assert_allclose(forecasts[('total', 'total')], products)
+    np.testing.assert_allclose(forecasts[('category', 'food')],
+                               forecasts[('product', 'p1')] + forecasts[('product', 'p2')])
+    assert all('base' in node for node in result['nodes'])
+
+
+def test_forecast_hierarchy_rejects_unknown_method():
+    assert 'error' in hierarchy.forecast_hierarchy(method='median')
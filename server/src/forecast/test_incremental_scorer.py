@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from arima_anomaly_detector import ARIMAAnomalyDetector, IncrementalAnomalyScorer
+
+START = pd.Timestamp('2024-01-01')
+
+
+def daily_sales(values, start=START):
+    days = pd.date_range(start, periods=len(values))
+    return [{'date': day.strftime('%Y-%m-%d'), 'quantity': float(value)} for day, value in zip(days, values)]
+
+
+@pytest.fixture
+def history():
+    rng = np.random.default_rng(3)
+    values = np.zeros(140)
+    for t in range(1, len(values)):
+        values[t] = 0.6 * values[t - 1] + rng.normal(0, 1)
+    return np.round(values + 20, 2)
+
+
+def test_incremental_state_matches_full_filter(history):
+    scorer = IncrementalAnomalyScorer(drift_limit=100)
+    first = scorer.score('p1', daily_sales(history[:120]))
+    assert first['mode'] == 'full'
+    state = scorer.states['p1']
+    order, params = state['detector'].model.order, state['detector'].model_fit.params
+
+    for end in range(121, len(history) + 1):
+        result = scorer.score('p1', daily_sales(history[:end]))
+        assert result['mode'] == 'incremental'
+
+    # Extending the stored filter day by day leaves it where filtering all closed days at once does
+    from statsmodels.tsa.arima.model import ARIMA
+    full = ARIMA(history[:-1], order=order).filter(params)
+    np.testing.assert_allclose(state['results'].forecast(3), full.forecast(3), rtol=1e-8)
+    assert state['count'] == len(history) - 1
+    assert state['open_date'] == START + pd.Timedelta(days=len(history) - 1)
+
+
+def test_spike_flagged_by_full_and_incremental_scoring(history):
+    spiked = history.copy()
+    spiked[130] += 15
+    spike_day = (START + pd.Timedelta(days=130)).strftime('%Y-%m-%d')
+
+    scorer = IncrementalAnomalyScorer(drift_limit=100)
+    scorer.score('p1', daily_sales(spiked[:120]))
+    incremental = scorer.score('p1', daily_sales(spiked))
+    full = ARIMAAnomalyDetector('p1').detect_anomalies(daily_sales(spiked))
+
+    assert spike_day in [anomaly['date'] for anomaly in incremental['anomalies']]
+    assert spike_day in [anomaly['date'] for anomaly in full['anomalies']]
+
+
+def test_open_day_is_rescored_not_closed(history):
+    scorer = IncrementalAnomalyScorer(drift_limit=100)
+    scorer.score('p1', daily_sales(history[:120]))
+    count = scorer.states['p1']['count']
+
+    more = history[:120].copy()
+    more[-1] += 1
+    result = scorer.score('p1', daily_sales(more))
+    assert result['mode'] == 'incremental'
+    assert result['scored_points'] == 1
+    assert scorer.states['p1']['count'] == count
+    assert scorer.states['p1']['open_value'] == more[-1]
+
+
+def test_revised_closed_day_refits(history):
+    scorer = IncrementalAnomalyScorer(drift_limit=100)
+    scorer.score('p1', daily_sales(history[:120]))
+    revised = history[:125].copy()
+    revised[50] += 3
+    assert scorer.score('p1', daily_sales(revised))['mode'] == 'full'
+
+
+def test_partial_input_needs_history_for_unknown_product(history):
+    scorer = IncrementalAnomalyScorer()
+    result = scorer.score('p1', daily_sales(history[-3:]), partial=True)
+    assert result['mode'] == 'needs_history'
+    assert 'p1' not in scorer.states
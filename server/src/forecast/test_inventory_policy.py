@@ -0,0 +1,81 @@
+from statistics import NormalDist
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+import inventory_policy
+from inventory_policy import compute_policies, demand_stats, policy_levels, service_level_z, what_if
+from sales_series import DailySales
+
+
+def test_service_level_table_matches_inverse_normal():
+    for level in (0.5, 0.9, 0.95, 0.99):
+        assert service_level_z(level) == pytest.approx(NormalDist().inv_cdf(level), abs=1e-6)
+    assert service_level_z(1.0) == service_level_z(inventory_policy.MAX_SERVICE_LEVEL)
+
+
+def test_policy_formulas():
+    policy = compute_policies(10.0, 3.0, lead_time=4, service_level=0.95, ordering_cost=50, holding_cost=2,
+                              lead_time_std=1.0)
+    z = NormalDist().inv_cdf(0.95)
+    safety_stock = z * np.sqrt(4 * 9 + 100 * 1)
+    eoq = np.sqrt(2 * 3650 * 50 / 2)
+    assert policy['safety_stock'] == pytest.approx(safety_stock, rel=1e-6)
+    assert policy['reorder_point'] == pytest.approx(40 + safety_stock, rel=1e-6)
+    assert policy['economic_order_quantity'] == pytest.approx(eoq)
+    assert policy['annual_cost'] == pytest.approx(50 * 3650 / eoq + 2 * (eoq / 2 + safety_stock), rel=1e-6)
+
+
+def test_policies_broadcast_per_sku():
+    policy = compute_policies([0.0, 5.0, 10.0], [0.0, 1.0, 2.0], lead_time=[7, 7, 14])
+    assert policy['safety_stock'].shape == (3,)
+    assert policy['economic_order_quantity'][0] == 0
+    assert policy['annual_cost'][0] == 0
+    assert policy['reorder_point'][2] == pytest.approx(140 + policy['safety_stock'][2])
+
+
+@pytest.mark.parametrize('holding_cost', [0.0, -1.0, [0.2, 0.0]])
+def test_non_positive_holding_cost_is_rejected(holding_cost):
+    with pytest.raises(ValueError, match='holding_cost must be positive'):
+        compute_policies([5.0, 5.0], [1.0, 1.0], holding_cost=holding_cost)
+    with pytest.raises(ValueError, match='holding_cost must be positive'):
+        what_if(5.0, 1.0, {'holding_cost': np.atleast_1d(holding_cost).tolist()})
+
+
+def test_demand_stats_leave_out_days_before_first_sale():
+    mean, std = demand_stats([[np.nan, np.nan, 2.0, 4.0], [1.0, 1.0, 1.0, 1.0], [np.nan, np.nan, np.nan, 3.0]])
+    np.testing.assert_allclose(mean, [3.0, 1.0, 3.0])
+    np.testing.assert_allclose(std, [np.sqrt(2.0), 0.0, 0.0])
+
+
+def test_policy_levels_for_one_history():
+    levels = policy_levels([4.0, 6.0, 5.0, 5.0], lead_time=2)
+    assert levels['mean_demand'] == 5.0
+    assert levels['reorder_point'] == pytest.approx(10 + levels['safety_stock'])
+
+
+def test_what_if_grid_rows():
+    table = what_if([5.0, 8.0], [1.0, 2.0], {'service_level': [0.9, 0.99], 'lead_time': [7, 14]}, ordering_cost=20)
+    assert table['scenarios'][1] == {'service_level': 0.9, 'lead_time': 14.0}
+    assert table['safety_stock'].shape == (4, 2)
+    single = compute_policies([5.0, 8.0], [1.0, 2.0], service_level=0.9, lead_time=14, ordering_cost=20)
+    np.testing.assert_allclose(table['reorder_point'][1], single['reorder_point'])
+    with pytest.raises(ValueError):
+        what_if(5.0, 1.0, {'budget': [1]})
+
+
+def test_catalogue_policies(monkeypatch):
+    first, second = str(ObjectId()), str(ObjectId())
+    dates = np.datetime64('2024-01-01') + np.arange(4)
+    sales = {first: DailySales(dates, np.array([2.0, 4.0, 0.0, 6.0]), 4),
+             second: DailySales(dates[2:], np.array([3.0, 5.0]), 2)}
+    monkeypatch.setattr(inventory_policy, 'fetch_daily_sales_by_product', lambda collection, object_ids: sales)
+    monkeypatch.setattr(inventory_policy, 'get_database', lambda: {'sales': None})
+
+    table = inventory_policy.catalogue_policies(lead_times={second: 14})
+    assert table['product_id'] == sorted([first, second])
+    row = table['product_id'].index(second)
+    assert table['mean_demand'][row] == 4.0
+    assert table['reorder_point'][row] == pytest.approx(56 + table['safety_stock'][row])
+    assert inventory_policy.catalogue_policies(holding_cost=0) == {'error': 'holding_cost must be positive'}
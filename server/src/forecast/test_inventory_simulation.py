@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from bson import ObjectId
+
+import inventory_simulation
+from inventory_simulation import sample_demand_paths, simulate_policies
+from sales_series import DailySales
+
+
+def mean_demand(values, dates, product_id=None, horizon=inventory_simulation.DEFAULT_HORIZON, model='arima'):
+    return np.full(horizon, values.mean()), values - values.mean(), 'mean'
+
+
+def test_policy_that_never_reorders_runs_out():
+    demand = np.ones((1, 10))
+    result = simulate_policies(demand, reorder_point=-1, order_quantity=5, initial_stock=3, holding_cost=365)
+    assert result['fill_rate'][0] == pytest.approx(0.3)
+    assert result['stockout_days'][0] == 7
+    assert result['orders'][0] == 0
+    # Stock left at the end of each day: 2 + 1 + 0 + ...
+    assert result['holding_cost'][0] == pytest.approx(3)
+
+
+def test_orders_arrive_after_the_lead_time():
+    demand = np.ones((1, 12))
+    result = simulate_policies(demand, reorder_point=2, order_quantity=5, lead_time=2)
+    assert result['fill_rate'][0] == 1
+    assert result['orders'][0] == 2
+
+    late = simulate_policies(demand, reorder_point=2, order_quantity=5, lead_time=5)
+    assert late['fill_rate'][0] < 1
+
+
+def test_higher_reorder_points_serve_more():
+    rng = np.random.default_rng(0)
+    demand = rng.poisson(5, (200, 60)).astype(float)
+    result = simulate_policies(demand, [10, 30, 50], [40, 40, 40], lead_time=5)
+    assert np.all(np.diff(result['fill_rate']) >= 0)
+    assert np.all(np.diff(result['holding_cost']) > 0)
+    assert result['fill_rate_p5'][0] <= result['fill_rate'][0]
+
+
+def test_demand_paths_resample_residual_blocks():
+    rng = np.random.default_rng(1)
+    paths = sample_demand_paths(np.full(21, 100.0), np.arange(30.0), 50, rng, block=7)
+    assert paths.shape == (50, 21)
+    steps = np.diff(paths.reshape(50, 3, 7), axis=2)
+    assert np.all(steps == 1)
+    assert np.all(sample_demand_paths(np.full(5, -3.0), [np.nan], 4, rng) == 0)
+
+
+def test_recommended_policy_reaches_target(monkeypatch):
+    monkeypatch.setattr(inventory_simulation, 'demand_model', mean_demand)
+    rng = np.random.default_rng(2)
+    dates = np.datetime64('2024-01-01') + np.arange(90)
+    sales = DailySales(dates, rng.poisson(8, 90).astype(float), 90)
+    result = inventory_simulation.evaluate_sku('p1', sales, n_paths=200, horizon=90, seed=3)
+    policies = result['policies']
+    assert result['demand_model'] == 'mean'
+    assert len(policies['fill_rate']) == len(inventory_simulation.DEFAULT_SERVICE_LEVELS)
+    assert policies['fill_rate'][result['recommended']] >= inventory_simulation.DEFAULT_TARGET_FILL_RATE
+
+    again = inventory_simulation.evaluate_sku('p1', sales, n_paths=200, horizon=90, seed=3)
+    assert again['policies'] == policies
+
+
+def test_unknown_demand_model():
+    dates = np.datetime64('2024-01-01') + np.arange(30)
+    result = inventory_simulation.evaluate_sku('p1', DailySales(dates, np.ones(30), 30), model='croston')
+    assert 'Unknown demand model' in result['error']
+
+
+def test_catalogue_reports_invalid_and_short_products(monkeypatch):
+    valid, missing = str(ObjectId()), str(ObjectId())
+    dates = np.datetime64('2024-01-01') + np.arange(30)
+    monkeypatch.setattr(inventory_simulation, 'demand_model', mean_demand)
+    monkeypatch.setattr(inventory_simulation, 'get_database', lambda: {'sales': None})
+    monkeypatch.setattr(inventory_simulation, 'fetch_daily_sales_by_product', lambda collection, object_ids: {
+        valid: DailySales(dates, np.full(30, 4.0), 30)})
+
+    results = inventory_simulation.simulate_catalogue([valid, 'bad-id', missing], max_workers=1, n_paths=20, horizon=30)
+    by_id = {result['product_id']: result for result in results}
+    assert by_id['bad-id'] == {'product_id': 'bad-id', 'error': 'Invalid product ID format: bad-id'}
+    assert 'Not enough sales data' in by_id[missing]['error']
+    assert by_id[valid]['policies']['fill_rate'][0] == 1
@@ -0,0 +1,72 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_cache import ModelCache, get_model_cache, series_fingerprint
+
+
+def make_cache(tmp_path, **bounds):
+    return ModelCache(cache_dir=str(tmp_path / 'cache'), **bounds)
+
+
+def test_get_returns_stored_record(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.key('stock-arima', 'p1', np.arange(10.0))
+    assert cache.get(key) is None
+    cache.put(key, {'order': [1, 0, 1]})
+    assert cache.get(key) == {'order': [1, 0, 1]}
+
+
+def test_key_depends_on_series_and_search_settings(tmp_path):
+    cache = make_cache(tmp_path)
+    values = np.arange(10.0)
+    assert cache.key('ns', 'p1', values) == cache.key('ns', 'p1', values.copy())
+    assert cache.key('ns', 'p1', values) != cache.key('ns', 'p1', values + 1)
+    assert cache.key('ns', 'p1', values) != cache.key('ns', 'p2', values)
+    assert cache.key('ns', 'p1', values, max_p=2) != cache.key('ns', 'p1', values, max_p=3)
+
+
+def test_fingerprint_includes_dates():
+    values = [1.0, 2.0, 3.0]
+    first = pd.Series(values, index=pd.date_range('2024-01-01', periods=3))
+    later = pd.Series(values, index=pd.date_range('2024-02-01', periods=3))
+    assert series_fingerprint(first) != series_fingerprint(later)
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    cache.put('fresh', {'order': [1, 1, 1]})
+    cache.put('old', {'order': [1, 1, 1]}, created_at=time.time() - 120)
+    assert cache.get('fresh') is not None
+    assert cache.get('old') is None
+    assert not os.path.exists(os.path.join(cache.cache_dir, 'old.json'))
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_entries=10)
+    now = time.time()
+    for index in range(10):
+        cache.put(f'entry{index}', {'index': index})
+        path = os.path.join(cache.cache_dir, f'entry{index}.json')
+        os.utime(path, (now - 100 + index, now - 100 + index))
+    # Reading the oldest entry makes it the most recently used
+    assert cache.get('entry0') == {'index': 0}
+
+    cache.put('entry10', {'index': 10})
+
+    remaining = {name[:-len('.json')] for name in os.listdir(cache.cache_dir)}
+    # Over the bound, the cache is trimmed to 90% of it: the two least recently used go
+    assert remaining == {'entry0', *(f'entry{index}' for index in range(3, 11))}
+
+
+def test_disabled_cache_stores_nothing(tmp_path, monkeypatch):
+    monkeypatch.setenv('MODEL_CACHE_DISABLED', '1')
+    cache = make_cache(tmp_path)
+    cache.put('key', {'order': [1, 0, 0]})
+    assert cache.get('key') is None
+
+
+def test_default_cache_uses_environment(tmp_path):
+    assert get_model_cache().cache_dir == str(tmp_path / 'models')
@@ -0,0 +1,100 @@
+import io
+import json
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+import model_router
+from croston import croston_forecast, croston_rate
+from ndjson import NDJSONWriter
+from sales_series import DailySales
+
+START = np.datetime64('2024-01-01')
+
+
+def intermittent(days=120, seed=6):
+    rng = np.random.default_rng(seed)
+    return np.where(rng.random(days) < 0.2, rng.integers(1, 4, days), 0).astype(float)
+
+
+def test_croston_rate():
+    assert croston_rate(np.array([0, 0, 4, 0, 2.0]), sba=False) == pytest.approx(3.8 / 2.9)
+    assert croston_rate(np.array([0, 0, 4, 0, 2.0])) == pytest.approx(3.8 / 2.9 * 0.95)
+    assert croston_rate(np.zeros(10)) == 0
+    np.testing.assert_array_equal(croston_forecast(np.array([2.0, 2.0]), 3), np.full(3, 1.9))
+
+
+@pytest.mark.parametrize('adi, cv2, expected', [
+    (1.0, 0.1, 'smooth'), (1.0, 0.9, 'erratic'), (2.0, 0.1, 'intermittent'), (2.0, 0.9, 'lumpy')])
+def test_demand_class(adi, cv2, expected):
+    assert model_router.demand_class(adi, cv2) == expected
+
+
+def test_candidate_models():
+    base = {'days': 200, 'demand_class': 'smooth', 'seasonal_strength': 0.0}
+    assert model_router.candidate_models({**base, 'days': 30}) == ['moving_average']
+    assert model_router.candidate_models({**base, 'demand_class': 'lumpy'}) == ['croston', 'arima']
+    assert model_router.candidate_models({**base, 'seasonal_strength': 0.8}) == ['moving_average', 'arima', 'prophet']
+    assert model_router.candidate_models({**base, 'seasonal_strength': 0.8, 'days': 100}) == ['moving_average', 'arima']
+
+
+def test_series_features():
+    days = 140
+    dates = START + np.arange(days)
+    weekly = np.tile([5.0, 5.0, 5.0, 5.0, 5.0, 20.0, 20.0], days // 7)
+    features = model_router.series_features(dates, weekly)
+    assert features['demand_class'] == 'erratic'
+    assert features['seasonal_strength'] == pytest.approx(1.0)
+
+    sparse = model_router.series_features(dates, intermittent(days))
+    assert sparse['demand_class'] in ('intermittent', 'lumpy')
+    assert sparse['adi'] > model_router.ADI_CUTOFF
+
+
+def test_route_decision_is_cached_until_refresh_days(monkeypatch):
+    values = intermittent(120)
+    dates = START + np.arange(len(values))
+    routed = model_router.route_series(dates, values, 'p1')
+    assert routed['source'] == 'routed'
+    assert routed['model'] in ('croston', 'arima')
+
+    monkeypatch.setattr(model_router, 'choose_model', lambda *args: pytest.fail('routed again'))
+    later = len(values) + model_router.ROUTE_REFRESH_DAYS - 1
+    cached = model_router.route_series(START + np.arange(later), np.resize(values, later), 'p1')
+    assert cached['source'] == 'cached'
+    assert cached['model'] == routed['model']
+
+    monkeypatch.undo()
+    grown = len(values) + model_router.ROUTE_REFRESH_DAYS
+    assert model_router.route_series(START + np.arange(grown), np.resize(values, grown), 'p1')['source'] == 'routed'
+    assert model_router.route_series(dates, values, 'p1', refresh=True)['source'] == 'routed'
+
+
+def test_short_history_routes_to_moving_average():
+    values = np.arange(1.0, 31.0)
+    routed = model_router.route_series(START + np.arange(30), values)
+    assert routed['model'] == 'moving_average'
+    assert routed['reason'] == 'only candidate'
+    np.testing.assert_allclose(model_router.forecast_with('moving_average', START + np.arange(30), values, 3),
+                               np.full(3, 27.0))
+
+
+def test_stream_route_records(monkeypatch):
+    routed, short, missing = str(ObjectId()), str(ObjectId()), str(ObjectId())
+    sales = {routed: DailySales(START + np.arange(40), np.full(40, 3.0), 40),
+             short: DailySales(START + np.arange(3), np.ones(3), 3)}
+    monkeypatch.setattr(model_router, 'get_database', lambda: {'sales': None})
+    monkeypatch.setattr(model_router, 'fetch_daily_sales_by_product', lambda collection, object_ids: dict(sales))
+
+    stream = io.StringIO()
+    model_router.stream_route(NDJSONWriter(stream), [routed, short, missing, 'bad-id'], horizon=5, max_workers=1)
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    errors = {record['product_id']: record['error'] for record in records if record['type'] == 'error'}
+    assert errors['bad-id'] == 'Invalid product ID format: bad-id'
+    assert set(errors) == {'bad-id', short, missing}
+    [section] = [record['data'] for record in records if record['type'] == 'section']
+    assert section['product_id'] == routed
+    assert section['forecast']['date'][0] == '2024-02-10'
+    assert section['forecast']['forecasted_quantity'] == [3.0] * 5
+    assert records[-1] == {'type': 'end', 'products': 1, 'failed': 3}
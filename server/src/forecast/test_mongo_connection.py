@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import mongo_connection
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'mongodb://localhost:27017')
+    mongo_connection.close_client()
+    yield
+    mongo_connection.close_client()
+
+
+def test_client_is_shared_and_lazy():
+    client = mongo_connection.get_client()
+    assert mongo_connection.get_client() is client
+    assert client.options.pool_options.max_pool_size == 20
+
+
+def test_pool_settings_from_environment(monkeypatch):
+    monkeypatch.setenv('MONGO_MAX_POOL_SIZE', '7')
+    assert mongo_connection.get_client().options.pool_options.max_pool_size == 7
+
+
+def test_database_name_from_environment(monkeypatch):
+    monkeypatch.setenv('MONGO_DB_NAME', 'forecasting')
+    assert mongo_connection.get_database().name == 'forecasting'
+    assert mongo_connection.get_database('other').name == 'other'
+
+
+def test_close_client_builds_a_new_one():
+    client = mongo_connection.get_client()
+    mongo_connection.close_client()
+    assert mongo_connection.get_client() is not client
+
+
+def test_client_from_another_process_is_replaced(monkeypatch):
+    client = mongo_connection.get_client()
+    monkeypatch.setattr(mongo_connection, '_client_pid', os.getpid() + 1)
+    assert mongo_connection.get_client() is not client
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_child_drops_inherited_client():
+    mongo_connection.get_client()
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if mongo_connection._client is None else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert mongo_connection._client is not None
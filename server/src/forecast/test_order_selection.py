@@ -0,0 +1,66 @@
+import time
+from itertools import product
+
+import numpy as np
+
+import order_selection
+from order_selection import difference_series, select_order
+
+
+def grid(max_p=2, max_d=0, max_q=2):
+    return product(range(max_p + 1), range(max_d + 1), range(max_q + 1))
+
+
+def fake_fit(delay=0.0, failing=()):
+    """Stand-in for _fit_candidate: larger models get lower AIC, listed orders fail."""
+    def fit(data, order, model_kind, model_kwargs, fit_kwargs):
+        time.sleep(delay)
+        if order in failing:
+            raise ValueError(f"cannot fit {order}")
+        return {'order': list(order), 'params': [], 'aic': 100.0 - order[0] - order[2], 'bic': 0.0,
+                'residuals_mean': 0.0, 'residuals_std': 1.0}
+    return fit
+
+
+def test_finds_autoregressive_order():
+    rng = np.random.default_rng(0)
+    values = np.zeros(300)
+    for t in range(1, len(values)):
+        values[t] = 0.7 * values[t - 1] + rng.normal()
+    search = select_order(values + 50, grid(), max_workers=1, time_budget=60)
+    assert not search['timed_out']
+    assert search['best']['order'][0] >= 1
+    assert search['fitted'] + search['failed'] + search['pruned'] == 9
+
+
+def test_budget_returns_best_so_far(monkeypatch):
+    monkeypatch.setattr(order_selection, '_fit_candidate', fake_fit(delay=0.05))
+    search = select_order(np.arange(50.0), grid(), max_workers=1, time_budget=0.12)
+    assert search['timed_out']
+    assert 0 < search['fitted'] < 9
+    # The best of the candidates fitted before the deadline, not the grid's overall best (2, 0, 2)
+    assert search['best'] is not None
+    assert search['best']['order'] != [2, 0, 2]
+
+
+def test_failed_parents_prune_their_children(monkeypatch):
+    monkeypatch.setattr(order_selection, '_fit_candidate', fake_fit(failing={(0, 0, 0)}))
+    search = select_order(np.arange(50.0), grid(), max_workers=1, time_budget=10)
+    assert search['best'] is None
+    assert search['failed'] == 1
+    assert search['pruned'] == 8
+
+
+def test_max_d_skips_over_differenced_orders(monkeypatch):
+    monkeypatch.setattr(order_selection, '_fit_candidate', fake_fit())
+    stationary = np.random.default_rng(1).normal(size=200)
+    search = select_order(stationary, grid(max_d=1), max_workers=1, time_budget=10, max_d=1)
+    assert search['best']['order'][1] == 0
+    assert search['fitted'] + search['pruned'] == 9
+
+
+def test_random_walk_is_differenced_once():
+    walk = np.cumsum(np.random.default_rng(2).normal(size=300))
+    differenced, d = difference_series(walk, max_d=2)
+    assert d == 1
+    assert len(differenced) == len(walk) - 1
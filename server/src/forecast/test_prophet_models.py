@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import prophet_models
+
+
+@pytest.fixture(autouse=True)
+def isolated_prophet_store(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROPHET_MODEL_DIR', str(tmp_path / 'prophet'))
+    monkeypatch.setattr(prophet_models, '_store', None)
+
+
+def weekly_frame(days):
+    return pd.DataFrame({'ds': pd.date_range('2024-01-01', periods=days), 'y': np.arange(days) % 7 + 5.0})
+
+
+def test_unchanged_series_loads_stored_model():
+    frame = weekly_frame(60)
+    _, method = prophet_models.fit_or_load(frame, 'p1')
+    model, again = prophet_models.fit_or_load(frame, 'p1')
+    assert (method, again) == ('cold', 'cached')
+    assert len(model.predict(frame)) == len(frame)
+
+
+def test_new_day_warm_starts_from_stored_model():
+    prophet_models.fit_or_load(weekly_frame(60), 'p1')
+    assert prophet_models.fit_or_load(weekly_frame(61), 'p1')[1] == 'warm'
+
+
+def test_window_namespace_keeps_its_own_model():
+    frame = weekly_frame(60)
+    prophet_models.fit_or_load(frame, 'p1')
+    window = prophet_models.window_namespace(30)
+    assert window == 'prophet-30d'
+    assert prophet_models.fit_or_load(frame.tail(30), 'p1', namespace=window)[1] == 'cold'
+    assert prophet_models.fit_or_load(frame, 'p1')[1] == 'cached'
+
+
+def test_without_product_nothing_is_stored():
+    frame = weekly_frame(60)
+    assert prophet_models.fit_or_load(frame)[1] == 'cold'
+    assert prophet_models.fit_or_load(frame)[1] == 'cold'
+
+
+def test_unreadable_entry_is_refitted():
+    frame = weekly_frame(60)
+    store = prophet_models.get_prophet_store()
+    store.put(store.product_key(prophet_models.NAMESPACE, 'p1'),
+              {'fingerprint': prophet_models.frame_fingerprint(frame), 'model': 'not a model'})
+    assert prophet_models.fit_or_load(frame, 'p1')[1] == 'cold'
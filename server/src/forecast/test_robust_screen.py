@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from robust_screen import (MIN_ARIMA_DAYS, nanmedian, rolling_mad, screen_report, screen_series, seasonal_esd,
+                           series_matrix)
+
+
+def daily(values, start='2024-01-01'):
+    return pd.Series(np.asarray(values, dtype=float), index=pd.date_range(start, periods=len(values)))
+
+
+def weekly(weeks=10, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.tile([10.0, 10.0, 10.0, 10.0, 10.0, 25.0, 25.0], weeks) + rng.normal(0, 1, weeks * 7)
+
+
+def test_nanmedian_matches_numpy():
+    rng = np.random.default_rng(1)
+    values = rng.normal(0, 1, (5, 12))
+    values[rng.random(values.shape) < 0.3] = np.nan
+    values[2] = np.nan
+    with np.errstate(all='ignore'), pytest.warns(RuntimeWarning):
+        expected = np.nanmedian(values, axis=1)
+    np.testing.assert_allclose(nanmedian(values), expected)
+
+
+def test_series_matrix_shares_a_calendar():
+    first = pd.Series([1.0, 2.0], index=pd.to_datetime(['2024-01-01', '2024-01-03']))
+    second = daily([5.0], start='2024-01-04')
+    matrix, start = series_matrix([first, second])
+    assert start == np.datetime64('2024-01-01').astype(np.int64)
+    np.testing.assert_array_equal(matrix[0], [1.0, 0.0, 2.0, np.nan])
+    np.testing.assert_array_equal(matrix[1], [np.nan, np.nan, np.nan, 5.0])
+
+
+def test_rolling_mad_flags_a_spike():
+    values = np.full((1, 40), 10.0) + np.random.default_rng(2).normal(0, 1, 40)
+    values[0, 20] += 30
+    z, median, _ = rolling_mad(values)
+    assert np.argmax(np.abs(z[0])) == 20
+    assert abs(median[0, 20] - 10) < 2
+
+
+def test_seasonal_esd_ignores_weekday_pattern():
+    values = weekly()[None, :]
+    weekdays = np.arange(values.shape[1]) % 7
+    assert not seasonal_esd(values, weekdays).any()
+    values[0, 30] += 40
+    assert np.flatnonzero(seasonal_esd(values, weekdays)[0]).tolist() == [30]
+
+
+def test_screen_escalates_only_suspicious_long_products():
+    spiky = weekly(seed=3)
+    spiky[33] += 60
+    short = np.full(MIN_ARIMA_DAYS - 5, 10.0)
+    short[12] = 90
+    screened = screen_series([('quiet', daily(weekly(seed=4))), ('spiky', daily(spiky)), ('short', daily(short))])
+
+    assert not screened['quiet']['escalate'] and screened['quiet']['suspicious_points'] == 0
+    assert screened['spiky']['escalate']
+    assert str(screened['spiky']['dates'][0]) == '2024-02-03'
+    assert not screened['short']['escalate'] and screened['short']['suspicious_points'] >= 1
+
+
+def test_screen_report_formats():
+    short = np.full(20, 10.0)
+    short[12] = 90
+    screened = screen_series([('short', daily(short))])['short']
+    rows = screen_report(screened)
+    assert rows['method'] == 'screen'
+    assert rows['anomalies'][0]['date'] == '2024-01-13'
+    assert rows['anomalies'][0]['actual_value'] == 90
+    columns = screen_report(screened, columnar=True)['anomalies']
+    assert columns['date'] == [row['date'] for row in rows['anomalies']]
+    assert screen_series([]) == {}
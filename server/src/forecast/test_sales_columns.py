@@ -0,0 +1,51 @@
+import base64
+import struct
+
+import numpy as np
+import pytest
+
+from calendar_series import CalendarSeries
+from sales_columns import decode, decode_base64, encode, is_packed
+
+
+def test_round_trip():
+    days = np.array([19723, 19723, 19725])
+    packed = encode(days, [1.5, 2.0, 4.25])
+    assert is_packed(packed)
+    columns = decode(packed)
+    np.testing.assert_array_equal(columns.days, days)
+    np.testing.assert_array_equal(columns.quantity, [1.5, 2.0, 4.25])
+    assert not columns.days.flags.writeable
+
+
+def test_reads_node_packed_sales():
+    # Byte for byte what packSales() in forecastWorker.service.ts writes for two sales
+    buffer = b'SLS1' + struct.pack('<I', 2) + struct.pack('<2i', 19723, 19724) + struct.pack('<2f', 3.0, 0.5)
+    columns = decode_base64(base64.b64encode(buffer).decode())
+    assert columns.days.tolist() == [19723, 19724]
+    assert columns.quantity.tolist() == [3.0, 0.5]
+
+
+def test_empty_columns():
+    columns = decode(encode([], []))
+    assert len(columns.days) == 0 and len(columns.quantity) == 0
+
+
+@pytest.mark.parametrize('buffer', [b'SLS', b'JSON' + bytes(4), encode([1, 2], [1.0, 2.0])[:-1]])
+def test_malformed_buffers(buffer):
+    with pytest.raises(ValueError):
+        decode(buffer)
+
+
+def test_mismatched_columns():
+    with pytest.raises(ValueError):
+        encode([1, 2], [1.0])
+
+
+def test_calendar_from_packed_columns():
+    columns = decode(encode([19725, 19723, 19723], [4.0, 1.0, 2.0]))
+    series = CalendarSeries.from_sales(columns)
+    assert series.start == 19723
+    np.testing.assert_array_equal(series.values, [3.0, 0.0, 4.0])
+    with pytest.raises(ValueError):
+        CalendarSeries.from_sales(columns, timezone='Pacific/Auckland')
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+import stock_optimization
+from sales_patterns import PatternTracker, SalesPatternAccumulator, pattern_statistics, top_k_indices
+from sales_series import DailySales
+
+
+def history(days=60, seed=5):
+    rng = np.random.default_rng(seed)
+    dates = np.datetime64('2024-01-20') + np.arange(days)
+    return dates, np.round(rng.gamma(2.0, 5.0, days), 1)
+
+
+def assert_same_report(report, expected):
+    # Running sums add up in a different order than NumPy, so floats may differ in the last bits
+    for section in ('basic_stats', 'trend_analysis', 'volatility', 'growth'):
+        assert report[section] == pytest.approx(expected[section]), section
+    for patterns in ('daily_patterns', 'monthly_patterns'):
+        assert report['seasonality'][patterns] == pytest.approx(expected['seasonality'][patterns])
+    assert report['peak_analysis'] == expected['peak_analysis']
+    assert report['low_analysis'] == expected['low_analysis']
+
+
+def test_top_k_indices_keeps_first_of_ties():
+    values = np.array([3.0, 5.0, 5.0, 1.0, 5.0])
+    np.testing.assert_array_equal(top_k_indices(values, 2), [1, 2])
+    np.testing.assert_array_equal(top_k_indices(values, 2, largest=False), [3, 0])
+
+
+def test_accumulator_snapshot_matches_batch_statistics():
+    dates, values = history()
+    accumulator = SalesPatternAccumulator.from_daily(dates[:40], values[:40])
+    for date, value in zip(dates[40:], values[40:]):
+        accumulator.add_sale(date, value)
+    assert_same_report(accumulator.snapshot(), pattern_statistics(dates, values))
+
+
+def test_sales_on_the_open_day_add_up():
+    dates, values = history()
+    accumulator = SalesPatternAccumulator.from_daily(dates, values)
+    accumulator.add_sale(dates[-1], 2.5)
+    expected = values.copy()
+    expected[-1] += 2.5
+    assert_same_report(accumulator.snapshot(), pattern_statistics(dates, expected))
+    with pytest.raises(ValueError):
+        accumulator.add_sale(dates[-2], 1.0)
+
+
+def test_too_short_history():
+    dates, values = history(days=5)
+    with pytest.raises(ValueError):
+        pattern_statistics(dates, values)
+    with pytest.raises(ValueError):
+        SalesPatternAccumulator.from_daily(dates, values).snapshot()
+
+
+def test_matches_detects_revised_history():
+    dates, values = history()
+    accumulator = SalesPatternAccumulator.from_daily(dates, values)
+    assert accumulator.matches(dates, values)
+
+    revised = values.copy()
+    revised[10] += 1
+    assert not accumulator.matches(dates, revised)
+    assert not accumulator.matches(dates[1:], values[1:])
+    moved = dates.copy()
+    moved[:10] -= 1
+    assert not accumulator.matches(moved, values)
+
+
+def test_tracker_drops_least_recently_used():
+    dates, values = history()
+    tracker = PatternTracker(max_products=2)
+    tracker.load('a', dates, values)
+    tracker.load('b', dates, values)
+    tracker.get('a')
+    tracker.load('c', dates, values)
+    assert list(tracker.accumulators) == ['a', 'c']
+
+
+def test_sale_records_are_bucketed_per_day():
+    dates, values = history(days=10)
+    records = [{'date': f"{date}T09:00:00Z", 'quantity': value} for date, value in zip(dates, values)]
+    records.insert(3, {'date': f"{dates[0]}T18:00:00Z", 'quantity': 4.0})
+    expected = values.copy()
+    expected[0] += 4.0
+    assert_same_report(stock_optimization.analyze_sales_patterns(records), pattern_statistics(dates, expected))
+
+
+def test_update_reloads_after_stored_sales_change(monkeypatch):
+    dates, values = history()
+    stored = {'sales': DailySales(dates, values, len(dates))}
+    monkeypatch.setattr(stock_optimization, 'get_inventory_data', lambda product_id: stored['sales'])
+    monkeypatch.setattr(stock_optimization, 'get_pattern_tracker', lambda tracker=PatternTracker(): tracker)
+
+    stock_optimization.update_sales_patterns('p1')
+    revised = values.copy()
+    revised[5] = 0.0
+    stored['sales'] = DailySales(dates, revised, len(dates))
+    assert_same_report(stock_optimization.update_sales_patterns('p1'), pattern_statistics(dates, revised))
+
+
+def test_update_adds_new_sale_without_reloading(monkeypatch):
+    dates, values = history()
+    loads = []
+
+    def get_inventory_data(product_id):
+        loads.append(product_id)
+        return DailySales(dates[:-1], values[:-1], len(dates) - 1)
+
+    monkeypatch.setattr(stock_optimization, 'get_inventory_data', get_inventory_data)
+    monkeypatch.setattr(stock_optimization, 'get_pattern_tracker', lambda tracker=PatternTracker(): tracker)
+
+    stock_optimization.update_sales_patterns('p1')
+    report = stock_optimization.update_sales_patterns('p1', {'date': str(dates[-1]), 'quantity': values[-1]})
+    assert loads == ['p1']
+    assert_same_report(report, pattern_statistics(dates, values))
@@ -0,0 +1,103 @@
+import numpy as np
+from bson import ObjectId
+
+from sales_series import (DailySales, daily_matrix, daily_sales_pipeline, fetch_daily_sales,
+                          fetch_daily_sales_by_product, parse_product_ids)
+
+
+class FakeCollection:
+    """Returns canned aggregation groups and remembers the pipeline it was asked to run."""
+
+    def __init__(self, groups):
+        self.groups = groups
+        self.pipeline = None
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        self.pipeline = pipeline
+        return iter(self.groups)
+
+
+def daily(days, quantities):
+    return DailySales.from_groups(days, quantities, len(days))
+
+
+def test_pipeline_matches_one_or_many_products():
+    first, second = ObjectId(), ObjectId()
+    assert daily_sales_pipeline([first])[0] == {'$match': {'product': first}}
+    assert daily_sales_pipeline([first, second])[0] == {'$match': {'product': {'$in': [first, second]}}}
+    assert '$match' not in daily_sales_pipeline()[0]
+
+
+def test_pipeline_groups_days_in_timezone():
+    pipeline = daily_sales_pipeline(timezone='Europe/Berlin', by_product=True)
+    group = pipeline[1]['$group']
+    assert group['_id']['day']['$dateToString']['timezone'] == 'Europe/Berlin'
+    assert group['_id']['product'] == '$product'
+    assert pipeline[-1]['$group']['_id'] == '$_id.product'
+
+
+def test_from_groups_sorts_pushed_days():
+    sales = DailySales.from_groups(['2024-01-03', '2024-01-01', '2024-01-02'], [3, 1, 2], 7)
+    np.testing.assert_array_equal(sales.dates, np.array(['2024-01-01', '2024-01-02', '2024-01-03'],
+                                                        dtype='datetime64[D]'))
+    np.testing.assert_array_equal(sales.quantities, [1.0, 2.0, 3.0])
+    assert sales.records == 7
+
+
+def test_fetch_daily_sales_sums_records():
+    collection = FakeCollection([
+        {'_id': {'day': '2024-01-01'}, 'quantity': 4, 'records': 2},
+        {'_id': {'day': '2024-01-02'}, 'quantity': 1, 'records': 1},
+    ])
+    product_id = ObjectId()
+    sales = fetch_daily_sales(collection, product_id)
+    assert collection.pipeline[0] == {'$match': {'product': product_id}}
+    assert len(sales) == 2
+    assert sales.records == 3
+
+
+def test_fetch_daily_sales_by_product_keys_by_id_string():
+    product_id = ObjectId()
+    collection = FakeCollection([
+        {'_id': product_id, 'days': ['2024-01-02', '2024-01-01'], 'quantities': [5, 2], 'records': 4},
+    ])
+    sales = fetch_daily_sales_by_product(collection, [product_id])
+    assert list(sales) == [str(product_id)]
+    np.testing.assert_array_equal(sales[str(product_id)].quantities, [2.0, 5.0])
+
+
+def test_parse_product_ids():
+    valid = str(ObjectId())
+    assert parse_product_ids(None) == (None, [])
+    assert parse_product_ids('all') == (None, [])
+    object_ids, invalid = parse_product_ids([valid, 'not-an-id'])
+    assert object_ids == [ObjectId(valid)]
+    assert invalid == ['not-an-id']
+
+
+def test_daily_matrix_fills_gaps_with_zeros():
+    sales = {
+        'a': daily(['2024-01-01', '2024-01-04'], [1, 4]),
+        'b': daily(['2024-01-02'], [2]),
+    }
+    dates, matrix = daily_matrix(sales, ['a', 'b', 'missing'])
+    assert dates[0] == np.datetime64('2024-01-01') and len(dates) == 4
+    np.testing.assert_array_equal(matrix, [[1, 0, 0, 4], [0, 2, 0, 0], [0, 0, 0, 0]])
+
+
+def test_daily_matrix_history_window_and_first_sale():
+    sales = {
+        'a': daily(['2024-01-01', '2024-01-04'], [1, 4]),
+        'b': daily(['2024-01-03'], [3]),
+    }
+    dates, matrix = daily_matrix(sales, ['a', 'b', 'missing'], history_days=3, from_first_sale=True)
+    assert dates[0] == np.datetime64('2024-01-02')
+    np.testing.assert_array_equal(matrix[0], [0, 0, 4])
+    np.testing.assert_array_equal(matrix[1], [np.nan, 3, 0])
+    assert np.isnan(matrix[2]).all()
+
+
+def test_daily_matrix_without_sales():
+    dates, matrix = daily_matrix({'a': DailySales.empty()}, ['a'])
+    assert len(dates) == 0
+    assert matrix.shape == (1, 0)
@@ -0,0 +1,292 @@
+"""Long-lived forecasting worker.
+
+Loads pandas, statsmodels, prophet and pymongo once and serves requests over
+stdin/stdout as JSON lines, so the Node server does not pay interpreter and
+import startup for every forecast, stock optimization or anomaly call.
+
+Request:  {"id": 1, "type": "forecast", "payload": {"product_id": "..."}}
+Response: {"id": 1, "result": ...} or {"id": 1, "error": "..."}
+
+With "stream": true in the payload, forecast, forecast_batch, backtest,
+route, optimize, anomaly and anomaly_batch requests first emit
+{"id": 1, "record": {...}} lines (see ndjson.py).
+Anomaly requests may send their sales as base64 packed columns in
+"sales_packed" instead of a "sales" list (see sales_columns.py). Sales go onto
+a gap-filled daily calendar (see calendar_series.py). Packed and aggregated
+sales are bucketed into SALES_TIMEZONE days; an optional "timezone" in
+arima_forecast and anomaly payloads sets which day the timestamps of a
+"sales" list fall on, and is rejected for any other timezone with packed sales.
+"""
+import sys
+import os
+import json
+import importlib
+import traceback
+import contextlib
+from typing import Any, Callable, Dict, Tuple
+
+FORECAST_DIR = os.path.dirname(os.path.abspath(__file__))
+ANOMALY_DIR = os.path.join(FORECAST_DIR, '..', 'modules', 'anomaly')
+sys.path.insert(0, FORECAST_DIR)
+sys.path.insert(0, ANOMALY_DIR)
+
+import forecast as prophet_forecast
+import stock_optimization
+import hierarchy
+import backtest
+import model_router
+import inventory_policy
+import inventory_simulation
+from mongo_connection import close_client
+from diagnostics import stage, start_trace
+from ndjson import NDJSONWriter, dumps
+from sales_columns import decode_base64
+from arima_anomaly_detector import ARIMAAnomalyDetector, get_incremental_scorer
+import anomaly_batch
+
+
+def handle_forecast(payload: Dict[str, Any]) -> Any:
+    horizon_only = bool(payload.get('horizon_only'))
+    if payload.get('demo'):
+        return prophet_forecast.forecast(is_demo=True, horizon_only=horizon_only, store_id=payload.get('store_id'),
+                                         demo_product_id=payload.get('demo_product_id'))
+    return prophet_forecast.forecast(product_id=payload.get('product_id'), horizon_only=horizon_only)
+
+
+def handle_forecast_batch(payload: Dict[str, Any]) -> Any:
+    return list(prophet_forecast.forecast_batch(payload.get('product_ids', 'all'), payload.get('max_workers'),
+                                                bool(payload.get('horizon_only'))))
+
+
+def handle_forecast_hierarchy(payload: Dict[str, Any]) -> Any:
+    return hierarchy.forecast_hierarchy(payload.get('category_id'), payload.get('brand_id'),
+                                        payload.get('method') or 'mint',
+                                        payload.get('horizon') or hierarchy.DEFAULT_HORIZON,
+                                        payload.get('max_workers'))
+
+
+def backtest_arguments(payload: Dict[str, Any]) -> Tuple[Tuple[Any, ...], Dict[str, Any]]:
+    options = {name: payload[name] for name in ('horizon', 'folds', 'step', 'window', 'window_size')
+               if payload.get(name) is not None}
+    return (payload.get('product_ids', 'all'), payload.get('models') or backtest.DEFAULT_MODELS,
+            payload.get('max_workers'), payload.get('history_days')), options
+
+
+def handle_backtest(payload: Dict[str, Any]) -> Any:
+    args, options = backtest_arguments(payload)
+    try:
+        return backtest.backtest_catalogue(*args, **options)
+    except ValueError as e:
+        return {'error': str(e)}
+
+
+def handle_route(payload: Dict[str, Any]) -> Any:
+    return model_router.route_catalogue(payload.get('product_ids', 'all'), payload.get('horizon'),
+                                        bool(payload.get('refresh')), payload.get('max_workers'))
+
+
+def handle_optimize(payload: Dict[str, Any]) -> Any:
+    product_id = payload.get('product_id')
+    is_demo = bool(payload.get('demo')) or not product_id
+    return stock_optimization.optimize_stock_levels(product_id, is_demo)
+
+
+def handle_inventory_policy(payload: Dict[str, Any]) -> Any:
+    parameters = {name: payload[name] for name in inventory_policy.POLICY_PARAMETERS if payload.get(name) is not None}
+    return inventory_policy.catalogue_policies(payload.get('product_ids', 'all'), payload.get('history_days'),
+                                               payload.get('lead_times'), payload.get('sweep'), **parameters)
+
+
+def handle_simulate_policy(payload: Dict[str, Any]) -> Any:
+    options = {name: payload[name] for name in ('n_paths', 'horizon', 'model', 'service_levels', 'target_fill_rate',
+                                                 'seed', *inventory_policy.POLICY_PARAMETERS)
+               if payload.get(name) is not None}
+    return inventory_simulation.simulate_catalogue(payload.get('product_ids', 'all'), payload.get('max_workers'),
+                                                   **options)
+
+
+def handle_arima_forecast(payload: Dict[str, Any]) -> Any:
+    # The demand forecast service sends its own window of recent sales
+    return stock_optimization.run_arima_forecast(payload.get('sales', []), product_id=payload.get('product_id'),
+                                                 timezone=payload.get('timezone'),
+                                                 namespace=stock_optimization.DEMAND_NAMESPACE)
+
+
+def handle_patterns(payload: Dict[str, Any]) -> Any:
+    if not payload.get('product_id'):
+        return {'error': 'product_id is required for sales pattern updates'}
+    return stock_optimization.update_sales_patterns(payload['product_id'], payload.get('sale'))
+
+
+def anomaly_sales(payload: Dict[str, Any]) -> Any:
+    if payload.get('sales_packed'):
+        return decode_base64(payload['sales_packed'])
+    return payload.get('sales', [])
+
+
+def handle_anomaly(payload: Dict[str, Any]) -> Any:
+    # A fresh detector per request: fitted state belongs to one product's series
+    detector = ARIMAAnomalyDetector(product_id=payload.get('product_id'), timezone=payload.get('timezone'))
+    return detector.detect_anomalies(anomaly_sales(payload), columnar=bool(payload.get('columnar')))
+
+
+def anomaly_batch_products(payload: Dict[str, Any]) -> Any:
+    return [(product['product_id'], anomaly_sales(product)) for product in payload.get('products', [])]
+
+
+def handle_anomaly_batch(payload: Dict[str, Any]) -> Any:
+    return anomaly_batch.detect_catalogue(anomaly_batch_products(payload), payload.get('max_workers'),
+                                          payload.get('timeout') or anomaly_batch.TASK_TIMEOUT,
+                                          payload.get('screen', True), payload.get('timezone'))
+
+
+def handle_anomaly_incremental(payload: Dict[str, Any]) -> Any:
+    if not payload.get('product_id'):
+        return {'error': 'product_id is required for incremental anomaly scoring'}
+    return get_incremental_scorer().score(payload['product_id'], anomaly_sales(payload), payload.get('since'),
+                                          payload.get('timezone'), bool(payload.get('partial')))
+
+
+def stream_forecast(payload: Dict[str, Any], writer: NDJSONWriter) -> None:
+    prophet_forecast.stream_forecast(
+        writer, product_id=payload.get('product_id'), is_demo=bool(payload.get('demo')),
+        horizon_only=bool(payload.get('horizon_only')), store_id=payload.get('store_id'),
+        demo_product_id=payload.get('demo_product_id'))
+
+
+def stream_forecast_batch(payload: Dict[str, Any], writer: NDJSONWriter) -> None:
+    prophet_forecast.stream_forecast_batch(writer, payload.get('product_ids', 'all'), payload.get('max_workers'),
+                                           bool(payload.get('horizon_only')))
+
+
+def stream_backtest(payload: Dict[str, Any], writer: NDJSONWriter) -> None:
+    args, options = backtest_arguments(payload)
+    try:
+        backtest.stream_backtest(writer, *args, **options)
+    except ValueError as e:
+        writer.error(str(e))
+        writer.end()
+
+
+def stream_route(payload: Dict[str, Any], writer: NDJSONWriter) -> None:
+    model_router.stream_route(writer, payload.get('product_ids', 'all'), payload.get('horizon'),
+                              bool(payload.get('refresh')), payload.get('max_workers'))
+
+
+def stream_optimize(payload: Dict[str, Any], writer: NDJSONWriter) -> None:
+    product_id = payload.get('product_id')
+    stock_optimization.stream_stock_levels(writer, product_id, bool(payload.get('demo')) or not product_id)
+
+
+def stream_anomaly(payload: Dict[str, Any], writer: NDJSONWriter) -> None:
+    detector = ARIMAAnomalyDetector(product_id=payload.get('product_id'), timezone=payload.get('timezone'))
+    detector.stream_anomalies(anomaly_sales(payload), writer)
+
+
+def stream_anomaly_batch(payload: Dict[str, Any], writer: NDJSONWriter) -> None:
+    anomaly_batch.stream_batch(writer, anomaly_batch_products(payload), payload.get('max_workers'),
+                               payload.get('timeout') or anomaly_batch.TASK_TIMEOUT, payload.get('screen', True),
+                               payload.get('timezone'))
+
+
+HANDLERS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'forecast': handle_forecast,
+    'forecast_batch': handle_forecast_batch,
+    'forecast_hierarchy': handle_forecast_hierarchy,
+    'backtest': handle_backtest,
+    'route': handle_route,
+    'optimize': handle_optimize,
+    'inventory_policy': handle_inventory_policy,
+    'simulate_policy': handle_simulate_policy,
+    'arima_forecast': handle_arima_forecast,
+    'patterns': handle_patterns,
+    'anomaly': handle_anomaly,
+    'anomaly_batch': handle_anomaly_batch,
+    'anomaly_incremental': handle_anomaly_incremental,
+}
+
+
+# Payloads with "stream": true get NDJSON records ({"id": ..., "record": {...}} lines)
+# as they are produced, followed by the final {"id": ..., "result": {"streamed": true}}
+STREAM_HANDLERS: Dict[str, Callable[[Dict[str, Any], NDJSONWriter], None]] = {
+    'forecast': stream_forecast,
+    'forecast_batch': stream_forecast_batch,
+    'backtest': stream_backtest,
+    'route': stream_route,
+    'optimize': stream_optimize,
+    'anomaly': stream_anomaly,
+    'anomaly_batch': stream_anomaly_batch,
+}
+
+
+def dispatch(request: Dict[str, Any], out=sys.stdout) -> Dict[str, Any]:
+    request_id = request.get('id')
+    payload = request.get('payload') or {}
+    handler = HANDLERS.get(request.get('type'))
+    if handler is None:
+        return {'id': request_id, 'error': f"Unknown request type: {request.get('type')}"}
+
+    stream_handler = STREAM_HANDLERS.get(request.get('type')) if payload.get('stream') else None
+    try:
+        # The modelling code prints progress to stdout; keep it off the protocol stream
+        with contextlib.redirect_stdout(sys.stderr):
+            if stream_handler is not None:
+                writer = NDJSONWriter(out, prefix=f'{{"id": {json.dumps(request_id)}, "record": ', suffix='}')
+                stream_handler(payload, writer)
+                return {'id': request_id, 'result': {'streamed': True}}
+            result = handler(payload)
+        return {'id': request_id, 'result': result}
+    except Exception as e:
+        error_msg = f"Error handling {request.get('type')}: {str(e)}\n{traceback.format_exc()}"
+        print(error_msg, file=sys.stderr)
+        return {'id': request_id, 'error': error_msg}
+
+
+# The forecasting modules import these on first use; the worker loads them before
+# announcing itself ready so no request pays for them
+PRELOAD_MODULES = ('statsmodels.tsa.statespace.sarimax', 'statsmodels.tsa.arima.model', 'prophet')
+
+
+def preload() -> None:
+    if os.getenv('FORECAST_WORKER_PRELOAD', '1') in ('0', 'false'):
+        return
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Could not preload {name}: {str(e)}", file=sys.stderr)
+
+
+def write_message(out, message: Dict[str, Any]) -> None:
+    with stage('serialize'):
+        line = dumps(message) + '\n'
+    out.write(line)
+    out.flush()
+
+
+def serve(stdin=sys.stdin, stdout=sys.stdout) -> None:
+    write_message(stdout, {'event': 'ready', 'pid': os.getpid()})
+
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            write_message(stdout, {'id': None, 'error': f"Invalid request: {str(e)}"})
+            continue
+        # Per-request stage timings are logged at FORECAST_LOG_LEVEL=INFO
+        with start_trace(str(request.get('type'))):
+            write_message(stdout, dispatch(request, stdout))
+
+
+if __name__ == "__main__":
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            preload()
+        serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_client()
@@ -126,12 +126,15 @@
 // } 
 
 // server/src/modules/anomaly/anomalyDetection.service.ts// server/src/modules/anomaly/anomalyDetection.service.ts
-import { spawn } from 'child_process';
-import path from 'path';
 import { AnomalyAlert } from './anomalyAlert.model';
 import Sale from '../sale/sale.model';
 import Product from '../product/product.model';
 import { Types } from 'mongoose';
+import { ForecastWorkerService, packSales, salesDay } from '../../services/forecastWorker.service';
+
+const MS_PER_DAY = 24 * 60 * 60 * 1000;
+// A catalogue-wide sweep can run far longer than a single forecast request
+const SWEEP_TIMEOUT_MS = Number(process.env.ANOMALY_SWEEP_TIMEOUT_MS) || 60 * 60 * 1000;
 
 // Ensure Product model is registered
 require('../product/product.model');
@@ -150,6 +153,8 @@ interface SalesByProduct {
 
 export class AnomalyDetectionService {
   private static instance: AnomalyDetectionService;
+  // Per product, the still open last day the worker scored; later calls only send sales from it on
+  private openDays = new Map<string, Date>();
   
   private constructor() {}
   
@@ -206,76 +211,132 @@ export class AnomalyDetectionService {
         timestamp: { $lt: new Date(Date.now() - 7 * 24 * 60 * 60 * 1000) }
       });
       
-      // Detect anomalies for each product
-      for (const [productId, data] of Object.entries(salesByProduct)) {
+      // Products with too little history are skipped before anything is sent to the worker
+      const products = Object.entries(salesByProduct).filter(([, data]) => {
         if (data.sales.length < 10) {
           console.log(`Skipping product ${data.productName} due to insufficient data (${data.sales.length} records)`);
-          continue;
+          return false;
         }
-        
-        // Run ARIMA anomaly detection for this product
-        const anomalies = await this.runARIMADetection(data.sales);
-        console.log(`Anomaly detection results for product ${data.productName}:`, anomalies);
-        
-        if (anomalies && anomalies.anomalies && anomalies.anomalies.length > 0) {
-          for (const anomaly of anomalies.anomalies) {
-            await AnomalyAlert.create({
-              type: 'ARIMA Anomaly',
-              productId: productId,
-              description: `Sales anomaly detected for ${data.productName} (actual: ${anomaly.actual_value.toFixed(2)}, predicted: ${anomaly.predicted_value.toFixed(2)})`,
-              severity: anomaly.severity,
-              value: anomaly.actual_value,
-              threshold: anomalies.threshold,
-              timestamp: new Date(anomaly.date)
-            });
+        return true;
+      });
+
+      // One batch request for the whole catalogue. The worker screens every product with cheap robust
+      // detectors, fits ARIMA in a process pool only where the screen finds suspicious days, and streams
+      // each product's section (method, threshold) and anomaly rows as soon as it finishes. It runs on the
+      // job worker, so scoring of new sales on the pooled workers is not held up by the sweep
+      const sections = new Map<string, { method: 'screen' | 'arima'; threshold: number }>();
+      const alerts: Promise<unknown>[] = [];
+      await ForecastWorkerService.getInstance().streamJob(
+        'anomaly_batch',
+        {
+          products: products.map(([productId, data]) => ({
+            product_id: productId,
+            sales_packed: packSales(data.sales)
+          }))
+        },
+        (record) => {
+          if (record.type === 'section' && record.name === 'product') {
+            sections.set(record.data.product_id, record.data);
+          } else if (record.type === 'anomaly') {
+            const productName = salesByProduct[record.product_id].productName;
+            const section = sections.get(record.product_id);
+            alerts.push(AnomalyAlert.create({
+              type: section?.method === 'screen' ? 'Abnormal Demand' : 'ARIMA Anomaly',
+              productId: record.product_id,
+              description: `Sales anomaly detected for ${productName} (actual: ${record.actual_value.toFixed(2)}, predicted: ${record.predicted_value.toFixed(2)})`,
+              severity: record.severity,
+              value: record.actual_value,
+              threshold: section?.threshold,
+              timestamp: new Date(record.date)
+            }));
+          } else if (record.type === 'error') {
+            console.error(`Anomaly detection failed for product ${record.product_id}:`, record.error);
+          } else if (record.type === 'end') {
+            console.log(
+              `Anomaly sweep finished: ${record.products} products scored (${record.escalated} with ARIMA), ` +
+                `${record.failed} failed`
+            );
           }
-        }
-      }
+        },
+        SWEEP_TIMEOUT_MS
+      );
+      await Promise.all(alerts);
     } catch (error) {
       console.error('Error in anomaly detection:', error);
       throw error;
     }
   }
   
-  private runARIMADetection(salesData: Array<{ date: Date; quantity: number }>): Promise<any> {
-    return new Promise((resolve, reject) => {
-      const scriptPath = path.join(__dirname, 'arima_anomaly_detector.py');
-      console.log('Running Python script at:', scriptPath);
-      
-      const process = spawn('python3', [scriptPath]);
-      
-      let output = '';
-      let error = '';
-      
-      // Send data to Python script
-      process.stdin.write(JSON.stringify(salesData));
-      process.stdin.end();
-      
-      process.stdout.on('data', (data) => {
-        output += data.toString();
-        console.log('Python script output:', data.toString());
-      });
-      
-      process.stderr.on('data', (data) => {
-        error += data.toString();
-        console.error('Python script error:', data.toString());
-      });
-      
-      process.on('close', (code) => {
-        if (code !== 0) {
-          console.error('Python script failed with code:', code);
-          console.error('Error output:', error);
-          reject(new Error(`Script failed with code ${code}: ${error}`));
-        } else {
-          try {
-            const result = JSON.parse(output);
-            resolve(result);
-          } catch (e) {
-            console.error('Failed to parse Python output:', output);
-            reject(new Error('Failed to parse anomaly detection results'));
-          }
-        }
+  /**
+   * Score the newest sales of one product against its stored ARIMA state.
+   * Only the worker's open last day and the days after it are sent and evaluated; the full
+   * history goes only to a worker without state for the product. It refits when residuals drift.
+   */
+  async scoreNewSales(productId: string, since?: Date): Promise<void> {
+    const product = await Product.findById(productId).select('name').lean();
+    if (!product) {
+      return;
+    }
+
+    let anomalies = await this.scoreSales(productId, since, this.openDays.get(productId));
+    if (anomalies?.mode === 'needs_history') {
+      // The worker restarted or evicted the product; score the full history once
+      anomalies = await this.scoreSales(productId, since);
+    }
+    if (anomalies === null) {
+      return;
+    }
+
+    if (anomalies?.error) {
+      this.openDays.delete(productId);
+      throw new Error(anomalies.error);
+    }
+    if (anomalies?.open_date) {
+      this.openDays.set(productId, new Date(anomalies.open_date));
+    }
+
+    for (const anomaly of anomalies?.anomalies ?? []) {
+      await AnomalyAlert.create({
+        type: 'ARIMA Anomaly',
+        productId: productId,
+        description: `Sales anomaly detected for ${product.name} (actual: ${anomaly.actual_value.toFixed(2)}, predicted: ${anomaly.predicted_value.toFixed(2)})`,
+        severity: anomaly.severity,
+        value: anomaly.actual_value,
+        threshold: anomalies.threshold,
+        timestamp: new Date(anomaly.date)
       });
-    });
+    }
   }
-}
\ No newline at end of file
+
+  // Sales from openDay on (whole SALES_TIMEZONE days, as packSales buckets them), or the full history without it
+  private async scoreSales(productId: string, since?: Date, openDay?: Date): Promise<any> {
+    let sales = await Sale.find({
+      product: new Types.ObjectId(productId),
+      // A day earlier covers any UTC offset; sales on days before the open one are dropped below
+      ...(openDay ? { date: { $gte: new Date(openDay.getTime() - MS_PER_DAY) } } : {})
+    })
+      .sort({ date: 1 })
+      .select('date quantity')
+      .lean();
+    if (openDay) {
+      const firstDay = Math.round(openDay.getTime() / MS_PER_DAY);
+      sales = sales.filter((sale) => salesDay(sale.date) >= firstDay);
+    }
+
+    if (!openDay && sales.length < 10) {
+      return null;
+    }
+
+    return ForecastWorkerService.getInstance().request(
+      'anomaly_incremental',
+      {
+        product_id: productId,
+        sales_packed: packSales(sales),
+        since,
+        partial: openDay !== undefined
+      },
+      undefined,
+      productId
+    );
+  }
+}
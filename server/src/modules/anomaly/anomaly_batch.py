@@ -0,0 +1,218 @@
+"""Anomaly detection for many products in one request.
+
+All series first go through the vectorized robust screen (robust_screen.py)
+in a single pass. Products without suspicious days, and short ones, are
+answered from the screen. Only the rest are scored by ARIMAAnomalyDetector
+in a process pool. Results are yielded as products finish, so a catalogue
+sweep needs one request instead of one detector run per product.
+
+At most one task per pool process is in flight, so a task's deadline starts
+close to when it actually runs. Every task gets a share of its timeout as
+the order search budget and normally finishes within it. A task still
+running at its deadline is reported as a failure. Its pool is replaced,
+because a running call cannot be cancelled, and the other in-flight products
+are resubmitted. A process that dies breaks the whole pool: products
+that finished are kept, and the ones in flight are rerun one at a time on
+a new pool, so only the product that actually crashes is a failure.
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'forecast'))
+
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from arima_anomaly_detector import ARIMAAnomalyDetector
+from diagnostics import get_logger, stage
+from robust_screen import screen_report, screen_series
+
+log = get_logger('anomaly_batch')
+
+TASK_TIMEOUT = float(os.getenv('ANOMALY_TASK_TIMEOUT', 60))
+# Share of a task's timeout the order search may use; the rest covers the final filter and scoring
+ORDER_SEARCH_SHARE = 0.5
+MIN_SALES_DAYS = 10
+
+Task = Tuple[str, Any]
+
+
+def detect_product(product_id: str, sales: Any, time_budget: Optional[float] = None,
+                   columnar: bool = False, timezone: Optional[str] = None) -> Dict[str, Any]:
+    """ARIMA anomalies for one product's sales (or prepared series); runs inside the process pool."""
+    started = time.monotonic()
+    try:
+        detector = ARIMAAnomalyDetector(product_id, time_budget=time_budget, timezone=timezone)
+        time_series = detector.prepare_data(sales)
+        if len(time_series) < MIN_SALES_DAYS:
+            return {'product_id': product_id,
+                    'error': f"Not enough sales data. Minimum {MIN_SALES_DAYS} days required."}
+        result = detector.detect_anomalies(time_series, columnar=columnar)
+        return {'product_id': product_id, **result, 'method': 'arima',
+                'elapsed_ms': round((time.monotonic() - started) * 1000, 1)}
+    except Exception as e:
+        error_msg = f"Error detecting anomalies: {str(e)}"
+        print(f"{error_msg} for product {product_id}\n{traceback.format_exc()}", file=sys.stderr)
+        return {'product_id': product_id, 'error': error_msg}
+
+
+def _terminate(executor: ProcessPoolExecutor) -> None:
+    """Shut the pool down without waiting, stopping calls that are still running."""
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def _screen(products: Iterable[Task], columnar: bool,
+            timezone: Optional[str] = None) -> Tuple[List[Dict[str, Any]], List[Task]]:
+    """Screen results for products the screen settles, and the prepared (product_id, series) tasks for ARIMA."""
+    settled: List[Dict[str, Any]] = []
+    prepared: List[Task] = []
+    for product_id, sales in products:
+        try:
+            time_series = ARIMAAnomalyDetector(product_id, timezone=timezone).prepare_data(sales)
+        except Exception as e:
+            settled.append({'product_id': product_id, 'error': f"Invalid sales data: {str(e)}"})
+            continue
+        if len(time_series) < MIN_SALES_DAYS:
+            settled.append({'product_id': product_id,
+                            'error': f"Not enough sales data. Minimum {MIN_SALES_DAYS} days required."})
+        else:
+            prepared.append((product_id, time_series))
+
+    with stage('screen'):
+        screened = screen_series(prepared)
+    escalated = []
+    for product_id, time_series in prepared:
+        if screened[product_id]['escalate']:
+            escalated.append((product_id, time_series))
+        else:
+            settled.append({'product_id': product_id, **screen_report(screened[product_id], columnar)})
+    log.info("Screened %s products; %s escalated to ARIMA", len(prepared), len(escalated))
+    return settled, escalated
+
+
+def detect_batch(products: Iterable[Task], max_workers: Optional[int] = None, timeout: float = TASK_TIMEOUT,
+                 columnar: bool = False, screen: bool = True,
+                 timezone: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Yield one result per (product_id, sales) pair as soon as the product finishes.
+
+    With screen, products the robust screen settles are yielded first and
+    only the rest are fitted; without it every product gets the ARIMA model.
+    Failed and timed-out products yield {'product_id': ..., 'error': ...}.
+    The timeout is only enforced with more than one worker; inline runs rely
+    on the order search budget alone.
+    """
+    if screen:
+        settled, escalated = _screen(products, columnar, timezone)
+        yield from settled
+        tasks = deque(escalated)
+    else:
+        tasks = deque(products)
+    time_budget = timeout * ORDER_SEARCH_SHARE
+    workers = max_workers or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        for product_id, sales in tasks:
+            yield detect_product(product_id, sales, time_budget, columnar, timezone)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    running: Dict[Any, Tuple[str, Any, float]] = {}
+    # Products that were in flight when a pool process died; each reruns alone to find the one that crashed
+    suspects = set()
+    try:
+        while tasks or running:
+            isolated = any(product_id in suspects for product_id, _, _ in running.values())
+            while tasks and len(running) < workers and not isolated:
+                if tasks[0][0] in suspects and running:
+                    break
+                product_id, sales = tasks.popleft()
+                future = executor.submit(detect_product, product_id, sales, time_budget, columnar, timezone)
+                running[future] = (product_id, sales, time.monotonic() + timeout)
+                isolated = product_id in suspects
+
+            next_deadline = min(deadline for _, _, deadline in running.values())
+            done, _ = wait(running, timeout=max(next_deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            alone = len(running) == 1
+            broken = False
+            retries: List[Task] = []
+            for future in done:
+                product_id, sales, _ = running.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool:
+                    # A dead process fails every call in flight on the pool, not only its own. Products that
+                    # already finished were yielded above; the others are retried, and only one that
+                    # breaks the pool while running alone is reported as the crash
+                    broken = True
+                    if alone:
+                        yield {'product_id': product_id, 'error': "Anomaly worker process died"}
+                    else:
+                        suspects.add(product_id)
+                        retries.append((product_id, sales))
+
+            now = time.monotonic()
+            expired = [future for future, (_, _, deadline) in running.items() if deadline <= now]
+            for future in expired:
+                product_id = running.pop(future)[0]
+                log.warning("Anomaly detection for %s timed out after %ss", product_id, timeout)
+                yield {'product_id': product_id, 'error': f"Anomaly detection timed out after {timeout}s"}
+            if expired or broken:
+                # Replace the pool and resubmit the products that were still in flight
+                in_flight = [(product_id, sales) for product_id, sales, _ in running.values()]
+                tasks.extendleft(reversed(retries + in_flight))
+                running.clear()
+                _terminate(executor)
+                executor = ProcessPoolExecutor(max_workers=workers)
+    finally:
+        _terminate(executor)
+
+
+def detect_catalogue(products: Iterable[Task], max_workers: Optional[int] = None, timeout: float = TASK_TIMEOUT,
+                     screen: bool = True, timezone: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """All results at once: per-product anomaly lists and the products that failed."""
+    report: Dict[str, List[Dict[str, Any]]] = {'products': [], 'failures': []}
+    for result in detect_batch(products, max_workers, timeout, screen=screen, timezone=timezone):
+        report['failures' if 'error' in result else 'products'].append(result)
+    return report
+
+
+def stream_batch(writer: Any, products: Iterable[Task], max_workers: Optional[int] = None,
+                 timeout: float = TASK_TIMEOUT, screen: bool = True, timezone: Optional[str] = None) -> None:
+    """Per finished product: a 'product' section, then its anomaly rows (or an error record)."""
+    counts = {'products': 0, 'failed': 0, 'escalated': 0}
+    for result in detect_batch(products, max_workers, timeout, columnar=True, screen=screen, timezone=timezone):
+        product_id = result['product_id']
+        if 'error' in result:
+            counts['failed'] += 1
+            writer.error(result['error'], product_id=product_id)
+            continue
+        counts['products'] += 1
+        counts['escalated'] += result['method'] == 'arima'
+        writer.section('product', {
+            'product_id': product_id,
+            'method': result['method'],
+            'model_parameters': result['model_parameters'],
+            'threshold': result['threshold'],
+            'anomalies': len(result['anomalies']['date']),
+        })
+        writer.rows('anomaly', result['anomalies'], product_id=product_id)
+    writer.end(**counts)
+
+
+if __name__ == "__main__":
+    import json
+    from ndjson import NDJSONWriter
+
+    # stdin: a JSON list of {"product_id": ..., "sales": [...]}; stdout: NDJSON records per product
+    try:
+        products = [(item['product_id'], item['sales']) for item in json.load(sys.stdin)]
+        stream_batch(NDJSONWriter(), products)
+    except Exception as e:
+        print(json.dumps({"error": f"Error in anomaly batch: {str(e)}\n{traceback.format_exc()}"}))
+        sys.exit(1)
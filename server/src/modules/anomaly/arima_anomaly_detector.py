@@ -1,16 +1,39 @@
 # New file: server/src/anomaly/arima_anomaly_detector.py
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'forecast'))
+from diagnostics import profile_imports_if_requested
+# Before the other imports, so --import-profile covers them
+profile_imports_if_requested(sys.argv)
+
 import numpy as np
 import pandas as pd
-from statsmodels.tsa.arima.model import ARIMA
-from statsmodels.tsa.stattools import adfuller
 import warnings
-import sys
 import json
+from collections import OrderedDict
+
+from model_cache import get_model_cache
+from order_selection import select_order
+from diagnostics import get_logger, stage, start_trace
+from ndjson import NDJSONWriter, strip_flags, wants_ndjson
+from sales_columns import decode, is_packed
+from calendar_series import CalendarSeries, to_epoch_days
 
 warnings.filterwarnings('ignore')
 
+log = get_logger('anomaly')
+
+ROLLING_WINDOW = 5
+MIN_DRIFT_POINTS = 7
+
 class ARIMAAnomalyDetector:
-    def __init__(self):
+    def __init__(self, product_id=None, time_budget=None, timezone=None):
+        self.product_id = product_id
+        # Seconds the order search may take; None uses the order_selection default
+        self.time_budget = time_budget
+        # Timezone whose calendar days sale timestamps are assigned to (UTC by default)
+        self.timezone = timezone
         self.model = None
         self.model_fit = None
         self.residuals = None
@@ -18,36 +41,45 @@ class ARIMAAnomalyDetector:
         
     def prepare_data(self, sales_data):
         """
-        Convert sales data to time series format
+        Convert sales data to a daily time series with 0 on days without sales.
+        Accepts a list of {date, quantity} dicts, packed SalesColumns (see sales_columns.py)
+        or an already prepared series, which is returned unchanged.
         """
-        df = pd.DataFrame(sales_data)
-        df['date'] = pd.to_datetime(df['date'])
-        # Aggregate by date
-        ts = df.groupby('date')['quantity'].sum()
-        return ts
+        if isinstance(sales_data, pd.Series):
+            return sales_data
+        return CalendarSeries.from_sales(sales_data, timezone=self.timezone).to_series()
         
     def find_best_parameters(self, time_series):
         """
         Find optimal ARIMA parameters using AIC
         """
-        best_aic = float('inf')
-        best_params = None
-        best_model = None
-        
-        # Try different combinations of p, d, q
-        for p in range(3):
-            for d in range(2):
-                for q in range(3):
-                    try:
-                        model = ARIMA(time_series, order=(p, d, q))
-                        results = model.fit()
-                        if results.aic < best_aic:
-                            best_aic = results.aic
-                            best_params = (p, d, q)
-                            best_model = results
-                    except:
-                        continue
-                        
+        # statsmodels is imported on first use; it dominates the script's startup time
+        from statsmodels.tsa.arima.model import ARIMA
+
+        # Unchanged series for this product skip the grid search and only run the filter
+        cache = get_model_cache()
+        cache_key = cache.key('anomaly-arima', self.product_id, time_series)
+        cached = cache.get(cache_key)
+        if cached:
+            order = tuple(cached['order'])
+            try:
+                return order, ARIMA(time_series, order=order).filter(np.asarray(cached['params']))
+            except Exception:
+                pass
+        
+        # Try different combinations of p, d, q in parallel, pruning hopeless ones
+        candidates = [(p, d, q) for p in range(3) for d in range(2) for q in range(3)]
+        search = select_order(time_series, candidates, model_kind='arima', max_d=1, time_budget=self.time_budget)
+        best = search['best']
+        if best is None:
+            return None, None
+        
+        best_params = tuple(best['order'])
+        # Rebuild the winning model from its parameters; filtering is far cheaper than a refit
+        best_model = ARIMA(time_series, order=best_params).filter(np.asarray(best['params']))
+        
+        if not search['timed_out']:
+            cache.put(cache_key, best)
         return best_params, best_model
         
         #Trains the ARIMA model using the best parameters.
@@ -65,6 +97,7 @@ class ARIMAAnomalyDetector:
             raise Exception("Failed to fit ARIMA model")
         
         # Store model parameters
+        from statsmodels.tsa.arima.model import ARIMA
         self.model = ARIMA(time_series, order=(p, d, q))
         
         # Calculate residuals
@@ -79,25 +112,28 @@ class ARIMAAnomalyDetector:
             'bic': self.model_fit.bic
         }
         
-    def detect_anomalies(self, sales_data):
+    def detect_anomalies(self, sales_data, columnar=False):
         """
-        Detect anomalies in the sales data
+        Detect anomalies in the sales data.
+        With columnar set, 'anomalies' holds parallel arrays instead of one dict per date.
         """
-        if self.model_fit is None:
-            self.fit_model(sales_data)
-            
-        # Prepare time series
+        # Prepare time series once; fit_model reuses it
         time_series = self.prepare_data(sales_data)
         
+        if self.model_fit is None:
+            with stage('fit'):
+                self.fit_model(time_series)
+        
         # Get model predictions
-        predictions = self.model_fit.predict(start=time_series.index[0], end=time_series.index[-1])
+        with stage('predict'):
+            predictions = self.model_fit.predict(start=time_series.index[0], end=time_series.index[-1])
         
         # Calculate residuals
         residuals = time_series - predictions
         
         # Calculate rolling mean and std for dynamic threshold
-        rolling_mean = time_series.rolling(window=5, min_periods=1).mean()
-        rolling_std = time_series.rolling(window=5, min_periods=1).std()
+        rolling_mean = time_series.rolling(window=ROLLING_WINDOW, min_periods=1).mean()
+        rolling_std = time_series.rolling(window=ROLLING_WINDOW, min_periods=1).std()
         
         # Detect anomalies using both residual and value-based methods
         residual_anomalies = np.abs(residuals) > self.threshold
@@ -107,27 +143,7 @@ class ARIMAAnomalyDetector:
         anomalies = residual_anomalies | value_anomalies
         
         # Prepare results
-        results = []
-        for date, is_anomaly in zip(time_series.index, anomalies):
-            if is_anomaly:
-                actual_value = float(time_series[date])
-                predicted_value = float(predictions[date])
-                residual = float(residuals[date])
-                
-                # Calculate severity based on multiple factors
-                residual_severity = np.abs(residual) / self.threshold
-                value_severity = np.abs(actual_value - predicted_value) / np.mean(time_series)
-                combined_severity = (residual_severity + value_severity) / 2
-                
-                severity = 'High' if combined_severity > 2 else 'Medium'
-                
-                results.append({
-                    'date': date.strftime('%Y-%m-%d'),
-                    'actual_value': actual_value,
-                    'predicted_value': predicted_value,
-                    'residual': residual,
-                    'severity': severity
-                })
+        results = self.build_results(time_series, predictions, residuals, anomalies, np.mean(time_series), columnar)
         
         return {
             'anomalies': results,
@@ -138,22 +154,251 @@ class ARIMAAnomalyDetector:
             },
             'threshold': float(self.threshold)
         }
+        
+    def stream_anomalies(self, sales_data, writer):
+        """
+        Write model_parameters and threshold sections, then one anomaly record per flagged date
+        """
+        results = self.detect_anomalies(sales_data, columnar=True)
+        writer.section('model_parameters', results['model_parameters'])
+        writer.section('threshold', results['threshold'])
+        with stage('serialize'):
+            writer.rows('anomaly', results['anomalies'])
+        writer.end()
+        
+    def build_results(self, time_series, predictions, residuals, anomalies, series_mean, columnar=False):
+        """
+        Build anomaly records for the flagged dates.
+        Returns a list of dicts, or parallel arrays keyed by field when columnar is set.
+        """
+        mask = np.asarray(anomalies, dtype=bool)
+        dates = time_series.index[mask]
+        actual = time_series.to_numpy(dtype=float)[mask]
+        predicted = self._aligned(predictions, time_series.index)[mask]
+        residual = self._aligned(residuals, time_series.index)[mask]
+        
+        # Calculate severity based on multiple factors
+        residual_severity = np.abs(residual) / self.threshold
+        value_severity = np.abs(actual - predicted) / series_mean
+        combined_severity = (residual_severity + value_severity) / 2
+        severity = np.where(combined_severity > 2, 'High', 'Medium')
+        
+        columns = {
+            'date': dates.strftime('%Y-%m-%d').tolist(),
+            'actual_value': actual.tolist(),
+            'predicted_value': predicted.tolist(),
+            'residual': residual.tolist(),
+            'severity': severity.tolist()
+        }
+        if columnar:
+            return columns
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+        
+    @staticmethod
+    def _aligned(series, index):
+        """
+        Values of series in index order, as a float array
+        """
+        if not series.index.equals(index):
+            series = series.reindex(index)
+        return series.to_numpy(dtype=float)
+
+class IncrementalAnomalyScorer:
+    """
+    Keeps fitted ARIMA state per product and scores only newly arrived days.
+
+    The latest day stays open, like the pattern accumulator's (see
+    sales_patterns.py): more sales may still arrive for it, so it is rescored
+    on every call and only becomes part of the model state once a later day
+    arrives. Closed days extend the Kalman filter of the stored model instead
+    of refitting it. A full refit runs when the residuals of the closed days
+    scored since the last fit drift past drift_limit times the fit's residual
+    std, or when a closed day has been revised.
+    """
+    def __init__(self, drift_limit=None, max_products=None):
+        self.drift_limit = drift_limit or float(os.getenv('ANOMALY_DRIFT_LIMIT', 1.5))
+        self.max_products = max_products or int(os.getenv('ANOMALY_MAX_TRACKED_PRODUCTS', 1000))
+        self.states = OrderedDict()
+        
+    def _refit(self, product_id, time_series, since=None, timezone=None):
+        """
+        Fit and score the full history, then keep the model state of all but the open last day
+        """
+        from statsmodels.tsa.arima.model import ARIMA
+
+        detector = ARIMAAnomalyDetector(product_id, timezone=timezone)
+        results = detector.detect_anomalies(time_series)
+        order = detector.model.order
+        closed = time_series.iloc[:-1]
+        
+        self.states[product_id] = {
+            'detector': detector,
+            # Positional model so later extends do not depend on a regular date index
+            'results': ARIMA(closed.values, order=order).filter(detector.model_fit.params),
+            'resid_std': float(np.std(detector.residuals)) or 1.0,
+            'last_date': closed.index[-1],
+            # Closed days the state was built from, to check later input against and to refit on
+            'history': CalendarSeries.from_days(to_epoch_days(closed.index.values), closed.values),
+            'open_date': time_series.index[-1],
+            'open_value': float(time_series.iloc[-1]),
+            'tail': closed.iloc[-(ROLLING_WINDOW - 1):],
+            'total': float(closed.sum()),
+            'count': len(closed),
+            'drift_sq_sum': 0.0,
+            'drift_points': 0,
+            'open_reported': any(a['date'] == time_series.index[-1].strftime('%Y-%m-%d')
+                                 for a in results['anomalies'])
+        }
+        self.states.move_to_end(product_id)
+        while len(self.states) > self.max_products:
+            self.states.popitem(last=False)
+        
+        if since is not None:
+            results['anomalies'] = [a for a in results['anomalies'] if a['date'] >= since.strftime('%Y-%m-%d')]
+        return {**results, 'mode': 'full', 'scored_points': len(time_series),
+                'open_date': self.states[product_id]['open_date'].strftime('%Y-%m-%d')}
+        
+    def score(self, product_id, sales_data, since=None, timezone=None, partial=False):
+        """
+        Score the open day and the days after it.
+
+        sales_data may be the full history or whole days from the open day
+        ('open_date' in every response) on; with partial set it is such a
+        tail, and an unknown product answers mode 'needs_history' instead of
+        fitting on it. since limits reported anomalies on a full (re)fit to
+        dates on or after it.
+        """
+        since = pd.Timestamp(since).tz_localize(None).normalize() if since else None
+        state = self.states.get(product_id)
+        if state is None and partial:
+            return {'anomalies': [], 'mode': 'needs_history', 'scored_points': 0}
+        detector = state['detector'] if state else ARIMAAnomalyDetector(product_id, timezone=timezone)
+        # Every call buckets its sales into days of its own timezone
+        detector.timezone = timezone
+        time_series = detector.prepare_data(sales_data)
+        
+        if state is None:
+            return self._refit(product_id, time_series, since, timezone)
+        
+        open_date, history = state['open_date'], state['history']
+        closed_input = time_series[time_series.index <= state['last_date']]
+        if len(closed_input):
+            # Closed days in the input must still match the ones the model state was built from
+            offsets = to_epoch_days(closed_input.index.values) - history.start
+            if offsets[0] < 0 or not np.array_equal(history.values[offsets], closed_input.values):
+                # Already scored history changed; the stored filter state no longer matches it
+                return self._refit(product_id, time_series, state['last_date'], timezone)
+        
+        self.states.move_to_end(product_id)
+        latest = max(time_series.index[-1], open_date) if len(time_series) else open_date
+        # The open day and every later one; days missing from the input had no sales,
+        # except the open day, which keeps its total when the input starts after it
+        days = pd.date_range(open_date, latest, name=time_series.index.name)
+        new_points = time_series.reindex(days, fill_value=0.0)
+        if open_date not in time_series.index:
+            new_points.iloc[0] = state['open_value']
+        
+        # One-step-ahead predictions for the new days, conditioned on the stored state.
+        # Flagged days are fed to the filter as missing so an outlier does not
+        # distort the predictions for the days after it.
+        observed = new_points.values.astype(float)
+        masked = np.zeros(len(observed), dtype=bool)
+        while True:
+            extended = state['results'].extend(np.where(masked, np.nan, observed))
+            predictions = pd.Series(np.asarray(extended.fittedvalues), index=new_points.index)
+            residuals = new_points - predictions
+            residual_anomalies = np.abs(residuals) > detector.threshold
+            newly_flagged = residual_anomalies.values & ~masked
+            if not newly_flagged.any():
+                break
+            masked[np.argmax(newly_flagged)] = True
+        
+        # Drift tracks how well the model still fits ordinary closed days, so flagged points
+        # and the still open last day are left out
+        ordinary = residuals.iloc[:-1][~residual_anomalies.iloc[:-1]]
+        drift_sq_sum = state['drift_sq_sum'] + float(np.sum(ordinary.values ** 2))
+        drift_points = state['drift_points'] + len(ordinary)
+        drift = np.sqrt(drift_sq_sum / max(drift_points, 1)) / state['resid_std']
+        if drift_points >= MIN_DRIFT_POINTS and drift > self.drift_limit:
+            log.info("Residual drift %.2f for product %s; refitting", drift, product_id)
+            return self._refit(product_id, pd.concat([history.to_series(), new_points]), open_date, timezone)
+        
+        # Same 5-day value test as the batch path, seeded with the last closed days
+        window = pd.concat([state['tail'], new_points])
+        rolling_mean = window.rolling(window=ROLLING_WINDOW, min_periods=1).mean().iloc[-len(new_points):]
+        rolling_std = window.rolling(window=ROLLING_WINDOW, min_periods=1).std().iloc[-len(new_points):]
+        
+        value_anomalies = np.abs(new_points - rolling_mean) > (2 * rolling_std)
+        flagged = (residual_anomalies | value_anomalies).values
+        # An open day reported on an earlier call is not reported again as more of its sales arrive
+        reported = flagged.copy()
+        reported[0] &= not state['open_reported']
+        
+        series_mean = (state['total'] + float(new_points.sum())) / (state['count'] + len(new_points))
+        results = detector.build_results(new_points, predictions, residuals, reported, series_mean)
+        
+        if len(new_points) > 1:
+            # Every day but the last is now closed; the filter state moves up to it
+            closed = new_points.iloc[:-1]
+            state['results'] = state['results'].extend(np.where(masked[:-1], np.nan, observed[:-1]))
+            state['drift_sq_sum'], state['drift_points'] = drift_sq_sum, drift_points
+            state['total'] += float(closed.sum())
+            state['count'] += len(closed)
+            state['last_date'] = closed.index[-1]
+            state['tail'] = pd.concat([state['tail'], closed]).iloc[-(ROLLING_WINDOW - 1):]
+            history.append(to_epoch_days(closed.index.values), closed.values, len(closed))
+            state['open_reported'] = bool(flagged[-1])
+        else:
+            state['open_reported'] = state['open_reported'] or bool(flagged[0])
+        state['open_date'] = new_points.index[-1]
+        state['open_value'] = float(new_points.iloc[-1])
+        
+        return {
+            'anomalies': results,
+            'model_parameters': dict(zip('pdq', detector.model.order)),
+            'threshold': float(detector.threshold),
+            'mode': 'incremental',
+            'scored_points': len(new_points),
+            'drift': float(drift),
+            'open_date': state['open_date'].strftime('%Y-%m-%d')
+        }
+
+_incremental_scorer = None
+
+def get_incremental_scorer():
+    """
+    Process-wide scorer; state lives as long as the worker process
+    """
+    global _incremental_scorer
+    if _incremental_scorer is None:
+        _incremental_scorer = IncrementalAnomalyScorer()
+    return _incremental_scorer
 
 if __name__ == "__main__":
+    # --ndjson streams typed records line by line (see ndjson.py) instead of one JSON document
+    streaming = wants_ndjson(sys.argv)
+    args = strip_flags(sys.argv[1:])
     try:
-        # Read input from stdin
-        input_data = sys.stdin.read()
-        sales_data = json.loads(input_data)
+        # Read input from stdin: packed sales columns (see sales_columns.py) or a JSON list of sales
+        input_data = sys.stdin.buffer.read()
+        sales_data = decode(input_data) if is_packed(input_data) else json.loads(input_data)
         
-        # Initialize detector
-        detector = ARIMAAnomalyDetector()
+        # Initialize detector; an optional product ID namespaces the model cache
+        detector = ARIMAAnomalyDetector(args[0] if args else None)
         
         # Detect anomalies
-        results = detector.detect_anomalies(sales_data)
-        
-        # Print results as JSON
-        print(json.dumps(results))
+        with start_trace('anomaly'):
+            if streaming:
+                detector.stream_anomalies(sales_data, NDJSONWriter())
+            else:
+                results = detector.detect_anomalies(sales_data)
+                
+                # Print results as JSON
+                with stage('serialize'):
+                    output = json.dumps(results)
+        if not streaming:
+            print(output)
         
     except Exception as e:
         print(json.dumps({"error": str(e)}), file=sys.stderr)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
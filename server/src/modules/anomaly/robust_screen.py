@@ -0,0 +1,246 @@
+"""Cheap first-stage anomaly screen, vectorized across products.
+
+Every product's daily series goes into one products x days matrix on a
+shared calendar. Days inside a product's history without sales are 0, and
+days outside it are NaN. Three robust detectors then run over the whole
+matrix at once:
+
+    rolling_mad       Hampel filter: robust z of each day against the median
+                      and MAD of the ROLLING_WINDOW_DAYS days centred on it
+    seasonal_esd      seasonal hybrid ESD: weekday medians and the overall
+                      median removed, then a generalized ESD test on
+                      median/MAD instead of mean/std
+    seasonal_trend    robust z of the residual after removing a centred
+                      7-day moving-average trend and the weekday means
+
+A day is suspicious when at least MIN_VOTES detectors flag it. Only
+products with suspicious days and enough history for ARIMA go on to the
+ARIMA residual model (see anomaly_batch.py). The rest are answered from the
+screen: quiet products report no anomalies, and short ones report the
+screen's flags against the rolling median.
+"""
+import os
+import warnings
+from typing import Any, Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+ROLLING_WINDOW_DAYS = 15
+SEASON_DAYS = 7
+# Robust z beyond which the rolling_mad and seasonal_trend detectors flag a day
+Z_CUTOFF = 4
+ESD_ALPHA = 0.05
+# Most days per product the ESD test may flag
+ESD_MAX_SHARE = 0.02
+MIN_VOTES = int(os.getenv('ANOMALY_SCREEN_MIN_VOTES', 2))
+# Shortest history the ARIMA stage is run on; shorter products keep the screen's verdict
+MIN_ARIMA_DAYS = 30
+# Products per detector pass; bounds the products x days x window arrays
+CHUNK_PRODUCTS = 256
+# Consistency constants that turn MAD and mean absolute deviation into normal standard deviations
+MAD_SCALE = 1.4826
+MEAN_ABS_SCALE = 1.2533
+
+
+def _day_numbers(index: pd.DatetimeIndex) -> np.ndarray:
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return np.asarray(index.values.astype('datetime64[D]').astype(np.int64))
+
+
+def series_matrix(series: Sequence[pd.Series]) -> Tuple[np.ndarray, int]:
+    """products x days matrix on a shared calendar and the epoch day of its first column."""
+    days = [_day_numbers(item.index) for item in series]
+    start = min(int(day.min()) for day in days)
+    end = max(int(day.max()) for day in days)
+    matrix = np.full((len(series), end - start + 1), np.nan)
+    for row, (day, item) in enumerate(zip(days, series)):
+        offsets = day - start
+        matrix[row, offsets.min():offsets.max() + 1] = 0.0
+        np.add.at(matrix[row], offsets, item.to_numpy(dtype=np.float64))
+    return matrix, start
+
+
+def nanmedian(values: np.ndarray) -> np.ndarray:
+    """Median along the last axis ignoring NaN, from one sort (np.nanmedian loops over rows in Python)."""
+    ordered = np.sort(values, axis=-1)
+    count = np.sum(np.isfinite(values), axis=-1, keepdims=True)
+    low = np.take_along_axis(ordered, np.maximum((count - 1) // 2, 0), axis=-1)
+    high = np.take_along_axis(ordered, np.maximum(count // 2, 0), axis=-1)
+    return np.where(count > 0, (low + high) / 2, np.nan)[..., 0]
+
+
+def _robust_scale(median_deviation: np.ndarray, mean_deviation: np.ndarray) -> np.ndarray:
+    """MAD-based standard deviation.
+
+    Mostly constant stretches (intermittent demand) have a MAD of 0; the
+    mean absolute deviation is used for those instead.
+    """
+    return np.where(median_deviation > 0, MAD_SCALE * median_deviation, MEAN_ABS_SCALE * mean_deviation)
+
+
+def _robust_z(values: np.ndarray, center: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    return np.divide(values - center, scale, out=np.zeros_like(values), where=scale > 0)
+
+
+def _row_center_scale(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    center = nanmedian(matrix)[:, None]
+    deviation = np.abs(matrix - center)
+    return center, _robust_scale(nanmedian(deviation), np.nanmean(deviation, axis=1))[:, None]
+
+
+def rolling_mad(matrix: np.ndarray, window: int = ROLLING_WINDOW_DAYS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Robust z-scores against a centred rolling median, plus that median and the MAD scale."""
+    half = window // 2
+    padded = np.pad(matrix, ((0, 0), (half, window - 1 - half)), constant_values=np.nan)
+    windows = sliding_window_view(padded, window, axis=1)
+    median = nanmedian(windows)
+    deviation = np.abs(windows - median[..., None])
+    scale = _robust_scale(nanmedian(deviation), np.nanmean(deviation, axis=-1))
+    # A MAD from window days alone is noisy and often far too small; the series-wide scale is its floor
+    scale = np.maximum(scale, _row_center_scale(matrix)[1])
+    return _robust_z(matrix, median, scale), median, scale
+
+
+def _weekday_profile(matrix: np.ndarray, weekdays: np.ndarray, reducer: Any) -> np.ndarray:
+    profile = np.empty(matrix.shape)
+    for weekday in range(SEASON_DAYS):
+        columns = weekdays == weekday
+        if columns.any():
+            profile[:, columns] = reducer(matrix[:, columns])[:, None]
+    return profile
+
+
+def seasonal_esd(matrix: np.ndarray, weekdays: np.ndarray, alpha: float = ESD_ALPHA,
+                 max_share: float = ESD_MAX_SHARE) -> np.ndarray:
+    """Boolean flags from the seasonal hybrid ESD test, one generalized ESD run per product row.
+
+    The median and MAD are computed once per row instead of after every
+    removal; taking out at most max_share of the points barely moves them,
+    and the test statistics then come straight from one sort of the
+    deviations.
+    """
+    from scipy.stats import t as student_t
+
+    residual = matrix - _weekday_profile(matrix, weekdays, nanmedian)
+    center, scale = _row_center_scale(residual)
+    deviation = np.abs(residual - center)
+    n = np.sum(np.isfinite(residual), axis=1)[:, None]
+    max_anomalies = max(int(max_share * matrix.shape[1]), 1)
+
+    # Most extreme points first; NaN sorts last
+    extreme = np.argsort(np.where(np.isfinite(deviation), -deviation, np.inf), axis=1)[:, :max_anomalies]
+    statistic = np.divide(np.take_along_axis(deviation, extreme, axis=1), scale,
+                          out=np.zeros(extreme.shape), where=scale > 0)
+
+    # Critical value for the i-th most extreme point out of n
+    i = np.arange(1, max_anomalies + 1)[None, :]
+    dof = np.maximum(n - i - 1, 1)
+    t = student_t.ppf(1 - alpha / (2 * np.maximum(n - i + 1, 1)), dof)
+    critical = (n - i) * t / np.sqrt((dof + t ** 2) * (n - i + 1))
+    significant = (statistic > critical) & (n - i - 1 >= 1) & (i <= max_share * n)
+
+    # The number of anomalies is the largest i whose statistic exceeds its critical value
+    accepted = np.max(np.where(significant, i, 0), axis=1)
+    flags = np.zeros(matrix.shape, dtype=bool)
+    take = i <= accepted[:, None]
+    rows = np.broadcast_to(np.arange(matrix.shape[0])[:, None], extreme.shape)
+    flags[rows[take], extreme[take]] = True
+    return flags
+
+
+def seasonal_trend(matrix: np.ndarray, weekdays: np.ndarray, period: int = SEASON_DAYS) -> np.ndarray:
+    """Robust z-scores of the residual of a moving-average trend plus weekday seasonal decomposition."""
+    half = period // 2
+    present = np.isfinite(matrix)
+    padded = np.pad(np.where(present, matrix, 0.0), ((0, 0), (half + 1, half)))
+    counts = np.pad(present.astype(np.float64), ((0, 0), (half + 1, half)))
+    sums = np.cumsum(padded, axis=1)
+    totals = np.cumsum(counts, axis=1)
+    window_sum = sums[:, period:] - sums[:, :-period]
+    window_count = totals[:, period:] - totals[:, :-period]
+    trend = np.divide(window_sum, window_count, out=np.full(matrix.shape, np.nan), where=window_count > 0)
+
+    detrended = matrix - trend
+    seasonal = _weekday_profile(detrended, weekdays, lambda block: np.nanmean(block, axis=1))
+    seasonal -= np.nanmean(seasonal[:, :period], axis=1, keepdims=True)
+    residual = detrended - seasonal
+
+    center, scale = _row_center_scale(residual)
+    return _robust_z(residual, center, scale)
+
+
+def screen_matrix(matrix: np.ndarray, start_day: int) -> Dict[str, np.ndarray]:
+    """Detector votes per day plus the rolling_mad baseline, z and scale, in chunks of CHUNK_PRODUCTS rows."""
+    weekdays = (start_day + np.arange(matrix.shape[1]) + 3) % 7
+    votes = np.zeros(matrix.shape, dtype=np.int8)
+    baseline = np.empty(matrix.shape)
+    score = np.empty(matrix.shape)
+    scales = np.empty(matrix.shape)
+    with warnings.catch_warnings():
+        # All-NaN windows before a product's first sale
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for chunk in range(0, matrix.shape[0], CHUNK_PRODUCTS):
+            rows = slice(chunk, chunk + CHUNK_PRODUCTS)
+            block = matrix[rows]
+            z, median, scale = rolling_mad(block)
+            votes[rows] += np.abs(z) > Z_CUTOFF
+            votes[rows] += seasonal_esd(block, weekdays)
+            votes[rows] += np.abs(seasonal_trend(block, weekdays)) > Z_CUTOFF
+            baseline[rows] = median
+            score[rows] = z
+            scales[rows] = scale
+    votes[~np.isfinite(matrix)] = 0
+    return {'votes': votes, 'baseline': baseline, 'score': score, 'scale': scales}
+
+
+def screen_series(items: Sequence[Tuple[str, pd.Series]], min_votes: int = MIN_VOTES) -> Dict[str, Dict[str, Any]]:
+    """Screen many daily series in one pass.
+
+    Returns per product ID the suspicious days and whether the product
+    should escalate to the ARIMA stage.
+    """
+    if not items:
+        return {}
+    matrix, start_day = series_matrix([series for _, series in items])
+    screened = screen_matrix(matrix, start_day)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        # Deviation from the rolling median at which rolling_mad flags a typical day
+        thresholds = Z_CUTOFF * nanmedian(screened['scale'])
+    results = {}
+    for row, (product_id, series) in enumerate(items):
+        columns = np.flatnonzero(screened['votes'][row] >= min_votes)
+        results[product_id] = {
+            'threshold': float(thresholds[row]) if np.isfinite(thresholds[row]) else 0.0,
+            'days': len(series),
+            'dates': (start_day + columns).astype('datetime64[D]'),
+            'actual': matrix[row, columns],
+            'expected': screened['baseline'][row, columns],
+            'score': screened['score'][row, columns],
+            'suspicious_points': len(columns),
+            'escalate': bool(len(columns)) and len(series) >= MIN_ARIMA_DAYS,
+        }
+    return results
+
+
+def screen_report(screened: Dict[str, Any], columnar: bool = False) -> Dict[str, Any]:
+    """Anomaly result in the detector's format for a product answered by the screen alone."""
+    residual = screened['actual'] - screened['expected']
+    columns = {
+        'date': np.datetime_as_string(screened['dates']).tolist(),
+        'actual_value': screened['actual'].tolist(),
+        'predicted_value': screened['expected'].tolist(),
+        'residual': residual.tolist(),
+        'severity': np.where(np.abs(screened['score']) > 2 * Z_CUTOFF, 'High', 'Medium').tolist(),
+    }
+    anomalies: Any = columns if columnar else [dict(zip(columns, row)) for row in zip(*columns.values())]
+    return {
+        'anomalies': anomalies,
+        'model_parameters': None,
+        'threshold': screened['threshold'],
+        'method': 'screen',
+        'suspicious_points': screened['suspicious_points'],
+    }
@@ -1,8 +1,7 @@
 import { Types } from 'mongoose';
 import Sale from '../sale/sale.model';
 import Product from './product.model';
-import { spawn } from 'child_process';
-import path from 'path';
+import { ForecastWorkerService } from '../../services/forecastWorker.service';
 
 interface DemandForecast {
   productId: string;
@@ -19,9 +18,10 @@ interface DemandForecast {
   };
 }
 
-const runARIMAForecast = async (salesData: { date: Date; quantity: number }[]): Promise<{ 
+const runARIMAForecast = async (salesData: { date: Date; quantity: number }[], productId: string): Promise<{ 
   forecast: number; 
   confidence: number;
+  method: DemandForecast['method'];
   forecastDetails: {
     trend: 'increasing' | 'decreasing' | 'stable';
     seasonality: boolean;
@@ -29,73 +29,46 @@ const runARIMAForecast = async (salesData: { date: Date; quantity: number }[]):
     historicalAccuracy: number;
   };
 }> => {
-  return new Promise((resolve, reject) => {
-    const scriptPath = path.join(__dirname, '../../../src/forecast/stock_optimization.py');
-    console.log(`[ARIMA] Running Python script at: ${scriptPath}`);
-    console.log(`[ARIMA] Input data points: ${salesData.length}`);
-
-    const pythonProcess = spawn('python3', [scriptPath, 'forecast', JSON.stringify(salesData)]);
-
-    let result = '';
-    let error = '';
-
-    pythonProcess.stdout.on('data', (data) => {
-      const output = data.toString();
-      console.log(`[ARIMA] Python stdout: ${output}`);
-      result += output;
-    });
-
-    pythonProcess.stderr.on('data', (data) => {
-      const errorOutput = data.toString();
-      console.error(`[ARIMA] Python stderr: ${errorOutput}`);
-      error += errorOutput;
-    });
-
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        console.error(`[ARIMA] Python process exited with code ${code}`);
-        console.error(`[ARIMA] Error output: ${error}`);
-        reject(new Error(`Python process failed: ${error}`));
-        return;
-      }
-
-      try {
-        console.log(`[ARIMA] Raw Python output: ${result}`);
-        const parsedResult = JSON.parse(result);
-        
-        if (!parsedResult.forecast || !Array.isArray(parsedResult.forecast) || parsedResult.forecast.length === 0) {
-          throw new Error('Invalid forecast data structure');
-        }
-
-        const forecast = parsedResult.forecast[0].forecasted_quantity;
-        const confidence = parsedResult.optimal_levels?.mean_demand > 0 
-          ? Math.min(100, (parsedResult.optimal_levels.mean_demand / parsedResult.optimal_levels.std_demand) * 100)
-          : 50;
-
-        // Analyze trend and seasonality
-        const trend = analyzeTrend(salesData);
-        const seasonality = detectSeasonality(salesData);
-        const historicalAccuracy = calculateHistoricalAccuracy(salesData, parsedResult.forecast);
-
-        console.log(`[ARIMA] Successfully parsed forecast: ${forecast}, confidence: ${confidence}`);
-        
-        resolve({
-          forecast,
-          confidence,
-          forecastDetails: {
-            trend,
-            seasonality,
-            forecastPeriod: 30, // 30 days forecast
-            historicalAccuracy
-          }
-        });
-      } catch (error: any) {
-        console.error('[ARIMA] Failed to parse Python output:', error);
-        console.error('[ARIMA] Raw output was:', result);
-        reject(new Error(`Failed to parse Python output: ${error.message}`));
-      }
-    });
+  console.log(`[ARIMA] Input data points: ${salesData.length}`);
+
+  // Runs stock_optimization.run_arima_forecast on the persistent Python worker
+  const parsedResult = await ForecastWorkerService.getInstance().request('arima_forecast', {
+    sales: salesData,
+    product_id: productId
   });
+
+  if (parsedResult.error) {
+    throw new Error(`ARIMA forecast failed: ${parsedResult.error}`);
+  }
+  if (!parsedResult.forecast || !Array.isArray(parsedResult.forecast) || parsedResult.forecast.length === 0) {
+    throw new Error('Invalid forecast data structure');
+  }
+
+  const forecast = parsedResult.forecast[0].forecasted_quantity;
+  const confidence = parsedResult.optimal_levels?.mean_demand > 0 
+    ? Math.min(100, (parsedResult.optimal_levels.mean_demand / parsedResult.optimal_levels.std_demand) * 100)
+    : 50;
+
+  // Analyze trend and seasonality
+  const trend = analyzeTrend(salesData);
+  const seasonality = detectSeasonality(salesData);
+  const historicalAccuracy = calculateHistoricalAccuracy(salesData, parsedResult.forecast);
+
+  // The worker falls back to a moving average when the ARIMA fit exceeds its latency budget
+  const method = parsedResult.model?.method === 'moving_average' ? 'Moving Average' : 'ARIMA';
+  console.log(`[ARIMA] Successfully parsed forecast: ${forecast}, confidence: ${confidence}, method: ${method}`);
+
+  return {
+    forecast,
+    confidence,
+    method,
+    forecastDetails: {
+      trend,
+      seasonality,
+      forecastPeriod: 30, // 30 days forecast
+      historicalAccuracy
+    }
+  };
 };
 
 // Helper function to analyze trend
@@ -201,14 +174,14 @@ export const forecastDemand = async (userId: string, productId: string): Promise
   if (salesData.length >= 10) {
     try {
       console.log(`[Demand Forecast] Using ARIMA for ${product.name}`);
-      const { forecast, confidence, forecastDetails } = await runARIMAForecast(salesData);
+      const { forecast, confidence, method, forecastDetails } = await runARIMAForecast(salesData, productId);
       return {
         productId: product._id.toString(),
         productName: product.name,
         currentStock: product.stock,
         forecastedDemand: Math.ceil(forecast),
         confidence,
-        method: 'ARIMA',
+        method,
         forecastDetails
       };
     } catch (error) {
@@ -6,6 +6,8 @@ import BaseServices from '../baseServices';
 import Sale from './sale.model';
 import Product from '../product/product.model';
 import CustomError from '../../errors/customError';
+import { AnomalyDetectionService } from '../anomaly/anomalyDetection.service';
+import { StockOptimizationService } from '../../services/stockOptimizationService';
 
 class SaleServices extends BaseServices<any> {
   constructor(model: any, modelName: string) {
@@ -34,6 +36,14 @@ class SaleServices extends BaseServices<any> {
       result = await this.model.create([payload], { session });
       await session.commitTransaction();
 
+      // Score the new sale in the background; a slow or failed model must not block the sale
+      AnomalyDetectionService.getInstance()
+        .scoreNewSales(String(product!._id), payload.date)
+        .catch((error) => console.error('Incremental anomaly scoring failed:', error));
+      StockOptimizationService.getInstance()
+        .updateSalesPatterns(String(product!._id), { date: payload.date, quantity })
+        .catch((error) => console.error('Sales pattern update failed:', error));
+
       return result;
     } catch (error) {
       await session.abortTransaction();
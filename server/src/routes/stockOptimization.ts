@@ -44,4 +44,44 @@ router.get('/optimize/:productId', async (req, res) => {
     }
 });
 
+// Route for incrementally maintained sales pattern stats
+router.get('/patterns/:productId', async (req, res) => {
+    try {
+        const { productId } = req.params;
+        const result = await stockOptimizationService.updateSalesPatterns(productId);
+        res.json(result);
+    } catch (error) {
+        console.error('Error in sales patterns route:', error);
+        res.status(500).json({ error: 'Failed to load sales patterns' });
+    }
+});
+
+// Route for the whole-catalogue replenishment table (optionally a what-if sweep)
+router.post('/policies', async (req, res) => {
+    try {
+        const result = await stockOptimizationService.computeInventoryPolicies(req.body || {});
+        if ('error' in result) {
+            return res.status(400).json(result);
+        }
+        res.json(result);
+    } catch (error) {
+        console.error('Error in inventory policy route:', error);
+        res.status(500).json({ error: 'Failed to compute inventory policies' });
+    }
+});
+
+// Route for simulating reorder policies against sampled demand paths
+router.post('/simulate', async (req, res) => {
+    try {
+        const result = await stockOptimizationService.simulatePolicies(req.body || {});
+        if ('error' in result) {
+            return res.status(400).json(result);
+        }
+        res.json(result);
+    } catch (error) {
+        console.error('Error in policy simulation route:', error);
+        res.status(500).json({ error: 'Failed to simulate reorder policies' });
+    }
+});
+
 export default router; 
\ No newline at end of file
@@ -0,0 +1,358 @@
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import path from 'path';
+import fs from 'fs';
+
+export type ForecastWorkerRequestType =
+  | 'forecast'
+  | 'forecast_batch'
+  | 'forecast_hierarchy'
+  | 'backtest'
+  | 'route'
+  | 'optimize'
+  | 'inventory_policy'
+  | 'simulate_policy'
+  | 'arima_forecast'
+  | 'patterns'
+  | 'anomaly'
+  | 'anomaly_batch'
+  | 'anomaly_incremental';
+
+// One NDJSON record from a streaming request (see forecast/ndjson.py)
+export interface ForecastStreamRecord {
+  type: 'point' | 'anomaly' | 'section' | 'error' | 'end';
+  [field: string]: any;
+}
+
+interface PendingRequest {
+  id: number;
+  type: ForecastWorkerRequestType;
+  payload: object;
+  timeoutMs: number;
+  resolve: (value: any) => void;
+  reject: (reason: Error) => void;
+  onRecord?: (record: ForecastStreamRecord) => void;
+}
+
+interface WorkerMessage {
+  id?: number | null;
+  event?: string;
+  result?: any;
+  record?: ForecastStreamRecord;
+  error?: string;
+}
+
+const DEFAULT_TIMEOUT_MS = Number(process.env.FORECAST_WORKER_TIMEOUT_MS) || 5 * 60 * 1000;
+const DEFAULT_POOL_SIZE = Number(process.env.FORECAST_WORKER_POOL_SIZE) || 2;
+const MS_PER_DAY = 24 * 60 * 60 * 1000;
+// Sales are bucketed into calendar days of this timezone; the Python side reads the same variable
+export const SALES_TIMEZONE = process.env.SALES_TIMEZONE || 'UTC';
+
+const dayFormatters = new Map<string, Intl.DateTimeFormat>();
+
+// Epoch day (days since 1970-01-01) of the calendar day a timestamp falls on in timezone
+export function salesDay(date: Date | string, timezone: string = SALES_TIMEZONE): number {
+  const time = new Date(date).getTime();
+  if (timezone === 'UTC') {
+    return Math.floor(time / MS_PER_DAY);
+  }
+  let formatter = dayFormatters.get(timezone);
+  if (!formatter) {
+    formatter = new Intl.DateTimeFormat('en-US', {
+      timeZone: timezone,
+      year: 'numeric',
+      month: 'numeric',
+      day: 'numeric'
+    });
+    dayFormatters.set(timezone, formatter);
+  }
+  const parts = Object.fromEntries(formatter.formatToParts(time).map((part) => [part.type, part.value]));
+  return Date.UTC(Number(parts.year), Number(parts.month) - 1, Number(parts.day)) / MS_PER_DAY;
+}
+
+/**
+ * Sales as base64 packed columns for the worker's "sales_packed" field (see forecast/sales_columns.py):
+ * a 'SLS1' magic and uint32 count, then int32 epoch days (calendar days in SALES_TIMEZONE) and float32
+ * quantities, little-endian.
+ */
+export function packSales(sales: Array<{ date: Date | string; quantity: number }>): string {
+  const count = sales.length;
+  const buffer = Buffer.alloc(8 + count * 8);
+  buffer.write('SLS1', 0, 'latin1');
+  buffer.writeUInt32LE(count, 4);
+  sales.forEach((sale, index) => {
+    buffer.writeInt32LE(salesDay(sale.date), 8 + index * 4);
+    buffer.writeFloatLE(sale.quantity, 8 + count * 4 + index * 4);
+  });
+  return buffer.toString('base64');
+}
+
+// One persistent python3 process running forecast/worker.py. The worker handles one request at a time,
+// so requests wait in a queue here and only the one written to the process is timed
+class WorkerProcess {
+  private child: ChildProcessWithoutNullStreams | null = null;
+  private buffer = '';
+  private queue: PendingRequest[] = [];
+  private inFlight: PendingRequest | null = null;
+  private timer: NodeJS.Timeout | null = null;
+
+  constructor(
+    private pythonPath: string,
+    private scriptPath: string,
+    private label: string
+  ) {}
+
+  get load(): number {
+    return this.queue.length + (this.inFlight ? 1 : 0);
+  }
+
+  private start(): ChildProcessWithoutNullStreams {
+    console.log(`[ForecastWorker ${this.label}] Starting ${this.pythonPath} ${this.scriptPath}`);
+
+    const child = spawn(this.pythonPath, [this.scriptPath], {
+      env: {
+        ...process.env,
+        PYTHONUNBUFFERED: '1',
+        // The ARIMA order search sizes its process pool to this worker's share of the CPUs
+        // (the request pool plus the job worker)
+        FORECAST_WORKER_POOL_SIZE: String(DEFAULT_POOL_SIZE + 1)
+      }
+    });
+
+    // A child that was killed and replaced must not touch its successor's state
+    const current = () => this.child === child;
+
+    child.stdout.on('data', (data) => {
+      if (current()) this.onStdout(data.toString());
+    });
+
+    child.stderr.on('data', (data) => {
+      console.error(`[ForecastWorker ${this.label}] stderr:`, data.toString());
+    });
+
+    child.on('error', (err) => {
+      console.error(`[ForecastWorker ${this.label}] Failed to start Python process:`, err);
+      if (!current()) return;
+      // Queued requests would only fail the same way, so they are rejected too
+      this.child = null;
+      this.failAll(new Error(`Failed to start Python worker: ${err.message}\nPython path: ${this.pythonPath}`));
+    });
+
+    child.on('close', (code) => {
+      console.error(`[ForecastWorker ${this.label}] Python worker exited with code ${code}`);
+      if (!current()) return;
+      this.child = null;
+      this.buffer = '';
+      // Only the request the process was running is lost; the queue moves to a fresh process
+      this.settle()?.reject(new Error(`Python worker exited with code ${code}`));
+      this.dispatch();
+    });
+
+    this.child = child;
+    return child;
+  }
+
+  private onStdout(chunk: string) {
+    this.buffer += chunk;
+    let newline = this.buffer.indexOf('\n');
+    while (newline !== -1) {
+      const line = this.buffer.slice(0, newline).trim();
+      this.buffer = this.buffer.slice(newline + 1);
+      if (line) {
+        this.onMessage(line);
+      }
+      newline = this.buffer.indexOf('\n');
+    }
+  }
+
+  private onMessage(line: string) {
+    let message: WorkerMessage;
+    try {
+      message = JSON.parse(line);
+    } catch (e) {
+      console.error(`[ForecastWorker ${this.label}] Failed to parse worker output:`, line);
+      // Requests run one at a time, so the unreadable line belongs to the one in flight
+      this.settle()?.reject(new Error('Forecast worker sent an unparseable response'));
+      this.dispatch();
+      return;
+    }
+
+    if (message.event) {
+      console.log(`[ForecastWorker ${this.label}] ${message.event}`);
+      return;
+    }
+
+    if (message.id === undefined || message.id === null) {
+      console.error(`[ForecastWorker ${this.label}] Worker error:`, message.error);
+      return;
+    }
+
+    const request = this.inFlight;
+    if (!request || request.id !== message.id) {
+      return;
+    }
+
+    if (message.record !== undefined) {
+      request.onRecord?.(message.record);
+      return;
+    }
+
+    this.settle();
+    this.dispatch();
+
+    if (message.error !== undefined) {
+      request.reject(new Error(message.error));
+    } else {
+      request.resolve(message.result);
+    }
+  }
+
+  // Writes the next queued request to the process once the previous one has settled
+  private dispatch() {
+    if (this.inFlight || !this.queue.length) {
+      return;
+    }
+    const child = this.child ?? this.start();
+    const request = this.queue.shift()!;
+    this.inFlight = request;
+    // The timeout covers the request's own run, not the time it spent waiting behind others
+    this.timer = setTimeout(() => {
+      const { type, timeoutMs } = request;
+      console.error(`[ForecastWorker ${this.label}] Request ${type} timed out after ${timeoutMs}ms; restarting worker`);
+      this.settle()?.reject(new Error(`Forecast worker request ${type} timed out after ${timeoutMs}ms`));
+      this.restart();
+    }, request.timeoutMs);
+    child.stdin.write(JSON.stringify({ id: request.id, type: request.type, payload: request.payload }) + '\n');
+  }
+
+  // Clears the in-flight request and its timer
+  private settle(): PendingRequest | null {
+    const request = this.inFlight;
+    this.inFlight = null;
+    if (this.timer) {
+      clearTimeout(this.timer);
+      this.timer = null;
+    }
+    return request;
+  }
+
+  // A timed-out job keeps the Python process busy, so it is killed and the queued requests
+  // are written to a fresh process instead
+  private restart() {
+    const child = this.child;
+    this.child = null;
+    this.buffer = '';
+    child?.kill('SIGKILL');
+    this.dispatch();
+  }
+
+  private failAll(error: Error) {
+    const requests = [this.settle(), ...this.queue];
+    this.queue = [];
+    for (const request of requests) {
+      request?.reject(error);
+    }
+  }
+
+  send<T>(
+    id: number,
+    type: ForecastWorkerRequestType,
+    payload: object,
+    timeoutMs: number,
+    onRecord?: (record: ForecastStreamRecord) => void
+  ): Promise<T> {
+    return new Promise<T>((resolve, reject) => {
+      this.queue.push({ id, type, payload, timeoutMs, resolve, reject, onRecord });
+      this.dispatch();
+    });
+  }
+
+  stop() {
+    const child = this.child;
+    this.child = null;
+    this.failAll(new Error('Forecast worker stopped'));
+    child?.stdin.end();
+  }
+}
+
+export class ForecastWorkerService {
+  private static instance: ForecastWorkerService;
+  private workers: WorkerProcess[];
+  // Long catalogue jobs run here so they never hold up requests queued on the pool
+  private jobWorker: WorkerProcess;
+  private nextId = 1;
+
+  private constructor() {
+    // Use the Python from our virtual environment
+    let pythonPath = path.join(process.cwd(), 'venv', 'bin', 'python3');
+    if (!fs.existsSync(pythonPath)) {
+      // Fallback to system Python
+      pythonPath = 'python3';
+    }
+
+    const scriptPath = path.join(__dirname, '..', 'forecast', 'worker.py');
+    this.workers = Array.from(
+      { length: DEFAULT_POOL_SIZE },
+      (_, index) => new WorkerProcess(pythonPath, scriptPath, String(index))
+    );
+    this.jobWorker = new WorkerProcess(pythonPath, scriptPath, 'jobs');
+  }
+
+  public static getInstance(): ForecastWorkerService {
+    if (!ForecastWorkerService.instance) {
+      ForecastWorkerService.instance = new ForecastWorkerService();
+    }
+    return ForecastWorkerService.instance;
+  }
+
+  public request<T = any>(
+    type: ForecastWorkerRequestType,
+    payload: object = {},
+    timeoutMs: number = DEFAULT_TIMEOUT_MS,
+    routingKey?: string
+  ): Promise<T> {
+    // Workers are started lazily on first use
+    const worker = routingKey !== undefined ? this.workerFor(routingKey) : this.leastBusyWorker();
+    return worker.send<T>(this.nextId++, type, payload, timeoutMs);
+  }
+
+  // Streams NDJSON records to onRecord as the worker produces them; resolves once the last one is sent
+  public async stream(
+    type: ForecastWorkerRequestType,
+    payload: object,
+    onRecord: (record: ForecastStreamRecord) => void,
+    timeoutMs: number = DEFAULT_TIMEOUT_MS,
+    routingKey?: string
+  ): Promise<void> {
+    const worker = routingKey !== undefined ? this.workerFor(routingKey) : this.leastBusyWorker();
+    await worker.send(this.nextId++, type, { ...payload, stream: true }, timeoutMs, onRecord);
+  }
+
+  // Streams a long job (e.g. the anomaly sweep over the whole catalogue) on the dedicated job worker. Jobs queue
+  // behind each other there, while per-product requests routed to the pool keep being answered
+  public async streamJob(
+    type: ForecastWorkerRequestType,
+    payload: object,
+    onRecord: (record: ForecastStreamRecord) => void,
+    timeoutMs: number = DEFAULT_TIMEOUT_MS
+  ): Promise<void> {
+    await this.jobWorker.send(this.nextId++, type, { ...payload, stream: true }, timeoutMs, onRecord);
+  }
+
+  private leastBusyWorker(): WorkerProcess {
+    return this.workers.reduce((least, current) => (current.load < least.load ? current : least));
+  }
+
+  // Requests that rely on per-key state kept inside a worker always go to the same one
+  private workerFor(routingKey: string): WorkerProcess {
+    let hash = 0;
+    for (let i = 0; i < routingKey.length; i++) {
+      hash = (hash * 31 + routingKey.charCodeAt(i)) >>> 0;
+    }
+    return this.workers[hash % this.workers.length];
+  }
+
+  public shutdown() {
+    this.workers.forEach((worker) => worker.stop());
+    this.jobWorker.stop();
+  }
+}
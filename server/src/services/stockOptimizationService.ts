@@ -1,22 +1,21 @@
-import { spawn } from 'child_process';
-import { StockOptimizationResult, StockOptimizationError } from '../types/stockOptimization';
-import path from 'path';
-import fs from 'fs';
+import {
+    InventoryPolicyRequest,
+    InventoryPolicyTable,
+    PolicySimulationRequest,
+    PolicySimulationResult,
+    SalesPatternAnalysis,
+    StockOptimizationResult,
+    StockOptimizationError
+} from '../types/stockOptimization';
+import { ForecastWorkerService } from './forecastWorker.service';
 
 export class StockOptimizationService {
     private static instance: StockOptimizationService;
-    private pythonPath: string;
+    private worker: ForecastWorkerService;
 
     private constructor() {
-        // Use the Python from our virtual environment
-        this.pythonPath = path.join(process.cwd(), 'venv', 'bin', 'python3');
-        
-        // Check if Python exists
-        if (!fs.existsSync(this.pythonPath)) {
-            console.error(`Python not found at ${this.pythonPath}`);
-            // Fallback to system Python
-            this.pythonPath = 'python3';
-        }
+        // Optimization runs on the shared persistent Python worker
+        this.worker = ForecastWorkerService.getInstance();
     }
 
     public static getInstance(): StockOptimizationService {
@@ -27,77 +26,55 @@ export class StockOptimizationService {
     }
 
     public async optimizeStockLevels(productId?: string, isDemo: boolean = false): Promise<StockOptimizationResult | StockOptimizationError> {
-        return new Promise((resolve, reject) => {
-            const scriptPath = path.join(__dirname, '..', 'forecast', 'stock_optimization.py');
-            console.log('Python script path:', scriptPath);
-            console.log('Using Python path:', this.pythonPath);
-            
-            // Check if script exists
-            if (!fs.existsSync(scriptPath)) {
-                const error = `Python script not found at ${scriptPath}`;
-                console.error(error);
-                reject(new Error(error));
-                return;
-            }
-            
-            const args = isDemo ? [scriptPath, 'demo'] : [scriptPath, productId || 'demo'];
-            console.log('Running Python with args:', args);
-            
-            const pythonProcess = spawn(this.pythonPath, args, {
-                env: {
-                    ...process.env,
-                    PYTHONUNBUFFERED: '1' // This ensures Python output is not buffered
-                }
-            });
-            
-            let result = '';
-            let error = '';
-
-            pythonProcess.stdout.on('data', (data) => {
-                const output = data.toString();
-                console.log('Python stdout:', output);
-                result += output;
-            });
+        const payload = isDemo || !productId ? { demo: true } : { product_id: productId };
+        console.log('Running stock optimization with payload:', payload);
 
-            pythonProcess.stderr.on('data', (data) => {
-                const errorOutput = data.toString();
-                console.error('Python stderr:', errorOutput);
-                error += errorOutput;
-            });
-
-            pythonProcess.on('error', (err) => {
-                console.error('Failed to start Python process:', err);
-                reject(new Error(`Failed to start Python process: ${err.message}\nPython path: ${this.pythonPath}\nScript path: ${scriptPath}`));
-            });
+        try {
+            const result = await this.worker.request<StockOptimizationResult | StockOptimizationError>('optimize', payload);
+            if (!result) {
+                throw new Error('No output received from Python worker');
+            }
+            return result;
+        } catch (error: unknown) {
+            const errorMessage = error instanceof Error ? error.message : 'Unknown error occurred';
+            console.error('Stock optimization failed:', errorMessage);
+            throw new Error(`Stock optimization failed: ${errorMessage}`);
+        }
+    }
 
-            pythonProcess.on('close', (code) => {
-                console.log('Python process exited with code:', code);
-                if (code !== 0) {
-                    const errorMessage = `Python process exited with code ${code}:\nError output: ${error}\nPython path: ${this.pythonPath}\nScript path: ${scriptPath}`;
-                    console.error(errorMessage);
-                    reject(new Error(errorMessage));
-                    return;
-                }
+    // Pattern stats kept per product in the worker; a new sale only updates them instead of recomputing history
+    public async updateSalesPatterns(
+        productId: string,
+        sale?: { date: string | Date; quantity: number }
+    ): Promise<SalesPatternAnalysis | StockOptimizationError> {
+        try {
+            return await this.worker.request('patterns', { product_id: productId, sale }, undefined, productId);
+        } catch (error: unknown) {
+            const errorMessage = error instanceof Error ? error.message : 'Unknown error occurred';
+            console.error('Sales pattern update failed:', errorMessage);
+            throw new Error(`Sales pattern update failed: ${errorMessage}`);
+        }
+    }
 
-                try {
-                    if (!result) {
-                        reject(new Error('No output received from Python script'));
-                        return;
-                    }
+    // Safety stock, reorder point and EOQ for many products in one vectorized call
+    public async computeInventoryPolicies(request: InventoryPolicyRequest): Promise<InventoryPolicyTable | StockOptimizationError> {
+        try {
+            return await this.worker.request('inventory_policy', request);
+        } catch (error: unknown) {
+            const errorMessage = error instanceof Error ? error.message : 'Unknown error occurred';
+            console.error('Inventory policy computation failed:', errorMessage);
+            throw new Error(`Inventory policy computation failed: ${errorMessage}`);
+        }
+    }
 
-                    const parsedResult = JSON.parse(result);
-                    if ('error' in parsedResult) {
-                        resolve(parsedResult as StockOptimizationError);
-                    } else {
-                        resolve(parsedResult as StockOptimizationResult);
-                    }
-                } catch (error: unknown) {
-                    const errorMessage = error instanceof Error ? error.message : 'Unknown error occurred';
-                    console.error('Failed to parse Python output:', errorMessage);
-                    console.error('Raw Python output:', result);
-                    reject(new Error(`Failed to parse Python output: ${errorMessage}\nRaw output: ${result}`));
-                }
-            });
-        });
+    // Monte Carlo fill rate, stockout days and holding cost of the analytic policies, per product
+    public async simulatePolicies(request: PolicySimulationRequest): Promise<PolicySimulationResult[] | StockOptimizationError> {
+        try {
+            return await this.worker.request('simulate_policy', request);
+        } catch (error: unknown) {
+            const errorMessage = error instanceof Error ? error.message : 'Unknown error occurred';
+            console.error('Policy simulation failed:', errorMessage);
+            throw new Error(`Policy simulation failed: ${errorMessage}`);
+        }
     }
 } 
\ No newline at end of file
@@ -1,6 +1,17 @@
 export interface StockOptimizationForecast {
     date: string;
     forecasted_quantity: number;
+    lower_bound?: number;
+    upper_bound?: number;
+}
+
+// Which forecast path ran: a bounded ARIMA fit or the moving-average fallback
+export interface ForecastModelInfo {
+    method: 'arima' | 'moving_average';
+    order?: [number, number, number];
+    source?: 'cached' | 'warm' | 'searched';
+    reason?: string;
+    elapsed_ms: number;
 }
 
 export interface OptimalLevels {
@@ -11,9 +22,109 @@ export interface OptimalLevels {
     std_demand: number;
 }
 
+export interface SalesPatternAnalysis {
+    basic_stats: {
+        total_sales: number;
+        mean_daily_sales: number;
+        median_daily_sales: number;
+        std_daily_sales: number;
+        min_daily_sales: number;
+        max_daily_sales: number;
+        sales_range: number;
+    };
+    trend_analysis: {
+        trend_direction: string;
+        trend_strength: number;
+    };
+    seasonality: {
+        daily_patterns: Record<string, number>;
+        monthly_patterns: Record<string, number>;
+    };
+    volatility: {
+        coefficient_of_variation: number;
+        volatility_level: string;
+    };
+    growth: {
+        growth_rate: number;
+        growth_status: string;
+    };
+    peak_analysis: {
+        peak_dates: string[];
+        peak_values: number[];
+    };
+    low_analysis: {
+        low_dates: string[];
+        low_values: number[];
+    };
+}
+
 export interface StockOptimizationResult {
     forecast: StockOptimizationForecast[];
     optimal_levels: OptimalLevels;
+    model?: ForecastModelInfo;
+    pattern_analysis?: SalesPatternAnalysis;
+}
+
+export interface InventoryPolicyParameters {
+    lead_time?: number;
+    service_level?: number;
+    ordering_cost?: number;
+    holding_cost?: number;
+    lead_time_std?: number;
+}
+
+export interface InventoryPolicyRequest extends InventoryPolicyParameters {
+    product_ids?: string[] | 'all';
+    history_days?: number;
+    // Per-product lead time overrides in days
+    lead_times?: Record<string, number>;
+    // What-if grid: every combination of these values is evaluated
+    sweep?: { [K in keyof InventoryPolicyParameters]?: number[] };
+}
+
+// Columnar replenishment table, one entry per product; with a sweep the
+// policy metrics are scenarios x products
+export interface InventoryPolicyTable {
+    product_id: string[];
+    mean_demand: number[];
+    std_demand: number[];
+    z_score?: number[];
+    safety_stock: number[] | number[][];
+    reorder_point: number[] | number[][];
+    economic_order_quantity: number[] | number[][];
+    annual_cost: number[] | number[][];
+    scenarios?: InventoryPolicyParameters[];
+}
+
+export interface PolicySimulationRequest extends InventoryPolicyParameters {
+    product_ids?: string[] | 'all';
+    n_paths?: number;
+    horizon?: number;
+    model?: 'arima' | 'prophet';
+    service_levels?: number[];
+    target_fill_rate?: number;
+    seed?: number;
+}
+
+// Monte Carlo results for one product; policies are parallel lists, one entry per service level
+export interface PolicySimulationResult {
+    product_id: string;
+    error?: string;
+    demand_model?: 'arima' | 'prophet' | 'mean';
+    paths?: number;
+    horizon?: number;
+    policies?: {
+        service_level: number[];
+        reorder_point: number[];
+        order_quantity: number[];
+        fill_rate: number[];
+        fill_rate_p5: number[];
+        stockout_days: number[];
+        holding_cost: number[];
+        orders: number[];
+    };
+    // Index of the cheapest policy meeting the target fill rate
+    recommended?: number;
 }
 
 export interface StockOptimizationError {